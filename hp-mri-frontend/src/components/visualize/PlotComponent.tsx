@@ -11,10 +11,10 @@ import Plot from "react-plotly.js";
 import { Box } from "@mui/material";
 
 interface PlotProps {
-    xValues: number[];
-    data: number[];
+    xValues: ArrayLike<number>;
+    data: ArrayLike<number>;
     columns: number;
-    spectralData: (string | any[])[][];
+    points: number; // Spectral points per voxel
     rows: number;
     longitudinalScale: number;
     perpendicularScale: number;
@@ -32,7 +32,7 @@ const PlotComponent: React.FC<PlotProps> = ({
     xValues,
     data,
     columns,
-    spectralData,
+    points,
     rows,
     longitudinalScale,
     perpendicularScale,
@@ -56,12 +56,12 @@ const PlotComponent: React.FC<PlotProps> = ({
         rows
     );
 
-    const processedData = data.map((value) => (value < 0.01 || value > 9.99 ? null : value));
+    const processedData = Array.from(data, (value) => (value < 0.01 || value > 9.99 ? null : value));
 
     const gridData = prepareGridData(domain, columns, rows);
     const plotData = showHpMriData ? [...gridData, createLineData(xValues, processedData)] : gridData;
 
-    const layout = configureLayout(domain, columns, spectralData, rows, windowSize, gridData);
+    const layout = configureLayout(domain, columns, points, rows, windowSize, gridData);
 
     useEffect(() => {
         if (onRendered) {
@@ -154,7 +154,7 @@ function prepareGridData(domain: { x: number[]; y: number[] }, columns: number,
     return gridData;
 }
 
-function createLineData(xValues: number[], processedData: (number | null)[]) {
+function createLineData(xValues: ArrayLike<number>, processedData: (number | null)[]) {
     return {
         x: xValues,
         y: processedData,
@@ -170,7 +170,7 @@ function createLineData(xValues: number[], processedData: (number | null)[]) {
 function configureLayout(
     domain: { x: number[]; y: number[] },
     columns: number,
-    spectralData: (string | any[])[][],
+    points: number,
     rows: number,
     windowSize: { width: number; height: number },
     gridData: any[]
@@ -182,7 +182,7 @@ function configureLayout(
         showlegend: false,
         xaxis: {
             domain: domain.x,
-            range: [0, spectralData.length > 0 ? columns * spectralData[0][0].length : 10],
+            range: [0, points > 0 ? columns * points : 10],
             showgrid: false,
             zeroline: false,
             showline: false,
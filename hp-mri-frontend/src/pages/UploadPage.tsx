@@ -64,8 +64,27 @@ const UploadPage: React.FC = () => {
           'Content-Type': 'multipart/form-data',
         },
       })
-      .then(() => {
-        setSuccessMessage('Files uploaded successfully!');
+      .then((response) => pollUploadJob(response.data.jobId))
+      .catch((err) => {
+        console.error(err);
+        setSuccessMessage(null);
+      });
+  };
+
+  // Files keep uploading to storage after the request returns; poll the job until it finishes
+  const pollUploadJob = (jobId: string) => {
+    axios
+      .get(`http://127.0.0.1:5000/api/upload/${jobId}`)
+      .then((response) => {
+        const { status } = response.data;
+        if (status === 'receiving' || status === 'uploading') {
+          setTimeout(() => pollUploadJob(jobId), 1000);
+        } else if (status === 'completed') {
+          setSuccessMessage('Files uploaded successfully!');
+        } else {
+          console.error('Upload failed', response.data);
+          setSuccessMessage(null);
+        }
       })
       .catch((err) => {
         console.error(err);
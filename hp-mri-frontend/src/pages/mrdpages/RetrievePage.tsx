@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import Sidebar from '../../components/Sidebar';
 import HeaderAccount from '../../components/HeaderAccount';
@@ -22,6 +22,10 @@ import {
 import { ArrowUpward, ArrowDownward, CloudDownload, Delete, UploadFile, Refresh } from '@mui/icons-material';
 import axios from 'axios';
 
+const PAGE_SIZE = 50;
+// Typing settles for this long before the search is sent
+const SEARCH_DEBOUNCE_MS = 300;
+
 interface MRDFile {
   id: number;
   name: string;
@@ -33,6 +37,7 @@ interface MRDFile {
 
 const RetrievePage: React.FC = () => {
   const [search, setSearch] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
   const [files, setFiles] = useState<MRDFile[]>([]);
   const [isSidebarOpen, setIsSidebarOpen] = useState(true);
   const [sortConfig, setSortConfig] = useState<{ key: keyof MRDFile; direction: 'asc' | 'desc' }>({
@@ -41,37 +46,52 @@ const RetrievePage: React.FC = () => {
   });
   const navigate = useNavigate();
 
-  const fetchFiles = () => {
+  const [totalCount, setTotalCount] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const requestController = useRef<AbortController | null>(null);
+
+  // Search, sorting and pagination run on the server; a cursor appends the next page.
+  // A new request aborts the previous one, so a slow stale response never replaces newer results
+  const fetchFiles = (cursor: string | null = null) => {
+    requestController.current?.abort();
+    const controller = new AbortController();
+    requestController.current = controller;
     axios
-      .get('http://127.0.0.1:5000/api/mrd-files')
-      .then((response) => setFiles(response.data))
-      .catch((error) => console.error('Error fetching MRD files:', error));
+      .get('http://127.0.0.1:5000/api/mrd-files', {
+        signal: controller.signal,
+        params: {
+          q: debouncedSearch || undefined,
+          sort: sortConfig.key,
+          order: sortConfig.direction,
+          limit: PAGE_SIZE,
+          cursor: cursor || undefined,
+        },
+      })
+      .then((response) => {
+        if (controller.signal.aborted) return;
+        setFiles((prevFiles) => (cursor ? [...prevFiles, ...response.data.items] : response.data.items));
+        setTotalCount(response.data.totalCount);
+        setNextCursor(response.data.nextCursor);
+      })
+      .catch((error) => {
+        if (!axios.isCancel(error)) console.error('Error fetching MRD files:', error);
+      });
   };
 
   useEffect(() => {
-    fetchFiles();
     document.title = "MRD Files - HP"; // Dynamically updates the tab title
   }, []);
 
-  const filteredFiles = files.filter(
-    (file) =>
-      file.name.toLowerCase().includes(search.toLowerCase()) ||
-      file.date.toLowerCase().includes(search.toLowerCase()) ||
-      file.owner.toLowerCase().includes(search.toLowerCase())
-  );
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(search), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [search]);
 
-  const sortedFiles = filteredFiles.sort((a, b) => {
-    const key = sortConfig.key;
-    const aValue = key === 'date' ? new Date(a[key]) : a[key];
-    const bValue = key === 'date' ? new Date(b[key]) : b[key];
-    return aValue < bValue
-      ? sortConfig.direction === 'asc'
-        ? -1
-        : 1
-      : sortConfig.direction === 'asc'
-        ? 1
-        : -1;
-  });
+  useEffect(() => {
+    fetchFiles();
+  }, [debouncedSearch, sortConfig]);
+
+  useEffect(() => () => requestController.current?.abort(), []);
 
   const handleSort = (key: keyof MRDFile) => {
     setSortConfig((prevState) => ({
@@ -156,7 +176,7 @@ const RetrievePage: React.FC = () => {
                 <Button
                   variant="outlined"
                   startIcon={<Refresh />}
-                  onClick={fetchFiles}
+                  onClick={() => fetchFiles()}
                   sx={{
                     flex: '1 1 24%',
                     marginTop: '-8px'
@@ -230,7 +250,7 @@ const RetrievePage: React.FC = () => {
               </TableRow>
             </TableHead>
             <TableBody>
-              {sortedFiles.map((file) => (
+              {files.map((file) => (
                 <TableRow
                   key={file.id}
                   sx={{
@@ -267,6 +287,16 @@ const RetrievePage: React.FC = () => {
             </TableBody>
           </Table>
         </TableContainer>
+        <Grid container alignItems="center" justifyContent="space-between" sx={{ marginY: 2 }}>
+          <Typography variant="body2">
+            Showing {files.length} of {totalCount} files
+          </Typography>
+          {nextCursor && (
+            <Button variant="outlined" onClick={() => fetchFiles(nextCursor)}>
+              Load more
+            </Button>
+          )}
+        </Grid>
       </Container>
     </div>
   );
@@ -18,14 +18,17 @@ import { Link } from 'react-router-dom';
 import ImagingPlotComponent from '../../components/visualize/ImagingPlotComponent';
 import PlotShiftPanel from '../../components/visualize/PlotShiftPanel';
 import html2canvas from 'html2canvas';
+import { Alert, Snackbar } from '@mui/material';
+import { decodeHpMriData, HpMriData } from './utils/decodeHpMriData';
 
 const VisualizationPage: React.FC = () => {
   const [imageUrl, setImageUrl] = useState('');
   const [numSliderValues, setNumSliderValues] = useState(0);
   const [numDatasets, setNumDatasets] = useState(0);
   const [magnetType, setMagnetType] = useState('HUPC'); // Default magnet type 
-  const [hpMriData, setHpMriData] = useState({
-    xValues: [], data: [], columns: 0, spectralData: [], rows: 0,
+  const [hpMriError, setHpMriError] = useState<string | null>(null);
+  const [hpMriData, setHpMriData] = useState<HpMriData>({
+    xValues: [], data: [], columns: 0, spectralData: [], points: 0, rows: 0,
     longitudinalScale: 0, perpendicularScale: 0, longitudinalMeasurement: 0, perpendicularMeasurement: 0, plotShift: [0, 0]
   });
   const [offsetX, setOffsetX] = useState(0);
@@ -225,13 +228,27 @@ const VisualizationPage: React.FC = () => {
 
   // Fetches and updates the HP MRI data plot based on slider input.
   const sendDatasetToBackend = (newDatasetIndex: React.SetStateAction<number>) => {
-    const url = `http://127.0.0.1:5000/visualize-api/get_hp_mri_data/${newDatasetIndex}?threshold=${threshold}&magnetType=${magnetType}`;
+    const url = `http://127.0.0.1:5000/visualize-api/get_hp_mri_data/${newDatasetIndex}?threshold=${threshold}&magnetType=${magnetType}&format=binary`;
     fetch(url, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-    }).then(response => response.json())
-      .then(data => setHpMriData(data))
-      .catch(error => console.error('Error fetching HP MRI data:', error));
+    }).then(async response => {
+      // Errors come back as JSON even though the binary format was requested
+      const contentType = response.headers.get('Content-Type') ?? '';
+      if (response.ok && contentType.startsWith('application/octet-stream')) {
+        return response.arrayBuffer();
+      }
+      const body = await response.json().catch(() => null);
+      throw new Error(body?.error ?? `HP MRI data request failed (${response.status})`);
+    })
+      .then(buffer => {
+        setHpMriData(decodeHpMriData(buffer));
+        setHpMriError(null);
+      })
+      .catch(error => {
+        console.error('Error fetching HP MRI data:', error);
+        setHpMriError(error.message);
+      });
   };
   const fetchImagingMetadata = () => {
     fetch("http://127.0.0.1:5000/visualize-api/get_imaging_metadata")
@@ -335,7 +352,7 @@ const VisualizationPage: React.FC = () => {
                   xValues={hpMriData.xValues}
                   data={hpMriData.data}
                   columns={hpMriData.columns}
-                  spectralData={hpMriData.spectralData}
+                  points={hpMriData.points}
                   rows={hpMriData.rows}
                   longitudinalScale={hpMriData.longitudinalScale}
                   perpendicularScale={hpMriData.perpendicularScale}
@@ -395,6 +412,19 @@ const VisualizationPage: React.FC = () => {
 
         </div>
 
+        {hpMriError && (
+          <Snackbar
+            open
+            autoHideDuration={6000}
+            onClose={() => setHpMriError(null)}
+            anchorOrigin={{ vertical: 'top', horizontal: 'center' }}
+          >
+            <Alert onClose={() => setHpMriError(null)} severity="error" sx={{ width: '100%' }}>
+              {hpMriError}
+            </Alert>
+          </Snackbar>
+        )}
+
         <footer>
           <Link to="/visualize-about">About</Link> • 2024 University of Pennsylvania The MEDCAP
         </footer>
@@ -0,0 +1,70 @@
+// src/pages/visualization/utils/decodeHpMriData.ts
+// Decodes the binary /get_hp_mri_data payload (see server/visualize/transport.py):
+// a uint32 header length, a JSON header, then little-endian float32 buffers.
+
+export type HpMriData = {
+    xValues: ArrayLike<number>;
+    data: ArrayLike<number>;
+    columns: number;
+    // rows x columns of per-voxel spectra, each points x pictures values long
+    spectralData: ArrayLike<ArrayLike<ArrayLike<unknown>>>;
+    // Spectral points per voxel, the x extent of one grid cell
+    points: number;
+    rows: number;
+    longitudinalScale: number;
+    perpendicularScale: number;
+    longitudinalMeasurement: number;
+    perpendicularMeasurement: number;
+    plotShift: number[];
+};
+
+type ArrayDescriptor = {
+    name: string;
+    shape: number[];
+    offset: number;
+};
+
+export function decodeFloat32Payload(buffer: ArrayBuffer) {
+    const headerLength = new DataView(buffer).getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const base = 4 + headerLength;
+
+    const arrays: Record<string, { values: Float32Array; shape: number[] }> = {};
+    for (const { name, shape, offset } of header.arrays as ArrayDescriptor[]) {
+        const length = shape.reduce((product, size) => product * size, 1);
+        // Zero-copy view; offsets are 4-byte aligned by the server
+        arrays[name] = { values: new Float32Array(buffer, base + offset, length), shape };
+    }
+    return { header, arrays };
+}
+
+export function decodeHpMriData(buffer: ArrayBuffer): HpMriData {
+    const { header, arrays } = decodeFloat32Payload(buffer);
+    const { values, shape } = arrays.spectralData;
+
+    // Split the flat spectral cube into per-voxel views without copying
+    const voxelLength = shape.slice(2).reduce((product, size) => product * size, 1);
+    const spectralData: Float32Array[][] = [];
+    for (let row = 0; row < shape[0]; row++) {
+        const rowViews: Float32Array[] = [];
+        for (let column = 0; column < shape[1]; column++) {
+            const start = (row * shape[1] + column) * voxelLength;
+            rowViews.push(values.subarray(start, start + voxelLength));
+        }
+        spectralData.push(rowViews);
+    }
+
+    return {
+        xValues: arrays.xValues.values,
+        data: arrays.data.values,
+        columns: header.columns,
+        spectralData,
+        points: shape[2] ?? 0,
+        rows: header.rows,
+        longitudinalScale: header.longitudinalScale,
+        perpendicularScale: header.perpendicularScale,
+        longitudinalMeasurement: header.longitudinalMeasurement,
+        perpendicularMeasurement: header.perpendicularMeasurement,
+        plotShift: header.plotShift,
+    };
+}
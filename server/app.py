@@ -16,4 +16,5 @@ app.register_blueprint(visualization_bp, url_prefix="/visualize-api")
 
 # Start the server
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # Requests are served concurrently; the processing modules keep no per-request state
+    app.run(debug=True, port=5000, threaded=True)
@@ -1,35 +1,109 @@
+"""
+Module: lambda_function.py
+
+Description:
+This module is the S3-triggered Lambda function that indexes MRD objects as they
+are written to the bucket: each object body is parsed as it streams in and its
+index is stored next to it (see mrds/read_mrdfile.py).
+
+Packaging:
+The indexer is shared with the server, so the deployment package holds, at its
+root, the aws_lambda and mrds packages of this folder and mrd-python (with numpy
+and Pillow); boto3 comes with the Lambda runtime. Only mrds/__init__.py and
+mrds/read_mrdfile.py are imported: the mrds package imports nothing else, so
+Flask and the rest of the server stay out of the package. The handler is
+aws_lambda.lambda_function.handler.
+
+    cd server
+    pip install --target build/lambda mrd-python==2.0.1
+    mkdir -p build/lambda/mrds
+    cp -r aws_lambda build/lambda/
+    cp mrds/__init__.py mrds/read_mrdfile.py build/lambda/mrds/
+    (cd build/lambda && zip -r ../lambda.zip .)
+
+benchmarks/lambda_ingest.py checks that importing the handler loads no other
+server module.
+"""
+
 # read mrd file to view or reconstruct
 import boto3
-import os
-from mapvbvd import mapVBVD
-import mrd
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+from mrds.read_mrdfile import INDEX_SUFFIX, index_mrd_stream
+
+# records of one batch event processed at the same time
+MAX_WORKERS = 8
+# S3 client reused by the invocations of a warm container; created on first use
+S3_CLIENT = None
+
+
+def s3_client():
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = boto3.client("s3")
+    return S3_CLIENT
+
+
+def event_objects(event):
+    # S3 notifications carry a list of records; direct invocations pass bucket and key
+    if "Records" in event:
+        return [
+            (
+                record["s3"]["bucket"]["name"],
+                unquote_plus(record["s3"]["object"]["key"]),
+            )
+            for record in event["Records"]
+        ]
+    return [(event["bucket"], event["key"])]
+
+
+def process_object(s3, bucket, key):
+    try:
+        # parse the object body as it streams in; nothing is written to /tmp
+        response = s3.get_object(Bucket=bucket, Key=key)
+        body = response["Body"]
+        try:
+            # header metadata and the stream item index in one pass
+            index = index_mrd_stream(body)
+        finally:
+            body.close()
+        # store the index next to the object so readers can seek to single images
+        s3.put_object(Bucket=bucket, Key=key + INDEX_SUFFIX, Body=json.dumps(index))
+    except Exception as e:
+        return {"key": key, "error": str(e)}
+
+    header = index["header"]
+    return {
+        "key": key,
+        "measurement_id": header["measurementId"],
+        "study_date": header["studyDate"],
+        "scanner_type": header["scannerType"],
+        "size": index["size"],
+        "acquisitions_count": index["acquisitionsCount"],
+        "recon_images_count": index["reconImagesCount"],
+        "index_key": key + INDEX_SUFFIX,
+    }
+
 
 def handler(event, context):
-    s3 = boto3.client('s3')
+    s3 = s3_client()
 
-    bucket = event["bucket"]
-    key = event["key"]
-    response = s3.get_object(Bucket=bucket, Key=key)
-    
     try:
-        local_filename = '/tmp/' + key
-        s3.download_file(bucket, key, local_filename)
-        with mrd.BinaryMrdReader(local_filename) as r:
-            h = r.read_header()
-            measurement_id = h.measurement_information.measurement_id    # primary key on DynamoDB
-            study_date = h.study_information.study_date
-            vendor = h.acquisition_system_information.system_vendor
-            model = h.acquisition_system_information.system_model
-            field_strength = h.acquisition_system_information.system_field_strength_t
-            scanner_type = vendor+'-'+model+'-'+str(field_strength)+'T'
-            data_stream = r.read_data()
-            for item in data_stream:
-                pass
-        # remove local files
-        os.remove(local_filename)
+        objects = event_objects(event)
+    except (KeyError, TypeError) as e:
+        return {"error": f"Unsupported event: missing {e}"}
+    # index files written by this function must not be indexed again
+    objects = [
+        (bucket, key) for bucket, key in objects if not key.endswith(INDEX_SUFFIX)
+    ]
 
-    except Exception as e:
-        return {"error": str(e)}
-        
-    return {local_filename: os.path.isfile(local_filename),
-            'scanner_type': scanner_type}
\ No newline at end of file
+    if "Records" not in event:
+        return (
+            process_object(s3, *objects[0])
+            if objects
+            else {"error": "Skipped index file"}
+        )
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(objects)))) as pool:
+        results = list(pool.map(lambda obj: process_object(s3, *obj), objects))
+    return {"results": results}
@@ -0,0 +1,122 @@
+"""
+Module: animations.py
+
+Description:
+Benchmarks the animation export of visualize/animations.py on a synthetic imaging matrix. The
+baseline renders every frame of the time series into a list and encodes the list at the
+end with Image.save(save_all=True), as a screenshot-then-encode exporter does; the export
+streams each frame to the encoder as it is made. Reports the time and the growth of the
+peak resident memory of a fresh process while encoding, for GIF with and without a
+proton underlay, and for MP4.
+
+Usage:
+    cd server
+    python -m benchmarks.animations [--images 300] [--width 512]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import multiprocessing
+import resource
+
+import numpy as np
+from PIL import Image
+
+from visualize import animations, composites, imaging
+
+
+def peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_case(case, path, images, size):
+    """
+    Encodes one case; runs in a fresh process so its peak memory is its own.
+
+    Returns:
+        tuple: (frames, seconds, growth of the peak resident memory in bytes).
+    """
+    data = imaging.open_imaging_matrix(path)
+    method, with_underlay = case
+    underlay = None
+    if with_underlay:
+        underlay = np.random.default_rng(0).integers(0, 255, size[::-1], np.uint8)
+    frames = animations.animation_frames(data, 1, size, "Hot", 0.6, underlay)
+    output = os.path.join(os.path.dirname(path), f"{method}.out")
+    baseline = peak_rss()
+    start = time.perf_counter()
+    if method == "buffered":
+        count = buffered_gif(output + ".gif", frames, 10, "Hot")
+    elif method == "gif":
+        count = animations.write_gif(output + ".gif", frames, 10)
+    else:
+        count = animations.write_mp4(output + ".mp4", frames, 10, size)
+    return count, time.perf_counter() - start, peak_rss() - baseline
+
+
+def buffered_gif(path, frames, fps, color_scale):
+    """
+    Baseline: every frame is kept until the whole animation is encoded.
+    """
+    lut = composites.colormap_lut(color_scale)
+    images = [
+        Image.fromarray(lut[frame] if frame.ndim == 2 else frame) for frame in frames
+    ]
+    images[0].save(
+        path,
+        save_all=True,
+        append_images=images[1:],
+        duration=int(round(1000 / fps)),
+        loop=0,
+    )
+    return len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--images", type=int, default=300)
+    parser.add_argument("--width", type=int, default=512)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "imaging.npy")
+        np.save(path, rng.random((12, 16, 2, args.images)))
+        data = imaging.open_imaging_matrix(path)
+        size = animations.animation_size(data.shape, (args.width, args.width * 3 / 4))
+        context = multiprocessing.get_context("spawn")
+
+        def measure(method, with_underlay):
+            with context.Pool(1) as pool:
+                return pool.apply(
+                    run_case, ((method, with_underlay), path, args.images, size)
+                )
+
+        results = {}
+        for with_underlay in (False, True):
+            label = "gif + underlay" if with_underlay else "gif"
+            results[label] = (
+                measure("buffered", with_underlay),
+                measure("gif", with_underlay),
+            )
+        results["mp4 + underlay"] = (None, measure("mp4", True))
+
+    print(f"{args.images} frames of {size[0]}x{size[1]}")
+    for label, (buffered, streamed) in results.items():
+        line = (
+            f"{label:15}: streamed {streamed[1]:6.2f} s, "
+            f"peak +{streamed[2] / 2**20:6.1f} MiB"
+        )
+        if buffered is not None:
+            line += (
+                f" | buffered {buffered[1]:6.2f} s, peak +{buffered[2] / 2**20:6.1f} MiB"
+                f" | {buffered[1] / streamed[1]:5.1f}x faster"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
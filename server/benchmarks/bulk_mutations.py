@@ -0,0 +1,82 @@
+"""
+Module: bulk_mutations.py
+
+Description:
+Benchmarks deleting and tagging 10k MRD file records. The baselines are the original
+patterns: deleting with a list-membership filter over the record list (O(N*M)) and tagging
+with one POST /edit-tags request per file. They are compared with one atomic request to
+the bulk-delete and bulk-tag endpoints, which resolve the ids as sets inside SQLite.
+
+Usage:
+    cd server
+    python -m benchmarks.bulk_mutations [--records 50000] [--targets 10000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+
+from benchmarks.metadata_store import make_records
+from mrds import routes
+from mrds.repository import MetadataStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--targets", type=int, default=10000)
+    args = parser.parse_args()
+    mrd_files, _ = make_records(args.records)
+    target_ids = random.Random(1).sample(range(1, args.records + 1), args.targets)
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp, url_prefix="/api")
+    client = app.test_client()
+    tags = {"parameter": "cleanup", "raw": "bulk tagged"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        routes.STORE = MetadataStore(os.path.join(tmp, "metadata.sqlite3"))
+        routes.STORE.seed(mrd_files)
+
+        start = time.perf_counter()
+        for file_id in target_ids:
+            response = client.post(
+                f"/api/mrd-files/{file_id}/edit-tags", json={"tags": tags}
+            )
+            assert response.status_code == 200
+        sequential_tag = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post(
+            "/api/mrd-files/bulk-tag", json={"ids": target_ids, "tags": tags}
+        )
+        bulk_tag = time.perf_counter() - start
+        assert response.get_json()["updated"] == args.targets
+        assert routes.STORE.mrd_files.get(target_ids[0])["parameter"] == "cleanup"
+
+        start = time.perf_counter()
+        remaining = [file for file in mrd_files if file["id"] not in target_ids]
+        list_delete = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post("/api/mrd-files/bulk-delete", json={"ids": target_ids})
+        bulk_delete = time.perf_counter() - start
+        assert response.get_json()["deleted"] == args.targets
+        assert routes.STORE.mrd_files.count() == len(remaining)
+
+    print(f"{args.targets} of {args.records} records")
+    print(
+        f"tag   : {args.targets} requests {sequential_tag:7.2f} s | "
+        f"bulk {bulk_tag:6.3f} s | {sequential_tag / bulk_tag:6.1f}x"
+    )
+    print(
+        f"delete: list filter {list_delete:7.2f} s | "
+        f"bulk {bulk_delete:6.3f} s | {list_delete / bulk_delete:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
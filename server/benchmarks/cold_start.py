@@ -0,0 +1,106 @@
+"""
+Module: cold_start.py
+
+Description:
+Benchmarks the cold start of the server, of a reconstruction job worker and of the Lambda
+function, each measured in fresh interpreters. The baseline imports up front everything the
+server imported at startup before the magnet registry (visualize/magnets/registry.py):
+OpenCV, pydicom, SciPy's FFT, Pillow, matplotlib and scipy.io, and the magnet modules with
+the image stack; for the worker, what hupc_processing imported at the top. Reports the median
+import time and the number of loaded modules, and the cost of creating the Lambda's S3
+client, which warm invocations now reuse.
+
+Usage:
+    cd server
+    python -m benchmarks.cold_start [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+EAGER_IMPORTS = (
+    "import cv2, pydicom, scipy.fft, scipy.io, matplotlib, PIL.Image; "
+    "matplotlib.use('Agg'); import matplotlib.pyplot; "
+    "import visualize.magnets.hupc_processing, visualize.magnets.mr_solutions_processing, "
+    "visualize.composites, visualize.animations, visualize.proton_images; "
+)
+# What the reconstruction workers imported with hupc_processing
+WORKER_EAGER_IMPORTS = "import scipy.fft, visualize.composites, visualize.contrast, visualize.proton_images; "
+RECONSTRUCTION = "visualize.magnets.hupc_processing:reconstruct_epsi"
+CASES = {
+    "server": ("import app", EAGER_IMPORTS + "import app"),
+    "job worker": (
+        f"from visualize import jobs; jobs.resolve({RECONSTRUCTION!r})",
+        WORKER_EAGER_IMPORTS
+        + f"from visualize import jobs; jobs.resolve({RECONSTRUCTION!r})",
+    ),
+    "lambda": ("import aws_lambda.lambda_function", None),
+}
+
+
+def cold_start(statement, repeat):
+    """
+    Runs a statement in fresh interpreters.
+
+    Returns:
+        tuple: (median seconds, number of modules loaded).
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - start, len(sys.modules))"
+    )
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout.split()
+        samples.append((float(output[0]), int(output[1])))
+    return statistics.median(seconds for seconds, _ in samples), samples[0][1]
+
+
+def s3_client_seconds():
+    """
+    Returns the seconds to create the first S3 client of a process and to
+    create another one, which every invocation used to pay.
+    """
+    import boto3
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        boto3.client("s3")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, (lazy, eager) in CASES.items():
+        seconds, modules = cold_start(lazy, args.repeat)
+        line = f"{label:10}: {seconds * 1e3:6.0f} ms, {modules:4d} modules"
+        if eager is not None:
+            eager_seconds, eager_modules = cold_start(eager, args.repeat)
+            line += (
+                f" | eager {eager_seconds * 1e3:6.0f} ms, {eager_modules:4d} modules"
+                f" | {eager_seconds / seconds:4.1f}x faster"
+            )
+        print(line)
+    first, again = s3_client_seconds()
+    print(
+        f"S3 client: first {first * 1e3:.0f} ms, each later one {again * 1e3:.0f} ms "
+        "(saved on every warm Lambda invocation)"
+    )
+
+
+if __name__ == "__main__":
+    main()
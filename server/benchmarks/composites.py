@@ -0,0 +1,190 @@
+"""
+Module: composites.py
+
+Description:
+Benchmarks the server-side overlay composites of visualize/composites.py on a synthetic study.
+The baseline draws each frame voxel by voxel (one rectangle per heatmap voxel, one line
+per grid line and one polyline per voxel spectrum), as a direct port of the browser's plot
+would; it is compared with the whole-array drawing of composites.composite. Then a whole
+study is exported through POST /exports/composites, rendered in the job worker, and by
+calling the export task outside the job runner, across a pool of render processes; both
+archives are checked to be identical.
+
+Usage:
+    cd server
+    python -m benchmarks.composites [--slices 24] [--datasets 8] [--workers 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+from benchmarks.dicom_series import write_series
+from benchmarks.job_queue import configure_hupc
+from benchmarks.spectral_data import write_dataset
+from flask import Flask
+from visualize import composites, imaging, jobs, visualization
+from visualize.magnets import hupc_processing
+
+
+def configure_study(folder, workers):
+    """
+    Points the modules at the synthetic study; also runs in every job worker.
+    """
+    configure_hupc(folder)
+    hupc_processing.DICOM_FOLDER = os.path.join(folder, "proton")
+    imaging.IMAGING_DATA_PATH = os.path.join(folder, "imaging.npy")
+    composites.EXPORT_DIR = os.path.join(folder, f"exports_{workers}")
+    composites.EXPORT_WORKERS = workers
+
+
+def composite_loops(proton, metadata, x_values, trace, points, heatmap):
+    """
+    Baseline: the same overlay drawn one voxel, grid line and spectrum at a time.
+    """
+    image = np.repeat(proton[:, :, np.newaxis], 3, axis=2)
+    left, top, right, bottom = composites.overlay_box(
+        metadata, image.shape[1], image.shape[0]
+    )
+    rows, columns = metadata["rows"], metadata["columns"]
+    cell_width, cell_height = (right - left) / columns, (bottom - top) / rows
+    lut = composites.colormap_lut("Hot")
+    overlay = image.copy()
+    for row in range(rows):
+        for column in range(columns):
+            color = lut[int(round(np.clip(heatmap[row, column], 0, 1) * 255))]
+            cv2.rectangle(
+                overlay,
+                (int(left + column * cell_width), int(top + row * cell_height)),
+                (
+                    int(left + (column + 1) * cell_width) - 1,
+                    int(top + (row + 1) * cell_height) - 1,
+                ),
+                tuple(int(channel) for channel in color),
+                -1,
+            )
+    image = cv2.addWeighted(image, 0.5, overlay, 0.5, 0)
+    grid = image.copy()
+    for column in range(columns + 1):
+        x = int(round(left + column * cell_width))
+        cv2.line(grid, (x, int(top)), (x, int(bottom)), (255, 255, 255), 1)
+    for row in range(rows + 1):
+        y = int(round(top + row * cell_height))
+        cv2.line(grid, (int(left), y), (int(right), y), (255, 255, 255), 1)
+    image = cv2.addWeighted(image, 0.5, grid, 0.5, 0)
+    for voxel in range(rows * columns):
+        span = slice(voxel * points, (voxel + 1) * points)
+        x = left + x_values[span] / (columns * points) * (right - left)
+        y = bottom - trace[span] / rows * (bottom - top)
+        valid = np.isfinite(y)
+        if valid.sum() > 1:
+            line = np.stack([x[valid], y[valid]], axis=1).round().astype(np.int32)
+            cv2.polylines(
+                image, [line], False, composites.SPECTRA_COLOR, 1, cv2.LINE_AA
+            )
+    return image
+
+
+def export(client, runner, body):
+    response = client.post("/visualize-api/exports/composites", json=body)
+    assert response.status_code == 202, response.get_json()
+    job = runner.wait(response.get_json()["jobId"])
+    assert job.status == "completed", job.error
+    return client.get(f"/visualize-api/jobs/{job.id}/download").data
+
+
+def read_archive(path):
+    with zipfile.ZipFile(path) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--slices", type=int, default=24)
+    parser.add_argument("--datasets", type=int, default=8)
+    parser.add_argument("--echoes", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    app = Flask(__name__)
+    app.register_blueprint(visualization.bp, url_prefix="/visualize-api")
+    client = app.test_client()
+    body = {"heatmap": {"metabolite": 0, "colorScale": "Hot"}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in range(1, args.datasets + 1):
+            write_dataset(
+                os.path.join(tmp, f"epsi_16x12_13c_{index:02d}"), 12, 16, args.echoes
+            )
+        write_dataset(os.path.join(tmp, "fsems_rat_liver_03"), 12, 16, 1)
+        write_series(os.path.join(tmp, "proton"), args.slices, 256)
+        rng = np.random.default_rng(0)
+        np.save(
+            os.path.join(tmp, "imaging.npy"), rng.random((12, 16, 2, args.datasets))
+        )
+        configure_study(tmp, 1)
+
+        reconstruction = hupc_processing.read_epsi_plot(1, 0.2)
+        metadata = reconstruction.metadata()
+        points = reconstruction.spectral_data.shape[2]
+        proton = np.full((512, 512), 80, dtype=np.uint8)
+        heatmap = imaging.read_image(imaging.open_imaging_matrix(), 0, 0)
+        arguments = (reconstruction.x_epsi, reconstruction.epsi, points)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            composite_loops(proton, metadata, *arguments, heatmap)
+        loops = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            composites.composite(proton, metadata, *arguments, heatmap=heatmap)
+        vectorized = (time.perf_counter() - start) / args.repeat
+
+        timings = {}
+        configure_study(tmp, 1)
+        runner = jobs.JobRunner(
+            cache_dir=os.path.join(tmp, "job_cache"),
+            max_workers=1,
+            initializer=configure_study,
+            initargs=(tmp, 1),
+        )
+        visualization.JOBS = runner
+        # Start the job worker outside the timed section, as a running server would
+        runner._pool().submit(jobs.resolve, "os:getpid").result()
+        start = time.perf_counter()
+        archive_path = os.path.join(tmp, "export_job.zip")
+        with open(archive_path, "wb") as archive:
+            archive.write(export(client, runner, body))
+        timings["job worker"] = time.perf_counter() - start
+        runner.shutdown()
+        archives = [read_archive(archive_path)]
+
+        configure_study(tmp, args.workers)
+        start = time.perf_counter()
+        metadata, _ = hupc_processing.export_composites(
+            heatmap={"metabolite": 0, "color_scale": "Hot", "alpha": 0.5}
+        )
+        timings[f"{args.workers} render processes"] = time.perf_counter() - start
+        archives.append(read_archive(metadata["path"]))
+        assert archives[0] == archives[1]
+        frames = len(archives[0])
+
+    print(f"frame drawing (512x512, 12x16 grid, {points} points per voxel)")
+    print(
+        f"  per voxel {loops * 1e3:7.2f} ms | whole array {vectorized * 1e3:7.2f} ms | "
+        f"{loops / vectorized:5.1f}x"
+    )
+    print(
+        f"study export: {frames} frames ({args.slices} slices x {args.datasets} datasets)"
+    )
+    for label, elapsed in timings.items():
+        print(f"  {label:20}: {elapsed:7.2f} s, {frames / elapsed:6.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
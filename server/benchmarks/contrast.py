@@ -0,0 +1,113 @@
+"""
+Module: contrast.py
+
+Description:
+Microbenchmarks the proton contrast pipeline of visualize/contrast.py. The baseline is the
+original per-request implementation: float64 normalization and thresholds, a new
+cv2.createCLAHE per slice and float round trips before the uint8 output. It is compared
+with contrast_slice (integer math, pooled CLAHE) and with contrast_slices over the whole
+series in one call. Reports the latency and the peak memory allocated (tracemalloc) per
+slice, and checks that every output is identical to the baseline.
+
+Usage:
+    cd server
+    python -m benchmarks.contrast [--slices 64] [--size 256] [--repeat 5]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from visualize.contrast import contrast_slice, contrast_slices
+
+
+def contrast_float(pixels, contrast, size=None):
+    """
+    Baseline: the original float64 pipeline of the proton endpoints.
+    """
+    slice_image = pixels.copy()
+    slice_image[slice_image < 5] = 0
+    normalized_image = (slice_image - np.min(slice_image)) / (
+        np.max(slice_image) - np.min(slice_image)
+    )
+    normalized_image[normalized_image < 0.05] = 0.0
+    clahe = cv2.createCLAHE(clipLimit=contrast, tileGridSize=(8, 8))
+    clahe_image = clahe.apply(np.uint8(normalized_image * 255))
+    clahe_image[clahe_image < 5] = 0
+    rescaled_image = clahe_image / 255.0
+    rescaled_image[rescaled_image < 0.05] = 0.0
+    output_image = (rescaled_image * 255).astype(np.uint8)
+    if size is not None:
+        output_image = cv2.resize(output_image, size, interpolation=cv2.INTER_AREA)
+    return output_image
+
+
+def measure(function, repeat, slices):
+    """
+    Returns the seconds per slice and the peak bytes allocated per slice by
+    one call rendering a given number of slices.
+    """
+    function()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat / slices, peak / slices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--slices", type=int, default=64)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    # 12-bit MR magnitudes with a dark background, as in the proton series
+    volume = rng.gamma(2.0, 300.0, (args.slices, args.size, args.size))
+    volume[:, : args.size // 8] = rng.integers(0, 8, (args.size // 8, args.size))
+    volume = np.clip(volume, 0, 4095).astype(np.uint16)
+
+    for size in (None, (512, 512)):
+        for dtype in (np.uint16, np.int16, np.uint8):
+            stack = volume.astype(dtype) if dtype != np.uint8 else volume >> 4
+            stack = stack.astype(dtype)
+            expected = [contrast_float(pixels, 2.0, size) for pixels in stack]
+            assert all(
+                np.array_equal(contrast_slice(pixels, 2.0, size), image)
+                for pixels, image in zip(stack, expected)
+            ), dtype
+            assert np.array_equal(contrast_slices(stack, 2.0, size), np.stack(expected))
+
+    cases = {}
+    for size in (None, (512, 512)):
+        label = "native" if size is None else "512x512"
+        repeat = args.repeat * args.slices
+        cases[label] = [
+            measure(lambda: contrast_float(volume[0], 2.0, size), repeat, 1),
+            measure(lambda: contrast_slice(volume[0], 2.0, size), repeat, 1),
+            measure(
+                lambda: contrast_slices(volume, 2.0, size), args.repeat, args.slices
+            ),
+        ]
+
+    print(f"{args.slices} uint16 slices of {args.size}x{args.size}; outputs identical")
+    for label, results in cases.items():
+        print(f"output {label}:")
+        baseline = results[0]
+        for name, (seconds, peak) in zip(
+            ("float64", "integer", f"batch of {args.slices}"), results
+        ):
+            print(
+                f"  {name:12}: {seconds * 1e3:7.3f} ms/slice ({baseline[0] / seconds:4.1f}x), "
+                f"peak {peak / 2**10:7.1f} KiB/slice allocated"
+            )
+
+
+if __name__ == "__main__":
+    main()
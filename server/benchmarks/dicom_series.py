@@ -0,0 +1,144 @@
+"""
+Module: dicom_series.py
+
+Description:
+Benchmarks the proton series loader of visualize/dicom_series.py on a synthetic DICOM series.
+The baselines are the original per-request patterns: listing the folder to count slices,
+and parsing a slice's DICOM file to read its pixels or window statistics. They are compared
+with the same lookups on the series loaded once into a 3D array. Also checks that the
+series is sorted by slice position whatever the file order, and that the rendered PNG
+matches rendering the parsed file.
+
+Usage:
+    cd server
+    python -m benchmarks.dicom_series [--slices 120] [--size 256] [--requests 500]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+from visualize.dicom_series import SERIES_CACHE, count_slices, load_series
+from visualize.proton_images import render_proton_slice
+
+
+def write_series(folder, slices, size):
+    """
+    Writes a synthetic axial uint16 series; file names are shuffled relative
+    to the slice positions so that sorting by name alone would be wrong.
+
+    Returns:
+        list of str: File names in slice order.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(0)
+    series_uid = generate_uid()
+    numbers = list(range(1, slices + 1))
+    random.Random(0).shuffle(numbers)
+    names = []
+    for index in range(slices):
+        name = f"slice{numbers[index]:03d}image001echo001.dcm"
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = MRImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        dataset = Dataset()
+        dataset.file_meta = meta
+        dataset.SOPClassUID = MRImageStorage
+        dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        dataset.SeriesInstanceUID = series_uid
+        dataset.Modality = "MR"
+        dataset.InstanceNumber = index + 1
+        dataset.ImagePositionPatient = [0.0, 0.0, -60.0 + 1.5 * index]
+        dataset.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        dataset.Rows = dataset.Columns = size
+        dataset.SamplesPerPixel = 1
+        dataset.PhotometricInterpretation = "MONOCHROME2"
+        dataset.BitsAllocated = dataset.BitsStored = 16
+        dataset.HighBit = 15
+        dataset.PixelRepresentation = 0
+        dataset.PixelData = rng.integers(
+            0, 4096, (size, size), dtype=np.uint16
+        ).tobytes()
+        dataset.save_as(os.path.join(folder, name), enforce_file_format=True)
+        names.append(name)
+    return names
+
+
+def timed(function, requests):
+    start = time.perf_counter()
+    for request in range(requests):
+        function(request)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--slices", type=int, default=120)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        names = write_series(folder, args.slices, args.size)
+        picks = random.Random(1).choices(names, k=args.requests)
+
+        def parse(request):
+            return pydicom.dcmread(os.path.join(folder, picks[request])).pixel_array
+
+        def parse_stats(request):
+            pixels = parse(request)
+            return pixels.min(), pixels.max(), pixels.mean(), pixels.std()
+
+        def count(request):
+            return len([file for file in os.listdir(folder) if file.endswith(".dcm")])
+
+        baseline = {
+            "count": timed(count, args.requests),
+            "slice": timed(parse, args.requests),
+            "stats": timed(parse_stats, args.requests),
+        }
+
+        start = time.perf_counter()
+        series = load_series(folder)
+        loaded = time.perf_counter() - start
+        assert series.names == names
+        indices = [series.index_of(name) for name in picks]
+        cached = {
+            "count": timed(lambda request: count_slices(folder), args.requests),
+            "slice": timed(
+                lambda request: load_series(folder).slice(indices[request]),
+                args.requests,
+            ),
+            "stats": timed(
+                lambda request: load_series(folder).window_stats(indices[request]),
+                args.requests,
+            ),
+        }
+        assert np.array_equal(series.slice(indices[0]), parse(0))
+        assert render_proton_slice(series.slice(indices[0]), 2.0) == (
+            render_proton_slice(parse(0), 2.0)
+        )
+        SERIES_CACHE.clear()
+
+    print(
+        f"{args.slices} slices of {args.size}x{args.size}, {args.requests} requests; "
+        f"series loaded once in {loaded:6.3f} s"
+    )
+    for name in ("count", "slice", "stats"):
+        print(
+            f"{name:5}: per request {baseline[name] * 1e3 / args.requests:8.3f} ms | "
+            f"cached series {cached[name] * 1e3 / args.requests:8.4f} ms | "
+            f"{baseline[name] / cached[name]:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
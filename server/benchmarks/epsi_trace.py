@@ -0,0 +1,94 @@
+"""
+Module: epsi_trace.py
+
+Description:
+Benchmarks the vectorized EPSI display trace in
+hupc_processing.stack_epsi_traces against the original ROWS x COLUMNS loop
+on random spectral grids, and checks that both produce the same trace.
+
+Usage:
+    cd server
+    python -m benchmarks.epsi_trace [--points 256] [--repeat 5]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from visualize.magnets import hupc_processing
+
+# (rows, columns) of the grids to benchmark
+GRIDS = [(12, 16), (32, 32), (64, 64)]
+
+
+def legacy_stack_epsi_traces(spectral_data, rows, columns, threshold):
+    """
+    The original loop-based trace assembly, kept here as the baseline.
+    """
+    epsi = []
+    for i in range(rows):
+        row_information = []
+        for j in range(columns):
+            if np.max(spectral_data[i, j, :]) < threshold:
+                spectral_data[i, j, :] = np.nan
+            row_information = np.concatenate(
+                (
+                    np.squeeze(row_information),
+                    np.squeeze(np.roll(spectral_data[i, j, :], 0)),
+                )
+            )
+        epsi = np.concatenate(
+            (np.squeeze(epsi), np.squeeze(row_information + rows - i))
+        )
+
+    x_epsi = np.tile(np.arange(0, spectral_data.shape[2] * columns), rows)
+    for nan_rows in range(0, rows - 1):
+        epsi[nan_rows * spectral_data.shape[2] * columns] = np.nan
+    window = hupc_processing.MOVING_AVERAGE_WINDOW
+    epsi = np.convolve(epsi, np.ones(window), mode="same") / window
+    epsi[~np.isnan(epsi)] -= 1
+    return x_epsi, epsi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--points", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    for rows, columns in GRIDS:
+        cube = rng.random((rows, columns, args.points, 1))
+        legacy_cube, cube_copy = cube.copy(), cube.copy()
+        expected = legacy_stack_epsi_traces(legacy_cube, rows, columns, args.threshold)
+        actual = hupc_processing.stack_epsi_traces(cube_copy, args.threshold)
+        assert np.array_equal(expected[0], actual[0])
+        assert np.allclose(expected[1], actual[1], equal_nan=True)
+        assert np.array_equal(legacy_cube, cube_copy, equal_nan=True)
+
+        legacy = min(
+            timeit.repeat(
+                lambda: legacy_stack_epsi_traces(
+                    cube.copy(), rows, columns, args.threshold
+                ),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        vectorized = min(
+            timeit.repeat(
+                lambda: hupc_processing.stack_epsi_traces(cube.copy(), args.threshold),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(
+            f"{rows:>3}x{columns:<3} grid: legacy {legacy * 1e3:8.2f} ms | "
+            f"vectorized {vectorized * 1e3:7.2f} ms | {legacy / vectorized:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
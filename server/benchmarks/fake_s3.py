@@ -0,0 +1,172 @@
+"""
+Module: fake_s3.py
+
+Description:
+A filesystem-backed stand-in for the subset of the boto3 S3 client used by the server, so
+the upload and ingest paths can be exercised and benchmarked without AWS. Objects are stored
+under <root>/<bucket>/<key>; an optional per-call latency and bandwidth simulate the network.
+
+Classes:
+- FilesystemS3: Fake S3 client storing objects as local files.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class StreamingBody:
+    """
+    Minimal stand-in for botocore's StreamingBody over a local file.
+    """
+
+    def __init__(self, path, client):
+        self._file = open(path, "rb")
+        self._client = client
+
+    def read(self, amt=None):
+        data = self._file.read(-1 if amt is None else amt)
+        self._client._transfer(len(data), downloaded=True)
+        return data
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class FilesystemS3:
+    """
+    Fake S3 client storing objects as local files.
+
+    Attributes:
+        root (str): Directory holding one subdirectory per bucket.
+        latency (float): Seconds slept on every call.
+        bandwidth (float): Bytes per second of simulated transfer; unlimited when None.
+        calls (dict): Number of calls per method name.
+        bytes_downloaded (int): Object bytes read by clients.
+        bytes_uploaded (int): Object bytes written by clients.
+    """
+
+    def __init__(self, root, latency=0.0, bandwidth=None):
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = {}
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _transfer(self, size, downloaded=False):
+        with self._lock:
+            if downloaded:
+                self.bytes_downloaded += size
+            else:
+                self.bytes_uploaded += size
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def _path(self, bucket, key):
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def _read_body(body):
+        if isinstance(body, str):
+            return body.encode("utf-8")
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            return bytes(body)
+        return body.read()
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._call("put_object")
+        data = self._read_body(Body)
+        self._transfer(len(data))
+        with open(self._path(Bucket, Key), "wb") as target:
+            target.write(data)
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._call("upload_file")
+        self._transfer(os.path.getsize(Filename))
+        shutil.copyfile(Filename, self._path(Bucket, Key))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._call("upload_fileobj")
+        with open(self._path(Bucket, Key), "wb") as target:
+            for chunk in iter(lambda: Fileobj.read(1024 * 1024), b""):
+                self._transfer(len(chunk))
+                target.write(chunk)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("get_object")
+        path = os.path.join(self.root, Bucket, Key)
+        if not os.path.exists(path):
+            raise KeyError(f"NoSuchKey: {Key}")
+        return {
+            "Body": StreamingBody(path, self),
+            "ContentLength": os.path.getsize(path),
+        }
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._call("download_file")
+        path = os.path.join(self.root, Bucket, Key)
+        self._transfer(os.path.getsize(path), downloaded=True)
+        shutil.copyfile(path, Filename)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = (Bucket, Key, {})
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body, **kwargs):
+        self._call("upload_part")
+        data = self._read_body(Body)
+        self._transfer(len(data))
+        etag = f'"{uuid.uuid4().hex}"'
+        with self._lock:
+            self._uploads[UploadId][2][PartNumber] = (etag, data)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(
+        self, Bucket, Key, UploadId, MultipartUpload, **kwargs
+    ):
+        self._call("complete_multipart_upload")
+        with self._lock:
+            _, _, parts = self._uploads.pop(UploadId)
+        with open(self._path(Bucket, Key), "wb") as target:
+            for part in MultipartUpload["Parts"]:
+                etag, data = parts[part["PartNumber"]]
+                if etag != part["ETag"]:
+                    raise ValueError(f"InvalidPart: {part['PartNumber']}")
+                target.write(data)
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call("abort_multipart_upload")
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+
+    def read(self, bucket, key):
+        """
+        Returns the stored bytes of an object (test helper, not part of the S3 API).
+        """
+        with open(os.path.join(self.root, bucket, key), "rb") as source:
+            return source.read()
@@ -0,0 +1,140 @@
+"""
+Module: fid_reader.py
+
+Description:
+Benchmarks the vectorized Varian 'fid' reader in hupc_processing against the
+original struct.unpack implementation on a synthetic EPSI-sized file, and
+checks that both return identical real/imaginary arrays for the int16, int32
+and float32 sample formats.
+
+Usage:
+    cd server
+    python -m benchmarks.fid_reader [--blocks 1] [--traces 2496] [--points 1024]
+"""
+
+import argparse
+import os
+import struct
+import tempfile
+import timeit
+
+import numpy as np
+
+from visualize.magnets import hupc_processing
+
+# Status bits selecting the sample format, as in the fid file header
+FORMATS = {"int16": (0, ">i2"), "int32": (4, ">i4"), "float32": (8, ">f4")}
+
+
+def write_fid(folder, blocks, traces, points, status, sample):
+    """
+    Writes a synthetic 'fid' file with random samples in the given format.
+
+    Args:
+        folder (str): Path of the dataset without the '.fid' suffix.
+        blocks (int): Number of blocks.
+        traces (int): Number of traces per block.
+        points (int): Number of points (real + imaginary) per trace.
+        status (int): Status word written to the file header.
+        sample (str): Big-endian dtype string of the samples.
+    """
+    rng = np.random.default_rng(0)
+    os.makedirs(f"{folder}.fid", exist_ok=True)
+    item_size = np.dtype(sample).itemsize
+    with open(f"{folder}.fid/fid", "wb") as fid:
+        fid.write(
+            struct.pack(
+                ">6i2hi",
+                blocks,
+                traces,
+                points,
+                item_size,
+                points * item_size,
+                traces * points * item_size + 28,
+                0,
+                status,
+                1,
+            )
+        )
+        for block in range(blocks):
+            fid.write(struct.pack(">4hi4f", 1, status, block + 1, 0, 1, 0, 0, 0, 0))
+            data = rng.integers(-30000, 30000, size=(traces, points))
+            fid.write(data.astype(sample).tobytes())
+
+
+def legacy_read_write_fid(file_path):
+    """
+    The original per-field struct.unpack reader, kept here as the baseline.
+
+    Args:
+        file_path (str): Path of the dataset without the '.fid' suffix.
+
+    Returns:
+        tuple: real_information and imaginary_information arrays.
+    """
+    with open(f"{file_path}.fid/fid", "rb") as fid:
+        blocks = struct.unpack(">i", fid.read(4))[0]
+        traces = struct.unpack(">i", fid.read(4))[0]
+        points = struct.unpack(">i", fid.read(4))[0]
+        fid.read(12)
+        struct.unpack(">h", fid.read(2))[0]
+        s = struct.unpack(">h", fid.read(2))[0]
+        fid.read(4)
+        s32 = int(bool(s & 4))
+        sf = int(bool(s & 8))
+        real_information = []
+        imaginary_information = []
+        for _ in range(blocks):
+            for field in (">h", ">h", ">h", ">h", ">i", ">f", ">f", ">f", ">f"):
+                struct.unpack(field, fid.read(struct.calcsize(field)))
+            for _ in range(traces):
+                if sf == 1:
+                    d = struct.unpack(f">{points}f", fid.read(points * 4))
+                elif s32 == 1:
+                    d = struct.unpack(f">{points}i", fid.read(points * 4))
+                else:
+                    d = struct.unpack(f">{points}h", fid.read(points * 2))
+                real_information.append(list(d[::2]))
+                imaginary_information.append(list(d[1::2]))
+        return np.array(real_information).T, np.array(imaginary_information).T
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--blocks", type=int, default=1)
+    parser.add_argument("--traces", type=int, default=2496)
+    parser.add_argument("--points", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (status, sample) in FORMATS.items():
+            path = os.path.join(tmp, name)
+            write_fid(path, args.blocks, args.traces, args.points, status, sample)
+
+            legacy = legacy_read_write_fid(path)
+            current = hupc_processing.read_write_fid(path)[:2]
+            for old, new in zip(legacy, current):
+                assert old.dtype == new.dtype and np.array_equal(old, new), name
+
+            legacy_time = min(
+                timeit.repeat(
+                    lambda: legacy_read_write_fid(path), number=1, repeat=args.repeat
+                )
+            )
+            current_time = min(
+                timeit.repeat(
+                    lambda: hupc_processing.read_write_fid(path),
+                    number=1,
+                    repeat=args.repeat,
+                )
+            )
+            print(
+                f"{name:>8}: struct.unpack {legacy_time * 1e3:8.2f} ms | "
+                f"structured dtype {current_time * 1e3:8.2f} ms | "
+                f"speedup {legacy_time / current_time:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Module: hp_mri_load.py
+
+Description:
+Load test for the HUPC /get_hp_mri_data handler. Serves a synthetic HUPC
+study through hupc_processing.process_hp_mri_data from a growing thread pool,
+with the spectral data cache disabled so every request runs the full
+reconstruction and JSON encoding, and reports the throughput for each worker
+count.
+
+Usage:
+    cd server
+    python -m benchmarks.hp_mri_load [--datasets 8] [--requests 64]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from benchmarks.spectral_data import write_dataset
+from visualize.magnets import hupc_processing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--datasets", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--echoes", type=int, default=128)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hupc_processing.EPSI_FOLDER = os.path.join(tmp, "epsi_16x12_13c_")
+        hupc_processing.FID_FOLDER = os.path.join(tmp, "fsems")
+        write_dataset(hupc_processing.FID_FOLDER, 1, 16, 1)
+        for dataset in range(args.datasets):
+            path = f"{hupc_processing.EPSI_FOLDER}{dataset:02d}"
+            write_dataset(path, 12, 16, args.echoes)
+        hupc_processing.SPECTRAL_DATA_CACHE.max_bytes = 0
+
+        def request(index):
+            with app.app_context():
+                response = hupc_processing.process_hp_mri_data(
+                    index % args.datasets, 0.2
+                )
+                assert not isinstance(response, tuple), response[0].get_json()
+
+        baseline = None
+        for workers in args.workers:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                start = time.perf_counter()
+                list(pool.map(request, range(args.requests)))
+                elapsed = time.perf_counter() - start
+            throughput = args.requests / elapsed
+            baseline = baseline or throughput
+            print(
+                f"{workers:>2} worker(s): {throughput:7.1f} req/s "
+                f"({throughput / baseline:4.2f}x)"
+            )
+        print(f"CPUs available: {os.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
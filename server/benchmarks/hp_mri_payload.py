@@ -0,0 +1,63 @@
+"""
+Module: hp_mri_payload.py
+
+Description:
+Compares the size and server-side serialization time of the JSON and binary
+(float32) /get_hp_mri_data payloads for a synthetic HUPC dataset.
+
+Usage:
+    cd server
+    python -m benchmarks.hp_mri_payload [--echoes 128] [--repeat 20]
+"""
+
+import argparse
+import gzip
+import os
+import tempfile
+import timeit
+
+from flask import Flask
+
+from benchmarks.spectral_data import write_dataset
+from visualize.magnets import hupc_processing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--echoes", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    app = Flask(__name__)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hupc_processing.EPSI_FOLDER = os.path.join(tmp, "epsi_16x12_13c_")
+        hupc_processing.FID_FOLDER = os.path.join(tmp, "fsems")
+        write_dataset(hupc_processing.FID_FOLDER, 1, 16, 1)
+        write_dataset(
+            f"{hupc_processing.EPSI_FOLDER}01",
+            12,
+            16,
+            args.echoes,
+        )
+        # Warm the spectral data cache so only serialization is measured
+        hupc_processing.read_epsi_plot(1, 0.2)
+
+        with app.app_context():
+            for name, binary in (("json", False), ("binary", True)):
+
+                def serialize():
+                    return hupc_processing.process_hp_mri_data(
+                        1, 0.2, binary=binary
+                    ).get_data()
+
+                body = serialize()
+                seconds = min(timeit.repeat(serialize, number=1, repeat=args.repeat))
+                print(
+                    f"{name:>6}: {len(body) / 1024:9.1f} KiB "
+                    f"({len(gzip.compress(body)) / 1024:8.1f} KiB gzip) | "
+                    f"{seconds * 1e3:7.2f} ms per response"
+                )
+
+
+if __name__ == "__main__":
+    main()
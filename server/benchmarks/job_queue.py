@@ -0,0 +1,116 @@
+"""
+Module: job_queue.py
+
+Description:
+Benchmarks the background reconstruction jobs of visualize/jobs.py on synthetic HUPC EPSI
+datasets. The baseline reconstructs every dataset inside its /get_hp_mri_data request; the
+job queue answers each POST /jobs at once and reconstructs on worker processes. Reports
+how long request threads are held, the time until every result is available, the time of
+a resubmission served from the result cache, and checks that the job results match the
+synchronous payload byte for byte. Both use the binary format (see visualize/transport.py).
+
+Usage:
+    cd server
+    python -m benchmarks.job_queue [--datasets 8] [--echoes 256] [--workers 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from benchmarks.spectral_data import write_dataset
+from visualize import jobs, visualization
+from visualize.magnets import hupc_processing
+
+
+def configure_hupc(dataset_folder):
+    """
+    Points the HUPC module at the synthetic datasets; also runs in every worker.
+    """
+    hupc_processing.DATASET_FOLDER = dataset_folder
+    hupc_processing.EPSI_FOLDER = os.path.join(dataset_folder, "epsi_16x12_13c_")
+    hupc_processing.FID_FOLDER = os.path.join(dataset_folder, "fsems_rat_liver_03")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--datasets", type=int, default=8)
+    parser.add_argument("--echoes", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    app = Flask(__name__)
+    app.register_blueprint(visualization.bp, url_prefix="/visualize-api")
+    client = app.test_client()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in range(1, args.datasets + 1):
+            write_dataset(
+                os.path.join(tmp, f"epsi_16x12_13c_{index:02d}"), 12, 16, args.echoes
+            )
+        write_dataset(os.path.join(tmp, "fsems_rat_liver_03"), 12, 16, 1)
+        configure_hupc(tmp)
+
+        start = time.perf_counter()
+        expected = {}
+        for index in range(1, args.datasets + 1):
+            response = client.post(
+                f"/visualize-api/get_hp_mri_data/{index}?format=binary"
+            )
+            assert response.status_code == 200
+            expected[index] = response.data
+        synchronous = time.perf_counter() - start
+
+        visualization.JOBS = jobs.JobRunner(
+            jobs.SQLiteJobQueue(os.path.join(tmp, "jobs.sqlite3")),
+            cache_dir=os.path.join(tmp, "job_cache"),
+            max_workers=args.workers,
+            initializer=configure_hupc,
+            initargs=(tmp,),
+        )
+        # Start the workers outside the timed section, as a running server would
+        target, _ = jobs.TASKS["hupc_epsi"]
+        visualization.JOBS._pool().submit(jobs.resolve, target).result()
+
+        def submit_all():
+            job_ids = {}
+            for index in range(1, args.datasets + 1):
+                response = client.post("/visualize-api/jobs", json={"dataset": index})
+                assert response.status_code == 202, response.get_json()
+                job_ids[index] = response.get_json()["jobId"]
+            return job_ids
+
+        start = time.perf_counter()
+        job_ids = submit_all()
+        submitted = time.perf_counter() - start
+        results = {}
+        for index, job_id in job_ids.items():
+            assert visualization.JOBS.wait(job_id).status == "completed"
+            results[index] = client.get(
+                f"/visualize-api/jobs/{job_id}/result?format=binary"
+            ).data
+        completed = time.perf_counter() - start
+        assert results == expected
+
+        start = time.perf_counter()
+        cached_ids = submit_all()
+        resubmitted = time.perf_counter() - start
+        assert all(
+            client.get(f"/visualize-api/jobs/{job_id}").get_json()["cached"]
+            for job_id in cached_ids.values()
+        )
+        visualization.JOBS.shutdown()
+
+    print(f"{args.datasets} datasets of 12x16x{args.echoes}, {args.workers} workers")
+    print(f"in request : requests held {synchronous:7.3f} s")
+    print(
+        f"job queue  : requests held {submitted:7.3f} s, results after {completed:7.3f} s "
+        f"({synchronous / completed:4.1f}x)"
+    )
+    print(f"resubmitted: cached results after {resubmitted:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
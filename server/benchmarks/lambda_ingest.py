@@ -0,0 +1,167 @@
+"""
+Module: lambda_ingest.py
+
+Description:
+Benchmarks the MRD ingest lambda against a filesystem-backed fake S3 with simulated
+bandwidth. Compares the original handler body (get_object, then download_file of the same
+key into /tmp and a pass over the local file, one record at a time) with
+aws_lambda.lambda_function.handler, which parses each get_object body as a stream and
+processes the records of a batch event concurrently. Reports wall time, bytes downloaded
+and bytes staged in /tmp, and checks that importing the handler loads no server module
+beyond mrds.read_mrdfile, which is all the deployment package ships of the server.
+
+Usage:
+    cd server
+    python -m benchmarks.lambda_ingest [--objects 4] [--acquisitions 2000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import boto3
+import mrd
+import numpy as np
+
+from aws_lambda import lambda_function
+from benchmarks.fake_s3 import FilesystemS3
+
+BUCKET = "mrissim-app-user-content"
+
+
+def write_mrd(path, acquisitions, images):
+    """
+    Writes a synthetic MRD file with the given numbers of acquisitions and images.
+    """
+    header = mrd.Header(
+        measurement_information=mrd.MeasurementInformationType(measurement_id="BENCH"),
+        acquisition_system_information=mrd.AcquisitionSystemInformationType(
+            system_vendor="Siemens", system_model="Prisma", system_field_strength_t=3.0
+        ),
+    )
+
+    def items():
+        for _ in range(acquisitions):
+            acquisition = mrd.Acquisition()
+            acquisition.data = np.ones((8, 256), dtype=np.complex64)
+            yield mrd.StreamItem.Acquisition(acquisition)
+        for index in range(images):
+            yield mrd.StreamItem.ImageFloat(
+                mrd.ImageFloat(
+                    image_type=mrd.ImageType.MAGNITUDE,
+                    data=np.zeros((1, 1, 128, 128), dtype=np.float32),
+                    image_index=index,
+                )
+            )
+
+    with mrd.BinaryMrdWriter(path) as writer:
+        writer.write_header(header)
+        writer.write_data(items())
+
+
+def legacy_handler(s3, bucket, key, tmp):
+    """
+    The original handler body, kept here as the baseline; returns the /tmp bytes used.
+    """
+    s3.get_object(Bucket=bucket, Key=key)
+    local_filename = os.path.join(tmp, key)
+    s3.download_file(bucket, key, local_filename)
+    staged = os.path.getsize(local_filename)
+    with mrd.BinaryMrdReader(local_filename) as reader:
+        reader.read_header()
+        for _ in reader.read_data():
+            pass
+    os.remove(local_filename)
+    return staged
+
+
+# Server modules the Lambda deployment package ships (see aws_lambda/lambda_function.py)
+LAMBDA_SERVER_MODULES = [
+    "aws_lambda",
+    "aws_lambda.lambda_function",
+    "mrds",
+    "mrds.read_mrdfile",
+]
+SERVER_PACKAGES = (
+    "app",
+    "aws_lambda",
+    "benchmarks",
+    "data",
+    "images",
+    "mrds",
+    "visualize",
+)
+
+
+def lambda_server_modules():
+    """
+    Returns the server modules loaded by importing the handler in a fresh interpreter.
+    """
+    code = (
+        "import sys, aws_lambda.lambda_function\n"
+        f"packages = {SERVER_PACKAGES!r}\n"
+        "print(*sorted(m for m in sys.modules if m.split('.')[0] in packages))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return output.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--objects", type=int, default=4)
+    parser.add_argument("--acquisitions", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--bandwidth-mb", type=float, default=200)
+    args = parser.parse_args()
+    modules = lambda_server_modules()
+    assert modules == LAMBDA_SERVER_MODULES, modules
+
+    with tempfile.TemporaryDirectory() as tmp:
+        s3 = FilesystemS3(os.path.join(tmp, "s3"), 0.01, args.bandwidth_mb * 1024**2)
+        keys = [f"scan_{index:02d}.mrd" for index in range(args.objects)]
+        os.makedirs(os.path.join(s3.root, BUCKET))
+        for key in keys:
+            write_mrd(
+                os.path.join(s3.root, BUCKET, key), args.acquisitions, args.images
+            )
+        size = sum(os.path.getsize(os.path.join(s3.root, BUCKET, key)) for key in keys)
+        print(f"{args.objects} objects, {size / 1024**2:.1f} MiB in total")
+
+        staging = os.path.join(tmp, "lambda_tmp")
+        os.makedirs(staging)
+        start = time.perf_counter()
+        staged = sum(legacy_handler(s3, BUCKET, key, staging) for key in keys)
+        legacy = time.perf_counter() - start
+        print(
+            f"legacy   : {legacy:6.2f} s | downloaded {s3.bytes_downloaded / 1024**2:7.1f} MiB "
+            f"| staged in /tmp {staged / 1024**2:7.1f} MiB"
+        )
+
+        s3.bytes_downloaded = 0
+        boto3.client = lambda *args, **kwargs: s3
+        event = {
+            "Records": [
+                {"s3": {"bucket": {"name": BUCKET}, "object": {"key": key}}}
+                for key in keys
+            ]
+        }
+        start = time.perf_counter()
+        results = lambda_function.handler(event, None)["results"]
+        streaming = time.perf_counter() - start
+        for result in results:
+            assert "error" not in result, result
+            assert result["acquisitions_count"] == args.acquisitions, result
+            assert result["recon_images_count"] == args.images, result
+        print(
+            f"streaming: {streaming:6.2f} s | downloaded {s3.bytes_downloaded / 1024**2:7.1f} MiB "
+            f"| staged in /tmp {0:7.1f} MiB | {legacy / streaming:4.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
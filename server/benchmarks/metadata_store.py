@@ -0,0 +1,132 @@
+"""
+Module: metadata_store.py
+
+Description:
+Benchmarks the SQLite metadata store in mrds/repository.py against the original linear scans
+over in-memory record lists, on a synthetic table of MRD file records: lookup by id, one
+filtered and sorted page of the listing, and the images of one sequence.
+
+Usage:
+    cd server
+    python -m benchmarks.metadata_store [--records 200000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import timeit
+
+from mrds.repository import MetadataStore
+
+OWNERS = ["MEDCAP", "Ben Yoon", "PIGI Lab", "Penn Radiology"]
+VENDORS = ["Siemens", "GE Healthcare", "Philips", "Bruker"]
+
+
+def make_records(count):
+    """
+    Builds synthetic MRD file and image records in the data.py format.
+    """
+    rng = random.Random(0)
+    mrd_files = [
+        {
+            "id": index,
+            "name": f"Sequence {index}",
+            "date": f"2024-{rng.randint(1, 12)}-{rng.randint(1, 28)}",
+            "owner": rng.choice(OWNERS),
+            "reconImagesCount": rng.randint(0, 20),
+            "isSelected": False,
+            "parameter": "Add Parameter Info",
+            "raw": {"description": "", "machine_vendor": rng.choice(VENDORS)},
+            "reconstructed": rng.random() < 0.5,
+        }
+        for index in range(1, count + 1)
+    ]
+    images = [
+        {
+            "id": index,
+            "name": f"Image {index}",
+            "date": "2024-11-6",
+            "owner": rng.choice(OWNERS),
+            "sequence_id": rng.randint(1, count // 10),
+            "sequence": "",
+            "isSelected": False,
+        }
+        for index in range(1, count + 1)
+    ]
+    return mrd_files, images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    mrd_files, images = make_records(args.records)
+    target = args.records // 2
+
+    def scan_get():
+        return next((file for file in mrd_files if file["id"] == target), None)
+
+    def scan_page():
+        matches = [
+            file
+            for file in mrd_files
+            if file["owner"] == "Ben Yoon" and file["raw"]["machine_vendor"] == "Bruker"
+        ]
+        return sorted(matches, key=lambda file: file["date"], reverse=True)[:50]
+
+    def scan_sequence():
+        return [image for image in images if image["sequence_id"] == 42]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MetadataStore(os.path.join(tmp, "metadata.sqlite3"))
+        store.seed(mrd_files, images)
+        filters = {"owner": "Ben Yoon", "vendor": "Bruker"}
+        cases = [
+            ("get by id", scan_get, lambda: store.mrd_files.get(target)),
+            (
+                "filtered page",
+                scan_page,
+                lambda: store.mrd_files.list(
+                    filters, sort="date", descending=True, limit=50
+                ),
+            ),
+            (
+                "images of sequence",
+                scan_sequence,
+                lambda: store.images.list({"sequence_id": 42}),
+            ),
+        ]
+        assert [file["id"] for file in store.mrd_files.list(filters)[0]] == sorted(
+            file["id"]
+            for file in mrd_files
+            if file["owner"] == "Ben Yoon" and file["raw"]["machine_vendor"] == "Bruker"
+        )
+        print(f"{args.records} records")
+        for name, scan, query in cases:
+            scan_time = min(timeit.repeat(scan, number=1, repeat=args.repeat))
+            query_time = min(timeit.repeat(query, number=1, repeat=args.repeat))
+            print(
+                f"{name:>18}: scan {scan_time * 1e3:8.2f} ms | "
+                f"sqlite {query_time * 1e3:7.2f} ms | {scan_time / query_time:7.1f}x"
+            )
+
+        # A page deep into the date-sorted listing: OFFSET walks every skipped
+        # row while the keyset cursor seeks straight to the position
+        depth = args.records // 2
+        last = store.mrd_files.list(sort="date", limit=1, offset=depth - 1)[0][0]
+        position = store.mrd_files.position(last, "date")
+        by_offset = lambda: store.mrd_files.list(sort="date", limit=50, offset=depth)
+        by_cursor = lambda: store.mrd_files.list(sort="date", limit=50, after=position)
+        assert by_offset()[0] == by_cursor()[0]
+        offset_time = min(timeit.repeat(by_offset, number=1, repeat=args.repeat))
+        cursor_time = min(timeit.repeat(by_cursor, number=1, repeat=args.repeat))
+        print(
+            f"{'deep page':>18}: offset {offset_time * 1e3:6.2f} ms | "
+            f"cursor {cursor_time * 1e3:7.2f} ms | {offset_time / cursor_time:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Module: precompute.py
+
+Description:
+Benchmarks precompute-on-ingest for a synthetic HUPC study. The baseline is the first
+/get_hp_mri_data request for each dataset, which reconstructs it while the user waits on the
+dataset slider. The study is then precomputed on the job queue's worker processes, and the
+same first requests are served from the stored HDF5 artifacts (see visualize/artifacts.py).
+Reports the slider step latencies, the precompute time and the artifact size, and the time
+to read one voxel from an artifact against reconstructing its dataset. Checks that the
+payloads match.
+
+Usage:
+    cd server
+    python -m benchmarks.precompute [--datasets 8] [--echoes 4096] [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+from flask import Flask
+
+from benchmarks.job_queue import configure_hupc
+from benchmarks.spectral_data import write_dataset
+from visualize import artifacts, jobs, visualization
+from visualize.magnets import hupc_processing
+
+
+def decode(payload):
+    """
+    Decodes the arrays of a binary payload (see visualize/transport.py).
+    """
+    (length,) = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4 : 4 + length])
+    buffer = np.frombuffer(payload, dtype="<f4", offset=4 + length)
+    return {
+        array["name"]: buffer[
+            array["offset"] // 4 : array["offset"] // 4 + int(np.prod(array["shape"]))
+        ]
+        for array in header["arrays"]
+    }
+
+
+def slider_steps(client, datasets):
+    """
+    Requests every dataset once, as dragging the slider across the study does.
+
+    Returns:
+        tuple: Latency of the slowest step in seconds, and the payloads.
+    """
+    slowest = 0.0
+    payloads = {}
+    for index in datasets:
+        start = time.perf_counter()
+        response = client.post(f"/visualize-api/get_hp_mri_data/{index}?format=binary")
+        slowest = max(slowest, time.perf_counter() - start)
+        assert response.status_code == 200
+        payloads[index] = decode(response.data)
+    return slowest, payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--datasets", type=int, default=8)
+    parser.add_argument("--echoes", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    app = Flask(__name__)
+    app.register_blueprint(visualization.bp, url_prefix="/visualize-api")
+    client = app.test_client()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in range(1, args.datasets + 1):
+            write_dataset(
+                os.path.join(tmp, f"epsi_16x12_13c_{index:02d}"), 12, 16, args.echoes
+            )
+        write_dataset(os.path.join(tmp, "fsems_rat_liver_03"), 12, 16, 1)
+        configure_hupc(tmp)
+        datasets = hupc_processing.dataset_indices()
+        assert len(datasets) == args.datasets
+
+        cold, expected = slider_steps(client, datasets)
+
+        jobs.CACHE_DIR = os.path.join(tmp, "job_cache")
+        # The spawned workers read the artifact directory from the environment
+        artifacts.ARTIFACT_DIR = os.path.join(tmp, "artifacts")
+        os.environ["HP_MRI_ARTIFACT_DIR"] = artifacts.ARTIFACT_DIR
+        visualization.JOBS = jobs.JobRunner(
+            max_workers=args.workers,
+            initializer=configure_hupc,
+            initargs=(tmp,),
+        )
+        start = time.perf_counter()
+        response = client.post("/visualize-api/precompute/HUPC")
+        assert response.status_code == 202, response.get_json()
+        for job in response.get_json()["jobs"]:
+            assert visualization.JOBS.wait(job["jobId"]).status == "completed"
+        precompute = time.perf_counter() - start
+        visualization.JOBS.shutdown()
+        artifact_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(artifacts.ARTIFACT_DIR)
+            for name in names
+        )
+
+        hupc_processing.SPECTRAL_DATA_CACHE.clear()
+        warm, payloads = slider_steps(client, datasets)
+        for index in datasets:
+            for name, array in payloads[index].items():
+                np.testing.assert_allclose(
+                    array, expected[index][name], rtol=1e-6, atol=1e-6
+                )
+
+        # One voxel of a dataset not in memory: a chunked read of the artifact
+        # against reconstructing the dataset
+        hupc_processing.SPECTRAL_DATA_CACHE.clear()
+        start = time.perf_counter()
+        voxel = hupc_processing.read_voxel_spectrum(datasets[-1], 5, 7)
+        voxel_read = time.perf_counter() - start
+        hupc_processing.SPECTRAL_DATA_CACHE.clear()
+        start = time.perf_counter()
+        reconstructed = hupc_processing.load_spectral_data(datasets[-1])[5, 7]
+        voxel_reconstruct = time.perf_counter() - start
+        np.testing.assert_array_equal(voxel, reconstructed)
+
+    print(f"{args.datasets} datasets of 12x16x{args.echoes}, {args.workers} workers")
+    print(f"on demand  : slowest first slider step {cold * 1e3:8.1f} ms")
+    print(
+        f"precomputed: slowest first slider step {warm * 1e3:8.1f} ms "
+        f"({cold / warm:4.1f}x) | precompute {precompute:6.2f} s, "
+        f"artifacts {artifact_bytes / 1e6:6.1f} MB"
+    )
+    print(
+        f"one voxel  : reconstruct {voxel_reconstruct * 1e3:8.1f} ms | "
+        f"artifact read {voxel_read * 1e3:6.2f} ms "
+        f"({voxel_reconstruct / voxel_read:5.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
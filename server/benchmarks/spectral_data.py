@@ -0,0 +1,170 @@
+"""
+Module: spectral_data.py
+
+Description:
+Benchmarks the batched EPSI reconstruction in
+hupc_processing.read_write_spectral_data against the original nested-loop
+implementation on synthetic EPSI datasets, and checks that both produce the
+same magnitude spectra.
+
+With several pictures, the original loops read the first nv * ne traces for
+every picture; the batched reconstruction reads picture i from traces
+[i * nv * ne, (i + 1) * nv * ne). A multi-picture dataset checks each picture
+against the loops reading that picture's own block, and that only the first
+picture still matches the original loops.
+
+Usage:
+    cd server
+    python -m benchmarks.spectral_data [--echoes 64] [--repeat 3]
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import numpy as np
+from scipy.fft import fftn
+
+from benchmarks.fid_reader import write_fid
+from visualize.magnets import hupc_processing
+
+# (views, points, centric) of the grids to benchmark
+GRIDS = [(12, 16, True), (32, 32, False), (64, 64, False)]
+
+
+def write_dataset(folder, nv, points, ne, pictures=1):
+    """
+    Writes a synthetic EPSI dataset (procpar with geometry and int32 fid).
+
+    Args:
+        folder (str): Path of the dataset without the '.fid' suffix.
+        nv (int): Number of phase-encode views.
+        points (int): Number of complex points per trace.
+        ne (int): Number of echoes.
+        pictures (int): Number of pictures, stored one after the other.
+    """
+    write_fid(folder, 1, pictures * nv * ne, 2 * points, 4, ">i4")
+    parameters = {
+        "ne": ne,
+        "np": 2 * points,
+        "nv": nv,
+        "te2": 0.002,
+        "lro": 4.0,
+        "lpe": 3.0,
+    }
+    with open(os.path.join(f"{folder}.fid", "procpar"), "w") as procpar:
+        for name, value in parameters.items():
+            procpar.write(f"{name} 1 1 0 0 0 2 1 0 1 64\n1 {value} \n0 \n")
+
+
+def legacy_read_write_spectral_data(
+    epsi_tmp, file_path, proton_quarter, picture_blocks=False
+):
+    """
+    The original loop-based reconstruction, kept here as the baseline.
+
+    With picture_blocks, picture i is read from its own block of nv * ne
+    traces, as the batched reconstruction does, instead of the first block.
+    """
+    ne = hupc_processing.read_write_procpar("ne", file_path)[0]
+    number_of_points = hupc_processing.read_write_procpar("np", file_path)[0] // 2
+    nv = hupc_processing.read_write_procpar("nv 1", file_path)[0]
+    et = 1 / hupc_processing.read_write_procpar("te2", file_path)[0]
+    if epsi_tmp["centric"]:
+        echoes = np.array([0, -1, 1, -2, 2, -3, 3, -4, 4, -5, 5, -6]) + 7
+    else:
+        echoes = np.arange(1, int(nv) + 1)
+    pictures = epsi_tmp["pictures_to_read_write"]
+    shape = (int(nv), int(number_of_points), int(ne), pictures)
+    array = np.zeros(shape, dtype=complex)
+    array_1 = array.copy()
+    array_2 = array.copy()
+    array_3 = np.zeros(shape[:2] + (int(2 * ne), pictures), dtype=complex)
+    spectral_data = array_3.copy()
+    for i in range(pictures):
+        real, imaginary = hupc_processing.read_write_fid(file_path)[:2]
+        for j in range(int(ne)):
+            ix = np.arange(j, int(nv * ne), int(ne))
+            if picture_blocks:
+                ix += i * int(nv * ne)
+            array[:, :, j, i] = (real[:, ix] - 1j * imaginary[:, ix]).T
+        for j in range(int(nv)):
+            array_1[echoes[j] - 1, :, :, :] = array[j, :, :, :]
+        for j in range(int(nv)):
+            for k in range(int(number_of_points)):
+                line = np.squeeze(array_1[j, k, :, i])
+                array_2[j, k, :, i] = line * np.exp(
+                    -np.arange(0, int(ne)).T * proton_quarter / et
+                )
+        array_3[:, :, 0 : int(ne), i] = array_2[:, :, 0 : int(ne), i]
+        transformed = np.fft.fftshift(fftn(np.squeeze(array_3[:, :, :, i])))
+        for j in range(0, int(nv)):
+            for k in range(0, int(number_of_points)):
+                spectral_data[j, k, :, i] = transformed[
+                    j, int(number_of_points - k - 1), ::-1
+                ]
+    return np.abs(spectral_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--echoes", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    proton_quarter = hupc_processing.EPSI_INFO["proton"] / 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for nv, points, centric in GRIDS:
+            path = os.path.join(tmp, f"epsi_{points}x{nv}")
+            write_dataset(path, nv, points, args.echoes)
+            epsi_info = {"pictures_to_read_write": 1, "centric": centric}
+
+            def legacy():
+                return legacy_read_write_spectral_data(epsi_info, path, proton_quarter)
+
+            def current():
+                return hupc_processing.read_write_spectral_data(
+                    epsi_info, path, proton_quarter
+                )
+
+            assert np.allclose(legacy(), current(), rtol=1e-12, atol=0)
+            legacy_time = min(timeit.repeat(legacy, number=1, repeat=args.repeat))
+            current_time = min(timeit.repeat(current, number=1, repeat=args.repeat))
+            print(
+                f"{points:>3}x{nv:<3}: loops {legacy_time * 1e3:9.2f} ms | "
+                f"batched {current_time * 1e3:8.2f} ms | "
+                f"speedup {legacy_time / current_time:6.1f}x"
+            )
+
+        check_pictures(tmp, proton_quarter, args.echoes)
+
+
+def check_pictures(folder, proton_quarter, ne, pictures=3):
+    """
+    Checks a multi-picture reconstruction: every picture matches the loops
+    reading its own block of traces, and the pictures differ, so none is the
+    first block read again.
+    """
+    path = os.path.join(folder, "epsi_pictures")
+    write_dataset(path, 12, 16, ne, pictures)
+    epsi_info = {"pictures_to_read_write": pictures, "centric": True}
+    current = hupc_processing.read_write_spectral_data(epsi_info, path, proton_quarter)
+    blocks = legacy_read_write_spectral_data(
+        epsi_info, path, proton_quarter, picture_blocks=True
+    )
+    original = legacy_read_write_spectral_data(epsi_info, path, proton_quarter)
+    assert current.shape[3] == pictures
+    assert np.allclose(current, blocks, rtol=1e-12, atol=0)
+    assert np.allclose(current[..., 0], original[..., 0], rtol=1e-12, atol=0)
+    for picture in range(1, pictures):
+        assert not np.allclose(current[..., picture], current[..., 0])
+        assert not np.allclose(current[..., picture], original[..., picture])
+    print(
+        f"{pictures} pictures: each read from its own block of traces; "
+        "the original loops re-read the first block"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Module: upload_ingest.py
+
+Description:
+Benchmarks POST /api/upload against a filesystem-backed fake S3 with simulated network
+latency. Compares the original flow (save every file to tmpdata, then upload_file serially
+inside the request) with the streaming pipeline in mrds/ingest.py. Reports the time until
+the response and until every object is stored, and checks the stored bytes.
+
+Usage:
+    cd server
+    python -m benchmarks.upload_ingest [--files 4] [--size-mb 24]
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from benchmarks.fake_s3 import FilesystemS3
+from mrds import routes
+from mrds.ingest import UploadPipeline
+
+
+def legacy_upload(s3, files):
+    """
+    The original request handler body, kept here as the baseline.
+    """
+    upload_path = tempfile.mkdtemp()
+    for filename, data in files.items():
+        filepath = os.path.join(upload_path, filename)
+        with open(filepath, "wb") as file:
+            file.write(data)
+        s3.upload_file(filepath, routes.BUCKET, filename)
+        os.remove(filepath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=24)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth-mb", type=float, default=100)
+    args = parser.parse_args()
+
+    files = {
+        f"scan_{index:02d}.mrd": os.urandom(int(args.size_mb * 1024 * 1024))
+        for index in range(args.files)
+    }
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp, url_prefix="/api")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        s3 = FilesystemS3(
+            os.path.join(tmp, "legacy"), args.latency, args.bandwidth_mb * 1024 * 1024
+        )
+        start = time.perf_counter()
+        legacy_upload(s3, files)
+        legacy = time.perf_counter() - start
+        print(
+            f"legacy   : response after {legacy:6.2f} s, stored after {legacy:6.2f} s"
+        )
+
+        s3 = FilesystemS3(
+            os.path.join(tmp, "stream"), args.latency, args.bandwidth_mb * 1024 * 1024
+        )
+        routes.INGEST = UploadPipeline(s3, routes.BUCKET)
+        client = app.test_client()
+        body = {"mriFiles": [(io.BytesIO(data), name) for name, data in files.items()]}
+        start = time.perf_counter()
+        response = client.post("/api/upload", data=body)
+        responded = time.perf_counter() - start
+        assert response.status_code == 202, response.get_json()
+        job_id = response.get_json()["jobId"]
+        while True:
+            status = client.get(f"/api/upload/{job_id}").get_json()
+            if status["status"] not in ("receiving", "uploading"):
+                break
+            time.sleep(0.01)
+        stored = time.perf_counter() - start
+        assert status["status"] == "completed", status
+        for name, data in files.items():
+            assert s3.read(routes.BUCKET, name) == data, name
+        print(
+            f"streaming: response after {responded:6.2f} s, stored after {stored:6.2f} s "
+            f"({legacy / stored:4.1f}x) | S3 calls {s3.calls}"
+        )
+        routes.INGEST.shutdown()
+
+
+if __name__ == "__main__":
+    main()
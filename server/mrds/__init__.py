@@ -1,5 +1,2 @@
-from flask import Blueprint
-
-bp = Blueprint('mrd', __name__)
-
-from mrds import routes
\ No newline at end of file
+# The mrds blueprint lives in mrds.routes; importing the package stays
+# lightweight so mrds.read_mrdfile can be used outside the Flask app
@@ -0,0 +1,479 @@
+"""
+Module: ingest.py
+
+Description:
+This module streams multipart/form-data uploads straight into S3. The request body is parsed
+incrementally; each uploaded file is cut into parts that are sent with S3 multipart uploads
+from a bounded thread pool, so several files upload concurrently and no file is staged on
+local disk. Uploads are tracked as jobs whose progress can be polled while the parts are
+still in flight. The received bytes of each file can also be read as a stream by a
+read_stream callback on a thread of its own (indexing the MRD file, see mrds/routes.py), so
+the file is processed as it arrives instead of being downloaded again once stored. A stored
+file is then handed to an on_stored callback, which runs on the pool before the file is
+reported completed.
+
+Classes:
+- StreamTee: Readable stream of the bytes of a file as they are received.
+- UploadJob: Progress of the files received in one upload request.
+- UploadPipeline: Parses upload bodies and runs the S3 transfers in the background.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+# S3 requires every part but the last to be at least 5 MiB
+PART_SIZE = 8 * 1024 * 1024
+# Bytes read from the request body per iteration
+READ_SIZE = 256 * 1024
+MAX_WORKERS = 4
+# Finished jobs beyond this count are forgotten, oldest first
+MAX_JOBS = 256
+# Received bytes a StreamTee holds before the request thread waits for its reader
+TEE_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class StreamTee:
+    """
+    Readable stream of the bytes of a file as they are received.
+
+    The request thread feeds it and a reader thread consumes it. At most
+    max_buffered bytes are held: feeding waits while the reader is behind.
+    Once the reader is done with it, the stream is detached and further bytes
+    are dropped, so a reader that stops early never blocks the upload.
+    """
+
+    def __init__(self, max_buffered=TEE_BUFFER_SIZE):
+        self.max_buffered = max_buffered
+        self._buffer = bytearray()
+        self._ended = False
+        self._detached = False
+        self._condition = threading.Condition()
+
+    def feed(self, data):
+        with self._condition:
+            while len(self._buffer) >= self.max_buffered and not self._detached:
+                self._condition.wait()
+            if not self._detached:
+                self._buffer += data
+                self._condition.notify_all()
+
+    def end(self):
+        """
+        Marks the end of the file; reads return b"" once the buffer is drained.
+        """
+        with self._condition:
+            self._ended = True
+            self._condition.notify_all()
+
+    def detach(self):
+        with self._condition:
+            self._detached = True
+            self._buffer = bytearray()
+            self._condition.notify_all()
+
+    def read(self, size=-1):
+        """
+        Returns up to size buffered bytes, waiting for at least one; b"" at the end.
+        """
+        with self._condition:
+            while not self._buffer and not self._ended:
+                self._condition.wait()
+            if size is None or size < 0 or size > len(self._buffer):
+                size = len(self._buffer)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._condition.notify_all()
+            return data
+
+
+class FileUpload:
+    """
+    Uploads one file of a request to S3 as it is received.
+
+    Files that fit in a single part are sent with one put_object call; larger
+    files use a multipart upload whose parts are sent from the pipeline's pool
+    while the rest of the body is still being read.
+    """
+
+    def __init__(self, pipeline, job, name, field=None):
+        self.pipeline = pipeline
+        self.job = job
+        self.name = name
+        self.field = field
+        self.key = name
+        self.status = "receiving"
+        self.error = None
+        # Result of the pipeline's on_stored callback and its error, if any
+        self.record = None
+        self.record_error = None
+        # Future of the pipeline's read_stream callback, fed through the tee
+        self.read_result = None
+        self._tee = None
+        self.bytes_received = 0
+        self.bytes_uploaded = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._next_part = 1
+        self._parts = {}
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        if pipeline.read_stream is not None:
+            self._start_reader()
+
+    def _start_reader(self):
+        self._tee = StreamTee()
+        self.read_result = Future()
+
+        def read():
+            try:
+                self.read_result.set_result(self.pipeline.read_stream(self, self._tee))
+            except Exception as e:
+                self.read_result.set_exception(e)
+            finally:
+                self._tee.detach()
+
+        threading.Thread(
+            target=read, name=f"upload-reader-{self.name}", daemon=True
+        ).start()
+
+    def write(self, data):
+        """
+        Buffers received bytes, sending a part each time PART_SIZE bytes are buffered.
+        """
+        if self._tee is not None:
+            self._tee.feed(data)
+        self._buffer += data
+        self.bytes_received += len(data)
+        while len(self._buffer) >= self.pipeline.part_size:
+            part = bytes(self._buffer[: self.pipeline.part_size])
+            del self._buffer[: self.pipeline.part_size]
+            self._send_part(part)
+
+    def close(self):
+        """
+        Sends the remaining bytes; the upload completes once every part is stored.
+        """
+        if self._tee is not None:
+            self._tee.end()
+        if self._upload_id is None and self.error is None:
+            part = bytes(self._buffer)
+            self._buffer = bytearray()
+            self._submit(self._put_object, part)
+        elif self._buffer:
+            part = bytes(self._buffer)
+            self._buffer = bytearray()
+            self._send_part(part)
+        with self._lock:
+            self._closed = True
+            self.status = "uploading" if self.error is None else self.status
+        self._finish_if_done()
+
+    def fail(self, error):
+        """
+        Marks the upload as failed; pending parts are discarded once they finish.
+        """
+        with self._lock:
+            if self.error is None:
+                self.error = str(error)
+        self._buffer = bytearray()
+
+    def _send_part(self, part):
+        if self.error is not None:
+            return
+        if self._upload_id is None:
+            try:
+                response = self.pipeline.s3.create_multipart_upload(
+                    Bucket=self.pipeline.bucket, Key=self.key
+                )
+            except Exception as e:
+                self.fail(e)
+                return
+            self._upload_id = response["UploadId"]
+        self._submit(self._upload_part, self._next_part, part)
+        self._next_part += 1
+
+    def _submit(self, function, *args):
+        # Block the request thread while too many parts are in flight, which
+        # bounds the memory held by buffered parts
+        self.pipeline._slots.acquire()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self.pipeline._executor.submit(function, *args)
+        except Exception:
+            self.pipeline._slots.release()
+            raise
+        future.add_done_callback(self._part_done)
+
+    def _put_object(self, part):
+        self.pipeline.s3.put_object(
+            Bucket=self.pipeline.bucket, Key=self.key, Body=part
+        )
+        with self._lock:
+            self.bytes_uploaded += len(part)
+
+    def _upload_part(self, number, part):
+        if self.error is not None:
+            return
+        response = self.pipeline.s3.upload_part(
+            Bucket=self.pipeline.bucket,
+            Key=self.key,
+            PartNumber=number,
+            UploadId=self._upload_id,
+            Body=part,
+        )
+        with self._lock:
+            self._parts[number] = response["ETag"]
+            self.bytes_uploaded += len(part)
+
+    def _part_done(self, future):
+        self.pipeline._slots.release()
+        if future.exception() is not None:
+            self.fail(future.exception())
+        with self._lock:
+            self._pending -= 1
+        self._finish_if_done()
+
+    def _finish_if_done(self):
+        with self._lock:
+            # close() and the last part's callback can both get here; only the
+            # first one claims the completion
+            if (
+                not self._closed
+                or self._pending
+                or self.status in ("completing", "storing", "completed", "failed")
+            ):
+                return
+            self.status = "completing"
+        try:
+            if self.error is None and self._upload_id is not None:
+                self.pipeline.s3.complete_multipart_upload(
+                    Bucket=self.pipeline.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={
+                        "Parts": [
+                            {"ETag": etag, "PartNumber": number}
+                            for number, etag in sorted(self._parts.items())
+                        ]
+                    },
+                )
+        except Exception as e:
+            self.fail(e)
+        if self.error is not None and self._upload_id is not None:
+            try:
+                self.pipeline.s3.abort_multipart_upload(
+                    Bucket=self.pipeline.bucket, Key=self.key, UploadId=self._upload_id
+                )
+            except Exception:
+                pass
+        if self.error is None and self.pipeline.on_stored is not None:
+            with self._lock:
+                self.status = "storing"
+            try:
+                self.pipeline._executor.submit(self._store)
+            except RuntimeError:
+                # The pool is shutting down
+                self._store()
+            return
+        with self._lock:
+            self.status = "failed" if self.error is not None else "completed"
+        self.job._file_finished()
+
+    def _store(self):
+        # The file is in S3 whatever the callback does; its errors are reported
+        # on the file without failing the upload
+        try:
+            self.record = self.pipeline.on_stored(self)
+        except Exception as e:
+            self.record_error = str(e)
+        with self._lock:
+            self.status = "completed"
+        self.job._file_finished()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "key": self.key,
+            "status": self.status,
+            "bytesReceived": self.bytes_received,
+            "bytesUploaded": self.bytes_uploaded,
+            "error": self.error,
+            "record": self.record,
+            "recordError": self.record_error,
+        }
+
+
+class UploadJob:
+    """
+    Progress of the files received in one upload request.
+
+    Attributes:
+        id (str): Job identifier returned to the client.
+        created (float): Creation time as a Unix timestamp.
+        files (list of FileUpload): Files in the order they were received.
+        finished (threading.Event): Set once the body is read and every file is stored or failed.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+        self.files = []
+        self.error = None
+        self.finished = threading.Event()
+        self._received = False
+        self._lock = threading.Lock()
+
+    @property
+    def status(self):
+        if not self._received:
+            return "receiving"
+        if not self.finished.is_set():
+            return "uploading"
+        if self.error is not None or any(file.error for file in self.files):
+            return "failed"
+        return "completed"
+
+    def _body_received(self):
+        with self._lock:
+            self._received = True
+        self._file_finished()
+
+    def _file_finished(self):
+        with self._lock:
+            if self._received and all(
+                file.status in ("completed", "failed") for file in self.files
+            ):
+                self.finished.set()
+
+    def to_dict(self):
+        files = [file.to_dict() for file in self.files]
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "created": self.created,
+            "bytesReceived": sum(file["bytesReceived"] for file in files),
+            "bytesUploaded": sum(file["bytesUploaded"] for file in files),
+            "error": self.error,
+            "files": files,
+        }
+
+
+class UploadPipeline:
+    """
+    Streams multipart/form-data request bodies into S3 through a bounded thread pool.
+
+    Attributes:
+        s3: boto3 S3 client, or any object with the same multipart upload methods.
+        bucket (str): Destination bucket.
+        part_size (int): Size of each multipart upload part in bytes.
+        read_stream (callable, optional): Called on a thread of its own with each
+            FileUpload and a StreamTee of its bytes as they are received; its
+            result is kept in the file's read_result future.
+        on_stored (callable, optional): Called on the pool with each FileUpload
+            once it is stored in S3; its return value is reported as the file's
+            "record".
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket,
+        max_workers=MAX_WORKERS,
+        part_size=PART_SIZE,
+        on_stored=None,
+        read_stream=None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.part_size = part_size
+        self.on_stored = on_stored
+        self.read_stream = read_stream
+        self.jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="s3-upload"
+        )
+        # At most two parts per worker are buffered in memory at once
+        self._slots = threading.BoundedSemaphore(2 * max_workers)
+
+    def ingest(self, stream, boundary):
+        """
+        Reads a multipart/form-data body and starts uploading every file in it.
+
+        Returns once the whole body has been read; the remaining parts keep
+        uploading in the background and are reported by the returned job.
+        Reading pauses while 2 * max_workers parts are in flight, so the
+        request thread is held until all but the last few parts of the body
+        are uploaded, and the job id is only returned then.
+
+        Args:
+            stream: Readable binary stream of the request body.
+            boundary (str): Multipart boundary from the Content-Type header.
+
+        Returns:
+            UploadJob: The job tracking the upload.
+        """
+        job = UploadJob()
+        self._add_job(job)
+        decoder = MultipartDecoder(boundary.encode("latin-1"))
+        current = None
+        try:
+            while True:
+                chunk = stream.read(READ_SIZE)
+                decoder.receive_data(chunk or None)
+                event = decoder.next_event()
+                while not isinstance(event, (NeedData, Epilogue)):
+                    if isinstance(event, File):
+                        current = None
+                        if event.filename:
+                            current = FileUpload(self, job, event.filename, event.name)
+                            job.files.append(current)
+                    elif isinstance(event, Data) and current is not None:
+                        current.write(event.data)
+                        if not event.more_data:
+                            current.close()
+                            current = None
+                    event = decoder.next_event()
+                if not chunk or isinstance(event, Epilogue):
+                    break
+        except Exception as e:
+            job.error = str(e)
+            if current is not None:
+                current.fail(e)
+                current.close()
+            raise
+        finally:
+            job._body_received()
+        if current is not None:
+            current.fail("Request body ended inside a file")
+            current.close()
+        return job
+
+    def get_job(self, job_id):
+        """
+        Returns the job with the given id, or None if it is unknown or expired.
+        """
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def _add_job(self, job):
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+            for job_id in list(self.jobs):
+                if len(self.jobs) <= MAX_JOBS:
+                    break
+                if self.jobs[job_id].finished.is_set():
+                    del self.jobs[job_id]
+
+    def shutdown(self):
+        """
+        Waits for every pending part and stops the worker threads.
+        """
+        self._executor.shutdown(wait=True)
@@ -1,49 +1,486 @@
-import mrd
+"""
+Module: read_mrdfile.py
+
+Description:
+This module extracts the metadata of an uploaded MRD (ISMRM raw data, mrd-python binary) stream
+and indexes its stream items in a single pass. The index records the type and byte offset of
+every item along with acquisition and image counts, and is stored next to the file, so later
+reads can seek straight to one image without decoding the stream again.
+
+Functions:
+- check_mrd_internals(): Fails clearly when mrd-python lacks the internals used here.
+- header_metadata(header): Fields of the MRD header used by the MRD file database.
+- buffered_stream(stream, buffer_size): Buffered reader over any readable stream.
+- index_mrd_stream(stream): Reads the header and indexes every stream item in one pass.
+- index_mrd_file(path): Loads the persisted index of a file, building and saving it if stale.
+- read_stream_item(stream, offset): Decodes the stream item starting at a byte offset.
+- read_image(path, image_number, index): Decodes one image of a file through its index.
+- mrd_record(index, ...): Builds a db_mrd entry from an index.
+
+Usage:
+    cd server
+    python -m mrds.read_mrdfile test_mrd.bin
+"""
+
+import io
+import json
 import os
-import datetime
-
-filename = 'test_mrd.bin'
-
-with mrd.BinaryMrdReader(filename) as r:
-    h = r.read_header()
-    
-    # fields to be set by reading mrd file upon upload
-    measurement_id = h.measurement_information.measurement_id    # primary key on DynamoDB
-    study_date = h.study_information.study_date
-    vendor = h.acquisition_system_information.system_vendor
-    model = h.acquisition_system_information.system_model
-    field_strength = h.acquisition_system_information.system_field_strength_t
-    scanner_type = vendor+'-'+model+'-'+str(field_strength)+'T'
-    file_size = os.stat(filename).st_size   # file size in bytes
-
-    print(measurement_id)
-    print(study_date)
-    print(scanner_type)
-    print(file_size)
-
-    data_stream = r.read_data()
-    for item in data_stream:
-        if isinstance(item, (mrd.StreamItem.ImageComplexDouble,
-                             mrd.StreamItem.ImageComplexFloat,
-                             mrd.StreamItem.ImageDouble,
-                             mrd.StreamItem.ImageFloat,
-                             mrd.StreamItem.ImageInt,
-                             mrd.StreamItem.ImageUint,
-                             mrd.StreamItem.ImageUint16,
-                             mrd.StreamItem.ImageInt16)):
-            # if an image already exists, encode that to imagedb on dynamoDB
-            if item.value is None:
-                print(item.value)
-                continue
-            else:
-                pass
-                # encode image to dynamoDB 
-                # update number of recon images on MRD-db
-
-    # fields to be set with manual input
-    # 
-    # subject_type: human or animal
-    # operator_name
-    # subject_id
-    # constrast_agent
-    # project_name: save project name in db_project on dynamoDB
\ No newline at end of file
+import sys
+from datetime import date as calendar_date
+from importlib import metadata
+
+import mrd
+from mrd import _binary
+from mrd import binary as mrd_binary
+
+INDEX_VERSION = 1
+# The index of <file> is stored as <file>.index.json
+INDEX_SUFFIX = ".index.json"
+# Read buffer used for non-buffered streams such as S3 object bodies
+READ_BUFFER_SIZE = 1024 * 1024
+
+# mrd-python has no public API to decode one stream item or to locate items in a
+# stream, so this module uses internals of mrd-python 2.0 (pinned in requirements.txt):
+# the _binary serializers and CodedInputStream, a reader's _stream and a coded
+# stream's _last_read_count and _offset. They are only touched through
+# STREAM_ITEM_SERIALIZER, coded_stream_of, stream_position and read_stream_item,
+# and check_mrd_internals fails clearly at import when they are missing.
+MRD_BINARY_NAMES = (
+    "CodedInputStream",
+    "UnionSerializer",
+    "uint16_serializer",
+    "int16_serializer",
+    "uint32_serializer",
+    "int32_serializer",
+    "float32_serializer",
+    "float64_serializer",
+    "complexfloat32_serializer",
+    "complexfloat64_serializer",
+)
+CODED_STREAM_NAMES = ("_last_read_count", "_offset", "read_unsigned_varint")
+
+
+def mrd_version():
+    try:
+        return metadata.version("mrd-python")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def check_mrd_internals():
+    """
+    Checks that the installed mrd-python provides the internals this module uses.
+
+    Raises:
+        ImportError: If any of them is missing.
+    """
+    missing = [
+        f"mrd._binary.{name}" for name in MRD_BINARY_NAMES if not hasattr(_binary, name)
+    ]
+    if not missing:
+        coded_stream = _binary.CodedInputStream(io.BytesIO())
+        missing = [
+            f"CodedInputStream.{name}"
+            for name in CODED_STREAM_NAMES
+            if not hasattr(coded_stream, name)
+        ]
+    if missing:
+        raise ImportError(
+            f"mrds.read_mrdfile requires mrd-python 2.0 (pinned in requirements.txt); "
+            f"mrd-python {mrd_version()} lacks {', '.join(missing)}"
+        )
+
+
+check_mrd_internals()
+
+# Stream item cases in the order of the binary union tags; mirrors
+# mrd.BinaryMrdReader._read_data for the mrd-python 2.0 schema
+STREAM_ITEM_CASES = [
+    ("Acquisition", mrd.StreamItem.Acquisition, mrd_binary.AcquisitionSerializer()),
+    (
+        "WaveformUint32",
+        mrd.StreamItem.WaveformUint32,
+        mrd_binary.WaveformSerializer(_binary.uint32_serializer),
+    ),
+    (
+        "ImageUint16",
+        mrd.StreamItem.ImageUint16,
+        mrd_binary.ImageSerializer(_binary.uint16_serializer),
+    ),
+    (
+        "ImageInt16",
+        mrd.StreamItem.ImageInt16,
+        mrd_binary.ImageSerializer(_binary.int16_serializer),
+    ),
+    (
+        "ImageUint",
+        mrd.StreamItem.ImageUint,
+        mrd_binary.ImageSerializer(_binary.uint32_serializer),
+    ),
+    (
+        "ImageInt",
+        mrd.StreamItem.ImageInt,
+        mrd_binary.ImageSerializer(_binary.int32_serializer),
+    ),
+    (
+        "ImageFloat",
+        mrd.StreamItem.ImageFloat,
+        mrd_binary.ImageSerializer(_binary.float32_serializer),
+    ),
+    (
+        "ImageDouble",
+        mrd.StreamItem.ImageDouble,
+        mrd_binary.ImageSerializer(_binary.float64_serializer),
+    ),
+    (
+        "ImageComplexFloat",
+        mrd.StreamItem.ImageComplexFloat,
+        mrd_binary.ImageSerializer(_binary.complexfloat32_serializer),
+    ),
+    (
+        "ImageComplexDouble",
+        mrd.StreamItem.ImageComplexDouble,
+        mrd_binary.ImageSerializer(_binary.complexfloat64_serializer),
+    ),
+]
+ITEM_TYPES = [name for name, _, _ in STREAM_ITEM_CASES]
+STREAM_ITEM_SERIALIZER = _binary.UnionSerializer(
+    mrd.StreamItem, [(case, serializer) for _, case, serializer in STREAM_ITEM_CASES]
+)
+ITEM_TYPE_CODES = {case: code for code, (_, case, _) in enumerate(STREAM_ITEM_CASES)}
+IMAGE_ITEM_TYPES = tuple(
+    case for name, case, _ in STREAM_ITEM_CASES if name.startswith("Image")
+)
+
+
+class RawStreamReader(io.RawIOBase):
+    """
+    Adapts an object with a read(size) method, such as an S3 get_object body, to a raw stream.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def buffered_stream(stream, buffer_size=READ_BUFFER_SIZE):
+    """
+    Wraps a stream in a buffered reader unless it already is one.
+
+    The mrd decoder treats a short read as the end of the stream, so network
+    streams that may return fewer bytes than requested must go through a
+    buffered reader, which keeps reading until the request is filled.
+
+    Args:
+        stream: Readable binary stream.
+        buffer_size (int): Size of the read buffer in bytes.
+
+    Returns:
+        io.BufferedIOBase: A buffered stream.
+    """
+    if isinstance(stream, io.BufferedIOBase):
+        return stream
+    return io.BufferedReader(RawStreamReader(stream), buffer_size)
+
+
+class CountingReader(io.BufferedIOBase):
+    """
+    Read-only buffered stream wrapper that counts the bytes read from the underlying stream.
+
+    Works for local files as well as non-seekable streams such as an S3
+    get_object body, and reports the count through tell().
+    """
+
+    def __init__(self, stream):
+        self._stream = buffered_stream(stream)
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = self._stream.read1(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._stream.readinto(buffer)
+        self.bytes_read += count
+        return count
+
+    def tell(self):
+        return self.bytes_read
+
+
+def coded_stream_of(reader):
+    """
+    Returns the CodedInputStream an mrd.BinaryMrdReader decodes from.
+
+    Raises:
+        RuntimeError: If the reader does not expose it.
+    """
+    coded_stream = getattr(reader, "_stream", None)
+    if not isinstance(coded_stream, _binary.CodedInputStream):
+        raise RuntimeError(
+            f"mrd-python {mrd_version()} readers have no CodedInputStream _stream; "
+            "mrds.read_mrdfile requires mrd-python 2.0"
+        )
+    return coded_stream
+
+
+def stream_position(coded_stream, counting_reader):
+    """
+    Returns the absolute offset of the next byte an mrd CodedInputStream will decode.
+    """
+    buffered = coded_stream._last_read_count - coded_stream._offset
+    return counting_reader.tell() - buffered
+
+
+def header_metadata(header):
+    """
+    Extracts the fields of an MRD header used by the MRD file database.
+
+    Args:
+        header (mrd.Header or None): The stream header.
+
+    Returns:
+        dict: measurementId, studyDate (ISO date), vendor, model, fieldStrength,
+        scannerType ("<vendor>-<model>-<field strength>T") and institution;
+        missing fields are None.
+    """
+    measurement = header.measurement_information if header else None
+    study = header.study_information if header else None
+    system = header.acquisition_system_information if header else None
+
+    vendor = system.system_vendor if system else None
+    model = system.system_model if system else None
+    field_strength = system.system_field_strength_t if system else None
+    scanner_type = None
+    if vendor or model or field_strength is not None:
+        scanner_type = f"{vendor}-{model}-{field_strength}T"
+    study_date = study.study_date if study else None
+    return {
+        "measurementId": measurement.measurement_id if measurement else None,
+        "studyDate": study_date.isoformat() if study_date else None,
+        "vendor": vendor,
+        "model": model,
+        "fieldStrength": field_strength,
+        "scannerType": scanner_type,
+        "institution": system.institution_name if system else None,
+    }
+
+
+def index_mrd_stream(stream):
+    """
+    Reads the header of an MRD stream and indexes every stream item in one pass.
+
+    Items are decoded one at a time and discarded, so memory use does not grow
+    with the size of the stream. Images also record their shape and counters.
+
+    Args:
+        stream: Readable binary stream positioned at the start of the MRD data,
+            such as an open file or an S3 get_object body; it does not need to be
+            seekable.
+
+    Returns:
+        dict: version, size, header (see header_metadata), itemTypes, items
+        (parallel "type" codes into itemTypes and byte "offset" lists), counts per
+        item type, images (one entry per image item), acquisitionsCount,
+        imagesCount and reconImagesCount.
+    """
+    counting_reader = CountingReader(stream)
+    reader = mrd.BinaryMrdReader(counting_reader)
+    header = reader.read_header()
+    coded_stream = coded_stream_of(reader)
+
+    item_types = []
+    offsets = []
+    counts = dict.fromkeys(ITEM_TYPES, 0)
+    images = []
+    recon_images = 0
+    # Items are written in blocks, each preceded by its item count; 0 ends the stream
+    while (block_size := coded_stream.read_unsigned_varint()) > 0:
+        for _ in range(block_size):
+            offset = stream_position(coded_stream, counting_reader)
+            item = STREAM_ITEM_SERIALIZER.read(coded_stream)
+            type_code = ITEM_TYPE_CODES[type(item)]
+            item_types.append(type_code)
+            offsets.append(offset)
+            counts[ITEM_TYPES[type_code]] += 1
+
+            if isinstance(item, IMAGE_ITEM_TYPES):
+                image = item.value
+                if image is not None:
+                    recon_images += 1
+                images.append(
+                    {
+                        "item": len(offsets) - 1,
+                        "offset": offset,
+                        "type": ITEM_TYPES[type_code],
+                        "shape": None if image is None else list(image.data.shape),
+                        "imageIndex": None if image is None else image.image_index,
+                        "seriesIndex": (
+                            None if image is None else image.image_series_index
+                        ),
+                        "slice": None if image is None else image.slice,
+                    }
+                )
+
+    return {
+        "version": INDEX_VERSION,
+        "size": stream_position(coded_stream, counting_reader),
+        "header": header_metadata(header),
+        "itemTypes": ITEM_TYPES,
+        "items": {"type": item_types, "offset": offsets},
+        "counts": counts,
+        "images": images,
+        "acquisitionsCount": counts["Acquisition"],
+        "imagesCount": len(images),
+        "reconImagesCount": recon_images,
+    }
+
+
+def index_path(path):
+    """
+    Returns the path of the index persisted next to an MRD file.
+    """
+    return path + INDEX_SUFFIX
+
+
+def index_mrd_file(path):
+    """
+    Returns the index of an MRD file, building and persisting it when missing or stale.
+
+    A stored index is reused while its version and the file size and
+    modification time it was built from still match.
+
+    Args:
+        path (str): Path of the MRD file.
+
+    Returns:
+        dict: The index (see index_mrd_stream), with the file's "mtimeNs".
+    """
+    stat = os.stat(path)
+    try:
+        with open(index_path(path)) as index_file:
+            index = json.load(index_file)
+        if (
+            index.get("version") == INDEX_VERSION
+            and index.get("size") == stat.st_size
+            and index.get("mtimeNs") == stat.st_mtime_ns
+        ):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    with open(path, "rb") as mrd_file:
+        index = index_mrd_stream(mrd_file)
+    index["size"] = stat.st_size
+    index["mtimeNs"] = stat.st_mtime_ns
+    try:
+        with open(index_path(path), "w") as index_file:
+            json.dump(index, index_file)
+    except OSError:
+        pass
+    return index
+
+
+def read_stream_item(stream, offset):
+    """
+    Decodes the stream item that starts at a byte offset of a seekable MRD stream.
+
+    Args:
+        stream: Seekable binary stream of the MRD data.
+        offset (int): Offset recorded in the index.
+
+    Returns:
+        mrd.StreamItem: The decoded item.
+    """
+    stream.seek(offset)
+    return STREAM_ITEM_SERIALIZER.read(_binary.CodedInputStream(stream))
+
+
+def read_image(path, image_number, index=None):
+    """
+    Decodes one image of an MRD file by seeking to the offset stored in its index.
+
+    Args:
+        path (str): Path of the MRD file.
+        image_number (int): Position of the image among the image items.
+        index (dict, optional): Index of the file; loaded with index_mrd_file when None.
+
+    Returns:
+        mrd.Image: The decoded image.
+
+    Raises:
+        IndexError: If the file holds fewer images.
+    """
+    index = index_mrd_file(path) if index is None else index
+    if not 0 <= image_number < len(index["images"]):
+        raise IndexError(
+            f"image {image_number} out of range [0, {len(index['images'])})"
+        )
+    with open(path, "rb") as mrd_file:
+        return read_stream_item(mrd_file, index["images"][image_number]["offset"]).value
+
+
+def mrd_record(index, record_id, name, owner, date=None):
+    """
+    Builds an entry of the MRD file database from an index.
+
+    Args:
+        index (dict): Index of the file (see index_mrd_stream).
+        record_id (int): Database id.
+        name (str): Display name.
+        owner (str): Owner of the upload.
+        date (str, optional): Display date; the study date when None, or
+            today when the header has none.
+
+    Returns:
+        dict: Entry in the db_mrd format, with reconImagesCount filled in.
+    """
+    header = index["header"]
+    return {
+        "id": record_id,
+        "name": name,
+        "date": date or header["studyDate"] or calendar_date.today().isoformat(),
+        "owner": owner,
+        "reconImagesCount": index["reconImagesCount"],
+        "isSelected": False,
+        "parameter": "Add Parameter Info",
+        "raw": {
+            "description": "Raw data description",
+            "scanned_time": header["studyDate"],
+            "institution": header["institution"],
+            "machine_vendor": header["vendor"],
+        },
+        "image": index["imagesCount"] > 0,
+        "aux": False,
+        "reconstructed": index["reconImagesCount"] > 0,
+        "measurementId": header["measurementId"],
+        "scannerType": header["scannerType"],
+        "size": index["size"],
+    }
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else "test_mrd.bin"
+    index = index_mrd_file(filename)
+    print(json.dumps(index["header"], indent=2))
+    print(
+        f"{len(index['items']['offset'])} stream items: "
+        f"{index['acquisitionsCount']} acquisitions, {index['imagesCount']} images "
+        f"({index['reconImagesCount']} reconstructed), {index['size']} bytes"
+    )
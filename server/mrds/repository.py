@@ -0,0 +1,715 @@
+"""
+Module: repository.py
+
+Description:
+This module stores the MRD file, image and simulator records in SQLite and exposes them through
+one repository per collection. Each record is kept as a JSON document next to indexed columns
+for the fields the API filters and sorts on (id, owner, date, sequence, vendor, ...), so
+lookups, filters and paginated listings use indexes instead of scanning every record.
+
+Classes:
+- Collection: Schema of one record collection (indexed columns, sort keys and filters).
+- Repository: Queries and mutations on one collection.
+- MetadataStore: SQLite database holding every collection, seeded from data.py when empty.
+
+Functions:
+- normalize_date(value): Sortable ISO form of the dates used by the records.
+- encode_cursor(sort, descending, position): Opaque token for keyset pagination.
+- decode_cursor(token): Inverse of encode_cursor.
+"""
+
+import base64
+import binascii
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+
+DATABASE_PATH = os.environ.get(
+    "MRDS_DATABASE",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "metadata.sqlite3"),
+)
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+def normalize_date(value):
+    """
+    Converts a "YYYY-M-D" date string to a sortable "YYYY-MM-DD" string.
+
+    Args:
+        value (str or None): Date as stored in the records.
+
+    Returns:
+        str or None: The ISO date, or the value unchanged if it is not a date.
+    """
+    if not value:
+        return None
+    try:
+        year, month, day = (int(part) for part in str(value)[:10].split("-"))
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return str(value)
+
+
+def encode_cursor(sort, descending, position):
+    """
+    Encodes the position after the last record of a page as an opaque cursor.
+
+    Args:
+        sort (str): API sort key of the listing.
+        descending (bool): Sort order of the listing.
+        position (tuple): (sort column value, id) of the last record.
+
+    Returns:
+        str: URL-safe cursor token.
+    """
+    payload = json.dumps([sort, descending, list(position)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Decodes a cursor produced by encode_cursor.
+
+    Returns:
+        tuple: (sort, descending, position).
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort, descending, position = json.loads(base64.urlsafe_b64decode(padded))
+        value, record_id = position
+        return sort, bool(descending), (value, int(record_id))
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class Collection:
+    """
+    Schema of one record collection.
+
+    Attributes:
+        table (str): SQLite table name.
+        columns (dict): Indexed column name -> (SQL type, function extracting it from a record).
+        sort_keys (dict): API sort key -> column.
+        filters (dict): API filter name -> (SQL condition with one placeholder, value parser).
+        indexes (list of tuple): Column tuples indexed in addition to every single column.
+    """
+
+    def __init__(
+        self, table, columns, sort_keys, filters, indexes=(("owner", "date"),)
+    ):
+        self.table = table
+        self.columns = columns
+        self.sort_keys = sort_keys
+        self.filters = filters
+        self.indexes = [(name,) for name in columns] + list(indexes)
+
+    def row(self, record):
+        """
+        Returns the indexed column values of a record, in column order.
+        """
+        return [extract(record) for _, extract in self.columns.values()]
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return int(value.lower() in ("1", "true", "yes"))
+    return int(bool(value))
+
+
+COMMON_FILTERS = {
+    "owner": ("owner = ?", str),
+    "dateFrom": ("date >= ?", normalize_date),
+    "dateTo": ("date <= ?", normalize_date),
+    # Case-insensitive search over name, owner and date
+    "q": (
+        "instr(lower(coalesce(name, '') || ' ' || coalesce(owner, '') || ' ' "
+        "|| coalesce(date, '')), lower(?)) > 0",
+        str,
+    ),
+}
+
+MRD_FILES = Collection(
+    "mrd_files",
+    {
+        "name": ("TEXT", lambda record: record.get("name")),
+        "date": ("TEXT", lambda record: normalize_date(record.get("date"))),
+        "owner": ("TEXT", lambda record: record.get("owner")),
+        "vendor": (
+            "TEXT",
+            lambda record: (record.get("raw") or {}).get("machine_vendor"),
+        ),
+        "reconstructed": (
+            "INTEGER",
+            lambda record: int(bool(record.get("reconstructed"))),
+        ),
+        "recon_images_count": (
+            "INTEGER",
+            lambda record: record.get("reconImagesCount"),
+        ),
+    },
+    {
+        "id": "id",
+        "name": "name",
+        "date": "date",
+        "owner": "owner",
+        "vendor": "vendor",
+        "reconImagesCount": "recon_images_count",
+    },
+    dict(
+        COMMON_FILTERS,
+        vendor=("vendor = ?", str),
+        reconstructed=("reconstructed = ?", parse_bool),
+    ),
+    # Covers the table filters combined with the owner, including their counts
+    indexes=[
+        ("owner", "date"),
+        ("owner", "vendor", "reconstructed", "date"),
+        ("vendor", "reconstructed", "date"),
+    ],
+)
+
+IMAGES = Collection(
+    "images",
+    {
+        "name": ("TEXT", lambda record: record.get("name")),
+        "date": ("TEXT", lambda record: normalize_date(record.get("date"))),
+        "owner": ("TEXT", lambda record: record.get("owner")),
+        "sequence_id": ("INTEGER", lambda record: record.get("sequence_id")),
+    },
+    {
+        "id": "id",
+        "name": "name",
+        "date": "date",
+        "owner": "owner",
+        "sequence_id": "sequence_id",
+    },
+    dict(COMMON_FILTERS, sequence_id=("sequence_id = ?", int)),
+)
+
+SIMULATORS = Collection(
+    "simulators",
+    {
+        "name": ("TEXT", lambda record: record.get("name")),
+        "date": ("TEXT", lambda record: normalize_date(record.get("date"))),
+        "owner": ("TEXT", lambda record: record.get("owner")),
+        "sequence": ("TEXT", lambda record: record.get("sequence")),
+    },
+    {
+        "id": "id",
+        "name": "name",
+        "date": "date",
+        "owner": "owner",
+        "sequence": "sequence",
+    },
+    dict(COMMON_FILTERS, sequence=("sequence = ?", str)),
+)
+
+
+class Repository:
+    """
+    Queries and mutations on one collection of a MetadataStore.
+    """
+
+    def __init__(self, store, collection):
+        self.store = store
+        self.collection = collection
+
+    def get(self, record_id):
+        """
+        Returns the record with the given id, or None.
+        """
+        row = (
+            self.store.connection()
+            .execute(
+                f"SELECT record FROM {self.collection.table} WHERE id = ?", (record_id,)
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def where(self, filters):
+        """
+        Builds the WHERE clause and parameters for a dict of API filters.
+
+        Raises:
+            ValueError: If a filter is unknown or its value cannot be parsed.
+        """
+        conditions = []
+        parameters = []
+        for name, value in (filters or {}).items():
+            if name not in self.collection.filters:
+                raise ValueError(f"Unknown filter '{name}'")
+            condition, parse = self.collection.filters[name]
+            conditions.append(condition)
+            parameters.append(parse(value))
+        clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return clause, parameters
+
+    def order_by(self, sort, descending):
+        """
+        Builds the ORDER BY clause for an API sort key; ties are broken by id.
+
+        Raises:
+            ValueError: If the sort key is unknown.
+        """
+        if sort not in self.collection.sort_keys:
+            raise ValueError(f"Unknown sort key '{sort}'")
+        direction = "DESC" if descending else "ASC"
+        column = self.collection.sort_keys[sort]
+        if column == "id":
+            return f" ORDER BY id {direction}"
+        return f" ORDER BY {column} {direction}, id {direction}"
+
+    def after(self, sort, descending, position):
+        """
+        Builds the keyset condition selecting the records after a cursor position.
+
+        Records are ordered by (sort column, id); NULL sort values come first in
+        ascending order, as in SQLite.
+
+        Returns:
+            tuple: (SQL condition, parameters).
+        """
+        column = self.collection.sort_keys[sort]
+        value, record_id = position
+        comparison = "<" if descending else ">"
+        if column == "id":
+            return f"id {comparison} ?", [record_id]
+        if value is None:
+            if descending:
+                return f"({column} IS NULL AND id < ?)", [record_id]
+            return (
+                f"(({column} IS NULL AND id > ?) OR {column} IS NOT NULL)",
+                [record_id],
+            )
+        # Row values let SQLite seek the (column, id) position in the index
+        condition = f"({column}, id) {comparison} (?, ?)"
+        if descending:
+            condition = f"({condition} OR {column} IS NULL)"
+        return condition, [value, record_id]
+
+    def position(self, record, sort):
+        """
+        Returns the (sort column value, id) position of a record in a listing.
+        """
+        column = self.collection.sort_keys[sort]
+        if column == "id":
+            return (record["id"], record["id"])
+        return (self.collection.columns[column][1](record), record["id"])
+
+    def list(
+        self,
+        filters=None,
+        sort="id",
+        descending=False,
+        limit=None,
+        offset=0,
+        after=None,
+    ):
+        """
+        Returns the records matching the filters, sorted and paginated in SQL.
+
+        Args:
+            filters (dict, optional): API filter name -> value.
+            sort (str): API sort key.
+            descending (bool): Sort order.
+            limit (int, optional): Maximum number of records; all when None.
+            offset (int): Number of matching records to skip.
+            after (tuple, optional): Keyset position (see position()); only
+                records after it are returned.
+
+        Returns:
+            tuple: (list of records, total number of matching records, whether
+            more records follow the returned ones).
+        """
+        where, parameters = self.where(filters)
+        order_by = self.order_by(sort, descending)
+        query = f"SELECT record FROM {self.collection.table}{where}"
+        page_parameters = list(parameters)
+        if after is not None:
+            condition, after_parameters = self.after(sort, descending, after)
+            query += f" AND {condition}" if where else f" WHERE {condition}"
+            page_parameters += after_parameters
+        query += order_by
+        if limit is not None or offset:
+            # One extra row tells whether another page follows
+            query += " LIMIT ? OFFSET ?"
+            page_parameters += [-1 if limit is None else int(limit) + 1, int(offset)]
+        connection = self.store.connection()
+        records = [
+            json.loads(row[0]) for row in connection.execute(query, page_parameters)
+        ]
+        has_more = limit is not None and len(records) > limit
+        if has_more:
+            records = records[:limit]
+        if limit is None and not offset and after is None:
+            return records, len(records), False
+        total = connection.execute(
+            f"SELECT COUNT(*) FROM {self.collection.table}{where}", parameters
+        ).fetchone()[0]
+        return records, total, has_more
+
+    def version(self):
+        """
+        Returns a counter that changes whenever a record of the collection changes.
+        """
+        row = (
+            self.store.connection()
+            .execute(
+                "SELECT version FROM collection_versions WHERE name = ?",
+                (self.collection.table,),
+            )
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def _touch(self, connection):
+        connection.execute(
+            "UPDATE collection_versions SET version = version + 1 WHERE name = ?",
+            (self.collection.table,),
+        )
+
+    def insert(self, record):
+        """
+        Inserts or replaces a record; an id is assigned when the record has none.
+
+        Returns:
+            dict: The stored record.
+        """
+        with self.store.transaction() as connection:
+            self._touch(connection)
+            return self._insert(connection, record)
+
+    def _insert(self, connection, record):
+        columns = list(self.collection.columns)
+        if record.get("id") is None:
+            record_id = connection.execute(
+                f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self.collection.table}"
+            ).fetchone()[0]
+            record = dict(record, id=record_id)
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.collection.table} "
+            f"(id, record, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+            [record["id"], json.dumps(record)] + self.collection.row(record),
+        )
+        return record
+
+    def update(self, record_id, update):
+        """
+        Applies a function to a stored record and saves the result.
+
+        Args:
+            record_id (int): Id of the record.
+            update (callable): Receives the record dict and modifies it in place.
+
+        Returns:
+            dict or None: The updated record, or None if there is no such record.
+        """
+        with self.store.transaction() as connection:
+            row = connection.execute(
+                f"SELECT record FROM {self.collection.table} WHERE id = ?",
+                (record_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            update(record)
+            record["id"] = record_id
+            self._touch(connection)
+            return self._insert(connection, record)
+
+    def _select_targets(self, connection, record_ids=None, filters=None):
+        """
+        Fills the temporary target_ids table with the ids of the records a bulk
+        mutation applies to: the requested ids that exist and match the filters.
+
+        Membership is resolved in SQL through primary keys, so the cost grows
+        linearly with the number of requested and matching ids.
+
+        Returns:
+            list: Ids of the targeted records, in ascending order.
+        """
+        where, parameters = self.where(filters)
+        connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS target_ids (id INTEGER PRIMARY KEY)"
+        )
+        connection.execute("DELETE FROM target_ids")
+        query = f"INSERT INTO target_ids SELECT id FROM {self.collection.table}{where}"
+        if record_ids is not None:
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS requested_ids (id INTEGER PRIMARY KEY)"
+            )
+            connection.execute("DELETE FROM requested_ids")
+            connection.executemany(
+                "INSERT OR IGNORE INTO requested_ids (id) VALUES (?)",
+                ((record_id,) for record_id in record_ids),
+            )
+            query += " AND " if where else " WHERE "
+            query += "id IN (SELECT id FROM requested_ids)"
+        connection.execute(query, parameters)
+        return [
+            row[0]
+            for row in connection.execute("SELECT id FROM target_ids ORDER BY id")
+        ]
+
+    @staticmethod
+    def _outcomes(record_ids, targets, status):
+        """
+        Returns the per-id outcomes of a bulk mutation: every requested id (or,
+        for filter-only mutations, every targeted id) with its status.
+        """
+        if record_ids is None:
+            return [{"id": record_id, "status": status} for record_id in targets]
+        found = set(targets)
+        return [
+            {"id": record_id, "status": status if record_id in found else "not_found"}
+            for record_id in dict.fromkeys(record_ids)
+        ]
+
+    def delete(self, record_ids):
+        """
+        Deletes the records with the given ids.
+
+        Returns:
+            int: Number of records deleted.
+        """
+        return len(self.delete_many(record_ids)[1])
+
+    def delete_many(self, record_ids=None, filters=None):
+        """
+        Atomically deletes the records with the given ids that match the filters.
+
+        Args:
+            record_ids (iterable of int, optional): Ids to delete; all matching
+                records when None.
+            filters (dict, optional): API filters the records must match.
+
+        Returns:
+            tuple: (per-id outcomes with status "deleted" or "not_found",
+            list of deleted ids).
+
+        Raises:
+            ValueError: If a filter is unknown or its value cannot be parsed.
+        """
+        record_ids = None if record_ids is None else list(record_ids)
+        with self.store.transaction() as connection:
+            targets = self._select_targets(connection, record_ids, filters)
+            if targets:
+                connection.execute(
+                    f"DELETE FROM {self.collection.table} "
+                    f"WHERE id IN (SELECT id FROM target_ids)"
+                )
+                self._touch(connection)
+        return self._outcomes(record_ids, targets, "deleted"), targets
+
+    def update_many(self, update, record_ids=None, filters=None):
+        """
+        Atomically applies a function to the records with the given ids that
+        match the filters; either every record is saved or none is.
+
+        Args:
+            update (callable): Receives each record dict and modifies it in place.
+            record_ids (iterable of int, optional): Ids to update; all matching
+                records when None.
+            filters (dict, optional): API filters the records must match.
+
+        Returns:
+            tuple: (per-id outcomes with status "updated" or "not_found",
+            list of updated ids).
+
+        Raises:
+            ValueError: If a filter is unknown or its value cannot be parsed.
+        """
+        record_ids = None if record_ids is None else list(record_ids)
+        columns = list(self.collection.columns)
+        with self.store.transaction() as connection:
+            targets = self._select_targets(connection, record_ids, filters)
+            rows = []
+            for record_id, document in connection.execute(
+                f"SELECT id, record FROM {self.collection.table} "
+                f"WHERE id IN (SELECT id FROM target_ids)"
+            ).fetchall():
+                record = json.loads(document)
+                update(record)
+                record["id"] = record_id
+                rows.append(
+                    [record_id, json.dumps(record)] + self.collection.row(record)
+                )
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {self.collection.table} "
+                f"(id, record, {', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+                rows,
+            )
+            if rows:
+                self._touch(connection)
+        return self._outcomes(record_ids, targets, "updated"), targets
+
+    def count(self):
+        """
+        Returns the number of records in the collection.
+        """
+        return (
+            self.store.connection()
+            .execute(f"SELECT COUNT(*) FROM {self.collection.table}")
+            .fetchone()[0]
+        )
+
+
+class MetadataStore:
+    """
+    SQLite database holding the MRD file, image and simulator collections.
+
+    Each thread uses its own connection. File databases use write-ahead
+    logging, so readers do not block while a write is in progress.
+
+    Attributes:
+        path (str): Database path, or ":memory:" for a private in-memory database.
+        mrd_files (Repository): MRD file records.
+        images (Repository): Image records.
+        simulators (Repository): Simulator records.
+    """
+
+    COLLECTIONS = (MRD_FILES, IMAGES, SIMULATORS)
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # An in-memory database exists once per connection, so share one
+        self._shared = None
+        if path == ":memory:":
+            self._shared = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+        self.mrd_files = Repository(self, MRD_FILES)
+        self.images = Repository(self, IMAGES)
+        self.simulators = Repository(self, SIMULATORS)
+        self.create_schema()
+
+    def connection(self):
+        """
+        Returns the SQLite connection of the calling thread.
+        """
+        if self._shared is not None:
+            return self._shared
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode; writes open explicit transactions
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA optimize")
+            self._local.connection = connection
+        return connection
+
+    def transaction(self):
+        """
+        Returns a context manager running its block in one write transaction.
+        """
+        return Transaction(self)
+
+    def create_schema(self):
+        """
+        Creates the tables and indexes that do not exist yet.
+        """
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS collection_versions "
+                "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            # Markers of one-time setup steps, such as seeding
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS store_meta "
+                "(name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            for collection in self.COLLECTIONS:
+                connection.execute(
+                    "INSERT OR IGNORE INTO collection_versions VALUES (?, 0)",
+                    (collection.table,),
+                )
+                columns = ", ".join(
+                    f"{name} {sql_type}"
+                    for name, (sql_type, _) in collection.columns.items()
+                )
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {collection.table} "
+                    f"(id INTEGER PRIMARY KEY, record TEXT NOT NULL, {columns})"
+                )
+                for columns in collection.indexes:
+                    connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS "
+                        f"{collection.table}_{'_'.join(columns)} "
+                        f"ON {collection.table} ({', '.join(columns)}, id)"
+                    )
+
+    def seed(self, mrd_files=(), images=(), simulators=()):
+        """
+        Inserts the given records once, when the database is first created.
+
+        A "seeded" marker is stored with them, so collections emptied later
+        (for example by a bulk delete) stay empty across restarts. Databases
+        created before the marker existed are marked without being seeded
+        again unless all their collections are empty.
+
+        Returns:
+            bool: Whether the records were inserted.
+        """
+        with self.transaction() as connection:
+            if connection.execute(
+                "SELECT 1 FROM store_meta WHERE name = 'seeded'"
+            ).fetchone():
+                return False
+            connection.execute(
+                "INSERT INTO store_meta VALUES ('seeded', ?)",
+                (date.today().isoformat(),),
+            )
+            seeded = (
+                (self.mrd_files, mrd_files),
+                (self.images, images),
+                (self.simulators, simulators),
+            )
+            if any(
+                connection.execute(
+                    f"SELECT 1 FROM {repository.collection.table} LIMIT 1"
+                ).fetchone()
+                for repository, _ in seeded
+            ):
+                return False
+            for repository, records in seeded:
+                repository._touch(connection)
+                for record in records:
+                    repository._insert(connection, dict(record))
+        # Refresh the statistics the query planner uses to choose an index
+        self.connection().execute("ANALYZE")
+        return True
+
+
+class Transaction:
+    """
+    Context manager serializing writes of one store and committing them atomically.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        self.store._write_lock.acquire()
+        connection = self.store.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        connection = self.store.connection()
+        try:
+            connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self.store._write_lock.release()
+        return False
@@ -1,21 +1,24 @@
-from flask import Flask, jsonify, request, send_file, Blueprint
-from matplotlib import pyplot as plt
-from scipy.io import loadmat
+from flask import Flask, jsonify, make_response, request, send_file, Blueprint
 import os
 import io
-import matplotlib
+import hashlib
+import json
 from flask_cors import CORS
 import boto3
 
-# Set the non-GUI backend before importing pyplot
-matplotlib.use("Agg")
-
-# Temporary mock data
-# TODO: Replace with RDS Database for quick querying on file details
-# TODO: When uploading actual file to S3 Bucket, add to this database
+# Mock data seeds the metadata store the first time it is created; uploaded MRD
+# files are added to it once they are stored in S3 (see index_upload and record_upload)
 from data import db_mrd
 from data import db_image
 from data import db_simulator
+from mrds.ingest import UploadPipeline
+from mrds.repository import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    MetadataStore,
+    decode_cursor,
+    encode_cursor,
+)
 
 bp = Blueprint("mrds", __name__)
 # Apply CORS to the blueprint
@@ -23,6 +26,185 @@ CORS(bp, resources={r"/*": {"origins": "http://localhost:5173"}})
 # setup aws s3 client
 s3 = boto3.client("s3")
 BUCKET = "mrissim-app-user-content"
+# SQLite store with indexes on the fields the listings filter and sort on
+STORE = MetadataStore()
+STORE.seed(db_mrd, db_image, db_simulator)
+# Form field of the auxiliary files of an upload, which are not MRD streams
+AUX_FILES_FIELD = "auxFiles"
+
+
+def index_upload(upload, stream):
+    """
+    Indexes an uploaded MRD file from its bytes as they are received, as the
+    Lambda function does for objects written to the bucket.
+
+    Runs on the upload's reader thread. The mrd decoder is imported on the first
+    upload, not at server startup.
+
+    Args:
+        upload (mrds.ingest.FileUpload): The file being received.
+        stream (mrds.ingest.StreamTee): The bytes of the file.
+
+    Returns:
+        dict or None: The index (see index_mrd_stream); None for auxiliary files.
+    """
+    if upload.field == AUX_FILES_FIELD:
+        return None
+    from mrds.read_mrdfile import index_mrd_stream
+
+    return index_mrd_stream(stream)
+
+
+def record_upload(upload):
+    """
+    Stores the index of an uploaded MRD file next to it and adds its record to
+    the store, once the file is stored in S3.
+
+    Runs on the upload pool.
+
+    Args:
+        upload (mrds.ingest.FileUpload): The stored file.
+
+    Returns:
+        dict or None: The stored record; None for auxiliary files.
+    """
+    # Raises the error of index_upload, reported as the file's recordError
+    index = upload.read_result.result()
+    if index is None:
+        return None
+    from mrds.read_mrdfile import INDEX_SUFFIX, mrd_record
+
+    # The index is stored next to the object, as the Lambda function does
+    upload.pipeline.s3.put_object(
+        Bucket=upload.pipeline.bucket,
+        Key=upload.key + INDEX_SUFFIX,
+        Body=json.dumps(index),
+    )
+    return STORE.mrd_files.insert(mrd_record(index, None, upload.name, None))
+
+
+# Uploads stream from the request body into S3 multipart uploads in the background, and
+# are indexed from the same bytes
+INGEST = UploadPipeline(s3, BUCKET, on_stored=record_upload, read_stream=index_upload)
+
+
+def list_records(repository, fields, **filters):
+    # filters, sorting and pagination come from the query string and run in SQL:
+    # ?owner=&dateFrom=&dateTo=&q=&sort=date&order=desc&limit=50&offset=0&cursor=
+    args = request.args
+    # The listing only changes when the collection does, so clients revalidate
+    # with If-None-Match and get a 304 without the query running
+    etag = hashlib.sha1(
+        json.dumps(
+            [repository.collection.table, repository.version(), sorted(args.items())],
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    query_filters = {
+        name: value
+        for name, value in args.items()
+        if name in repository.collection.filters
+    }
+    query_filters.update(filters)
+    sort = args.get("sort", "id")
+    descending = args.get("order", "asc") == "desc"
+    try:
+        limit = args.get("limit", type=int)
+        if limit is not None and not 0 < limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        offset = args.get("offset", 0, type=int)
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        after = None
+        if "cursor" in args:
+            cursor_sort, cursor_descending, after = decode_cursor(args["cursor"])
+            if (cursor_sort, cursor_descending) != (sort, descending):
+                raise ValueError("cursor does not match sort and order")
+            if limit is None:
+                limit = DEFAULT_LIMIT
+        records, total, has_more = repository.list(
+            query_filters,
+            sort=sort,
+            descending=descending,
+            limit=limit,
+            offset=offset,
+            after=after,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    items = (
+        [{field: record.get(field) for field in fields} for record in records]
+        if fields
+        else records
+    )
+    if limit is None and not offset and after is None:
+        # Unpaginated requests keep returning the bare array
+        response = jsonify(items)
+    else:
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(
+                sort, descending, repository.position(records[-1], sort)
+            )
+        response = jsonify(
+            {
+                "items": items,
+                "totalCount": total,
+                "nextCursor": next_cursor,
+                "limit": limit,
+            }
+        )
+    response.headers["X-Total-Count"] = str(total)
+    response.set_etag(etag)
+    return response
+
+
+def bulk_selection():
+    # bulk mutations target {"ids": [...]}, {"filter": {...}} or both (the ids
+    # that match the filter); the filter uses the listing's query filters
+    body = request.get_json(silent=True) or {}
+    record_ids = body.get("ids")
+    filters = body.get("filter")
+    if record_ids is None and not filters:
+        raise ValueError("Provide ids or a filter")
+    if record_ids is not None:
+        if not isinstance(record_ids, list) or not record_ids:
+            raise ValueError("ids must be a non-empty list")
+        if not all(
+            isinstance(record_id, int) and not isinstance(record_id, bool)
+            for record_id in record_ids
+        ):
+            raise ValueError("ids must be integers")
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("filter must be an object")
+    return body, record_ids, filters
+
+
+def bulk_delete(repository, message):
+    try:
+        _, record_ids, filters = bulk_selection()
+        results, deleted = repository.delete_many(record_ids, filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"message": message, "deleted": len(deleted), "results": results})
+
+
+def tag_updater(new_tags):
+    def update_tags(file):
+        # Update the 'parameter' tag
+        file["parameter"] = new_tags.get("parameter", file.get("parameter"))
+
+        # Update the 'description' field inside 'raw'
+        if "raw" in file and isinstance(file["raw"], dict):
+            file["raw"]["description"] = new_tags.get(
+                "raw", file["raw"].get("description", "")
+            )
+
+    return update_tags
 
 
 # Root route just to test the server is running
@@ -34,6 +216,15 @@ def index():
 @bp.route("/plot-image", methods=["GET"])
 def plot_image():
     try:
+        # matplotlib and SciPy are only used here, so they are imported on the
+        # first request instead of at server startup
+        import matplotlib
+
+        # Set the non-GUI backend before importing pyplot
+        matplotlib.use("Agg")
+        from matplotlib import pyplot as plt
+        from scipy.io import loadmat
+
         # Load the proton image
         proton_matfile = "./mrds/test_image_matfiles/1115_first_measurement_dcm.mat"
         if not os.path.exists(proton_matfile):
@@ -72,27 +263,19 @@ def plot_image():
 @bp.route("/mrd-files", methods=["GET"])
 def show_files():
     # Transform the data to include only the specified fields
-    filtered_files = [
-        {
-            "id": file["id"],
-            "name": file["name"],
-            "date": file["date"],
-            "owner": file["owner"],
-            "reconImagesCount": file["reconImagesCount"],
-            "isSelected": file["isSelected"],
-        }
-        for file in db_mrd
-    ]
-    return jsonify(filtered_files)
+    return list_records(
+        STORE.mrd_files,
+        ["id", "name", "date", "owner", "reconImagesCount", "isSelected"],
+    )
 
 
 # Route to retrieve specific file details
 @bp.route("/mrd-files/<file_id>", methods=["GET"])
 def get_file_details(file_id):
     try:
-        # Convert file_id to an integer for comparison
+        # Convert file_id to an integer for the lookup
         file_id = int(file_id)
-        file_data = next((file for file in db_mrd if file["id"] == file_id), None)
+        file_data = STORE.mrd_files.get(file_id)
         if file_data:
             return jsonify(file_data)
         return jsonify({"error": "File not found"}), 404
@@ -107,58 +290,56 @@ def edit_file_tags(file_id):
     try:
         file_id = int(file_id)
         new_tags = request.json.get("tags")
-        for file in db_mrd:
-            if file["id"] == file_id:
-                # Update the 'parameter' tag
-                file["parameter"] = new_tags.get("parameter", file["parameter"])
-
-                # Update the 'description' field inside 'raw'
-                if "raw" in file and isinstance(file["raw"], dict):
-                    file["raw"]["description"] = new_tags.get(
-                        "raw", file["raw"].get("description", "")
-                    )
-
-                return jsonify({"message": "Tags updated successfully"})
-        return jsonify({"error": "File not found"}), 404
+
+        if STORE.mrd_files.update(file_id, tag_updater(new_tags)) is None:
+            return jsonify({"error": "File not found"}), 404
+        return jsonify({"message": "Tags updated successfully"})
     except ValueError:
         return jsonify({"error": "Invalid file ID"}), 400
 
 
+# Route to update the tags of many files in one atomic request
+@bp.route("/mrd-files/bulk-tag", methods=["POST"])
+def bulk_tag_files():
+    try:
+        body, record_ids, filters = bulk_selection()
+        new_tags = body.get("tags")
+        if not isinstance(new_tags, dict) or not new_tags:
+            raise ValueError("No tags provided")
+        results, updated = STORE.mrd_files.update_many(
+            tag_updater(new_tags), record_ids, filters
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(
+        {
+            "message": "Tags updated successfully",
+            "updated": len(updated),
+            "results": results,
+        }
+    )
+
+
 # Route to list Images
 @bp.route("/images", methods=["GET"])
 def show_images():
     # Transform the data to include only the specified fields
-    filtered_images = [
-        {
-            "id": image["id"],
-            "name": image["name"],
-            "date": image["date"],
-            "owner": image["owner"],
-            "sequence_id": image["sequence_id"],
-            "sequence": image["sequence"],
-            "isSelected": image["isSelected"],
-        }
-        for image in db_image
-    ]
-    return jsonify(filtered_images)
+    return list_records(
+        STORE.images,
+        ["id", "name", "date", "owner", "sequence_id", "sequence", "isSelected"],
+    )
 
 
 # Route to retrieve images by sequence_id
 @bp.route("/images/<int:sequence_id>", methods=["GET"])
 def get_images_by_sequence(sequence_id):
-    images = [image for image in db_image if image["sequence_id"] == sequence_id]
-    return jsonify(images)
+    return list_records(STORE.images, None, sequence_id=sequence_id)
 
 
+@bp.route("/images/bulk-delete", methods=["POST"])
 @bp.route("/images/delete", methods=["DELETE"])
 def delete_images():
-    global db_image
-    image_ids = request.json.get("ids", [])
-    if not image_ids:
-        return jsonify({"error": "No image IDs provided"}), 400
-
-    db_image = [image for image in db_image if image["id"] not in image_ids]
-    return jsonify({"message": "Images deleted successfully"}), 200
+    return bulk_delete(STORE.images, "Images deleted successfully")
 
 
 # Route to retrieve specific image file details
@@ -166,9 +347,7 @@ def delete_images():
 def get_image(image_id):
     try:
         image_id = int(image_id)
-        image_data = next(
-            (image for image in db_image if image["id"] == image_id), None
-        )
+        image_data = STORE.images.get(image_id)
         if image_data:
             return jsonify(image_data)
         return jsonify({"error": "Image not found"}), 404
@@ -186,35 +365,34 @@ def get_image_details(image_id):
 # Route to upload MRD file page
 @bp.route("/upload", methods=["POST"])
 def upload_file():
-    if "file" not in request.files:
+    # parse the body as it arrives instead of through request.files, which
+    # would spool every file to local storage first
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        return jsonify({"error": "Expected a multipart/form-data upload"}), 400
+    try:
+        job = INGEST.ingest(request.stream, boundary)
+    except Exception as e:
+        return jsonify({"error": f"Upload failed: {e}"}), 400
+    if not job.files:
         return jsonify({"error": "No files selected"}), 400
-    # tmpdata dir to store files locally before uploading to s3 at "./tmpdata"
-    upload_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmpdata")
-    if not os.path.exists(upload_path):
-        os.makedirs(upload_path)
-    for file in request.files.getlist("file"):
-        # save file locally in temporary storage
-        filepath = os.path.join(upload_path, file.filename)
-        file.save(filepath)
-        try:
-            # upload to s3 as original name
-            s3.upload_file(filepath, BUCKET, file.filename)
-        except Exception as e:
-            return jsonify({"aws access error": e}), 400
-        # remove local file
-        os.remove(filepath)
-    return jsonify({"message": "files uploaded"}), 200
+    # files keep uploading to s3 in the background; poll /upload/<job_id>
+    return jsonify(job.to_dict()), 202
+
 
+# Route to poll the progress of an upload
+@bp.route("/upload/<job_id>", methods=["GET"])
+def get_upload_status(job_id):
+    job = INGEST.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Upload job not found"}), 404
+    return jsonify(job.to_dict())
 
+
+@bp.route("/mrd-files/bulk-delete", methods=["POST"])
 @bp.route("/mrd-file", methods=["DELETE"])
 def delete_files():
-    global db_mrd
-    file_ids = request.json.get("ids", [])
-    if not file_ids:
-        return jsonify({"error": "No file IDs provided"}), 400
-
-    db_mrd = [file for file in db_mrd if file["id"] not in file_ids]
-    return jsonify({"message": "Files deleted successfully"}), 200
+    return bulk_delete(STORE.mrd_files, "Files deleted successfully")
 
 
 @bp.route("/mrd-file/<int:file_id>/download")
@@ -226,29 +404,13 @@ def download_file(file_id):
 # Route to list Simulators
 @bp.route("/simulator", methods=["GET"])
 def show_simulator():
-    filtered_simulator = [
-        {
-            "id": simulator["id"],
-            "name": simulator["name"],
-            "date": simulator["date"],
-            "owner": simulator["owner"],
-            "sequence": simulator["sequence"],
-            "image": simulator["image"],
-            "isSelected": simulator["isSelected"],
-        }
-        for simulator in db_simulator
-    ]
-    return jsonify(filtered_simulator)
+    return list_records(
+        STORE.simulators,
+        ["id", "name", "date", "owner", "sequence", "image", "isSelected"],
+    )
 
 
+@bp.route("/simulator/bulk-delete", methods=["POST"])
 @bp.route("/simluators", methods=["DELETE"])
 def delete_simulator():
-    global db_simulator
-    simulator_ids = request.json.get("ids", [])
-    if not simulator_ids:
-        return jsonify({"error": "No simulator IDs provided"}), 400
-
-    db_simulator = [
-        simulator for simulator in db_simulator if simulator["id"] not in simulator_ids
-    ]
-    return jsonify({"message": "Simulator deleted successfully"}), 200
+    return bulk_delete(STORE.simulators, "Simulator deleted successfully")
@@ -0,0 +1,263 @@
+"""
+Module: animations.py
+
+Description:
+This module exports the time dimension of the imaging matrix ([rows, columns, metabolites,
+images], see visualize/imaging.py) as an animated GIF or MP4 of one metabolite, colored with a
+heatmap color scale and optionally blended over a proton slice. Frames are produced one
+image at a time from the memory-mapped matrix and written to the encoder as they are made,
+so an export holds a single frame in memory however long the series is. Exports run as
+background jobs on the worker pool (see visualize/jobs.py).
+
+Without an underlay every frame is an index image into the color scale's 256-entry lookup
+table, which GIF stores exactly; with an underlay each frame is quantized to its own
+palette.
+
+Functions:
+- animation_size(shape, size): Output (width, height) of an animation.
+- animation_frames(data, metabolite, size, color_scale, alpha, underlay): Yields the frames.
+- write_gif(path, frames, fps): Streams frames into an animated GIF.
+- write_mp4(path, frames, fps, size): Streams frames into an MP4 video.
+- animation_version(metabolite, underlay, **options): Version of the data an export reads.
+- export_animation(metabolite, output_format, ...): Job task writing an animation.
+"""
+
+import os
+import uuid
+
+import cv2
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from visualize import composites, imaging
+from visualize.contrast import contrast_slice
+from visualize.dicom_series import load_series
+
+# Width of animations when no size is requested
+ANIMATION_WIDTH = 512
+OUTPUT_FORMATS = {"gif": "image/gif", "mp4": "video/mp4"}
+# Codec of MP4 exports; "mp4v" is available in every OpenCV FFmpeg build
+MP4_FOURCC = "mp4v"
+
+
+def animation_size(shape, size=None):
+    """
+    Returns the output (width, height) of an animation of a [rows, columns]
+    matrix: the requested size, or ANIMATION_WIDTH wide at the matrix aspect.
+    Both are rounded to even numbers, as video encoders require.
+    """
+    if size is None:
+        rows, columns = shape[:2]
+        size = (ANIMATION_WIDTH, ANIMATION_WIDTH * rows / columns)
+    return tuple(max(2, int(round(value / 2)) * 2) for value in size)
+
+
+def animation_frames(
+    data, metabolite, size, color_scale="Hot", alpha=1.0, underlay=None
+):
+    """
+    Yields the frames of one metabolite's time series, one image at a time.
+
+    Args:
+        data (np.ndarray): Imaging matrix [rows, columns, metabolites, images].
+        metabolite (int): Metabolite index.
+        size (tuple): Output (width, height).
+        color_scale (str): Heatmap color scale (see composites.COLOR_SCALES).
+        alpha (float): Heatmap opacity over the underlay.
+        underlay (ndarray, optional): uint8 proton image of the output size; the
+            heatmap covers its whole field of view.
+
+    Yields:
+        ndarray: uint8 [height, width] color-scale levels without an underlay,
+        uint8 [height, width, 3] RGB frames with one.
+    """
+    imaging.check_index("metabolite", metabolite, data.shape[2])
+    if underlay is not None:
+        underlay = np.repeat(underlay[:, :, np.newaxis], 3, axis=2)
+    lut = composites.colormap_lut(color_scale)
+    for image in range(data.shape[3]):
+        values = np.asarray(data[:, :, metabolite, image], dtype=np.float64)
+        levels = np.round(np.nan_to_num(np.clip(values, 0.0, 1.0)) * 255)
+        # Voxels stay blocks, as in the imaging view's heatmap
+        levels = cv2.resize(
+            levels.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST
+        )
+        if underlay is None:
+            yield levels
+        else:
+            yield cv2.addWeighted(underlay, 1 - alpha, lut[levels], alpha, 0)
+
+
+def write_gif(path, frames, fps, color_scale="Hot"):
+    """
+    Streams frames into a looping animated GIF.
+
+    Args:
+        path (str): Destination path.
+        frames (iterable): Frames of animation_frames.
+        fps (float): Frames per second.
+        color_scale (str): Color scale of level frames, used as their palette.
+
+    Returns:
+        int: Number of frames written.
+    """
+    palette = composites.colormap_lut(color_scale).ravel().tolist()
+    duration = int(round(1000 / fps))
+    count = 0
+    with open(path, "wb") as gif:
+        for frame in frames:
+            if frame.ndim == 2:
+                image = Image.fromarray(frame).convert("P")
+                image.putpalette(palette)
+            else:
+                image = Image.fromarray(frame).quantize(
+                    256, method=Image.Quantize.FASTOCTREE
+                )
+            if count == 0:
+                header, _ = GifImagePlugin.getheader(image, None, {"loop": 0})
+                gif.write(b"".join(header))
+            # Each frame carries its own palette, so quantized frames keep their colors
+            gif.write(
+                b"".join(
+                    GifImagePlugin.getdata(
+                        image, (0, 0), duration=duration, include_color_table=True
+                    )
+                )
+            )
+            count += 1
+        gif.write(b";")
+    return count
+
+
+def write_mp4(path, frames, fps, size, color_scale="Hot"):
+    """
+    Streams frames into an MP4 video.
+
+    Args:
+        path (str): Destination path.
+        frames (iterable): Frames of animation_frames.
+        fps (float): Frames per second.
+        size (tuple): Frame (width, height).
+        color_scale (str): Color scale of level frames.
+
+    Returns:
+        int: Number of frames written.
+    """
+    lut = composites.colormap_lut(color_scale)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*MP4_FOURCC), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"No MP4 encoder available for {MP4_FOURCC}")
+    count = 0
+    try:
+        for frame in frames:
+            if frame.ndim == 2:
+                frame = lut[frame]
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            count += 1
+    finally:
+        writer.release()
+    return count
+
+
+def read_underlay(underlay, size):
+    """
+    Renders the proton underlay of an animation at the output size.
+
+    Args:
+        underlay (dict): "folder" and "filename" of the slice and its "contrast".
+        size (tuple): Output (width, height).
+
+    Returns:
+        ndarray: uint8 [height, width] image.
+    """
+    series = load_series(underlay["folder"])
+    index = series.index_of(underlay["filename"])
+    if index is None:
+        raise FileNotFoundError(f"Proton slice {underlay['filename']} not found")
+    return contrast_slice(series.slice(index), underlay["contrast"], size)
+
+
+def animation_version(metabolite, underlay=None, **options):
+    """
+    Returns the version of the data an export reads, so exports are rebuilt
+    when the imaging matrix or the underlay series changes.
+    """
+    version = [imaging.file_version(imaging.IMAGING_DATA_PATH)]
+    if underlay is not None:
+        version.append(load_series(underlay["folder"]).version)
+    return version
+
+
+def export_animation(
+    metabolite,
+    output_format="gif",
+    color_scale="Hot",
+    alpha=0.6,
+    fps=10.0,
+    size=None,
+    underlay=None,
+):
+    """
+    Animation export task of the background job queue.
+
+    Args:
+        metabolite (int): Metabolite index of the imaging matrix.
+        output_format (str): "gif" or "mp4".
+        color_scale (str): Heatmap color scale.
+        alpha (float): Heatmap opacity over the underlay.
+        fps (float): Frames per second.
+        size (list, optional): Output [width, height].
+        underlay (dict, optional): "folder", "filename" and "contrast" of a
+            proton slice shown under the heatmap.
+
+    Returns:
+        tuple: {"path", "filename", "mimetype", "frames"} and no arrays.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'")
+    params = {
+        "metabolite": metabolite,
+        "output_format": output_format,
+        "color_scale": color_scale,
+        "alpha": alpha,
+        "fps": fps,
+        "size": size,
+        "underlay": underlay,
+    }
+    path = composites.export_path(params, animation_version(**params), output_format)
+    data = imaging.open_imaging_matrix()
+    if os.path.exists(path):
+        return export_metadata(path, metabolite, output_format, data.shape[3]), {}
+
+    size = animation_size(data.shape, size)
+    frames = animation_frames(
+        data,
+        metabolite,
+        size,
+        color_scale,
+        alpha,
+        None if underlay is None else read_underlay(underlay, size),
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The encoders pick the container from the extension
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp.{output_format}"
+    try:
+        if output_format == "gif":
+            count = write_gif(temporary, frames, fps, color_scale)
+        else:
+            count = write_mp4(temporary, frames, fps, size, color_scale)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return export_metadata(path, metabolite, output_format, count), {}
+
+
+def export_metadata(path, metabolite, output_format, frames):
+    return {
+        "path": path,
+        "filename": f"metabolite{metabolite}.{output_format}",
+        "mimetype": OUTPUT_FORMATS[output_format],
+        "frames": frames,
+    }
@@ -0,0 +1,235 @@
+"""
+Module: artifacts.py
+
+Description:
+This module persists reconstructed HP-MRI data as versioned HDF5 artifacts. An artifact holds
+the spectral cube of one dataset, chunked by voxel block and spectral window, with the
+procpar geometry and reconstruction parameters stored as attributes. Artifacts are keyed
+by a hash of the raw FID bytes and the reconstruction parameters, so creating one is
+idempotent: a dataset is reconstructed once per FID content and parameter set, and later
+readers open the file lazily and read only the chunks they need.
+
+Layout (format "hp-mri-reconstruction", version FORMAT_VERSION):
+- dataset "spectral_data": float64 cube (rows, columns, points, pictures), the dtype of
+  the live reconstruction, so thresholds mask the same voxels with or without an artifact
+- attributes: format, format_version, key, fid_sha256, created, parameters
+  (JSON) and one attribute per geometry field
+
+Classes:
+- Artifact: Read-only, lazily opened artifact.
+
+Functions:
+- fid_digest(path): SHA-256 of a raw FID file, cached per file version.
+- artifact_key(fid_path, parameters): Key of the artifact of a FID and parameters.
+- artifact_path(key, directory): Path of the artifact with a given key.
+- write_artifact(path, spectral_data, geometry, parameters, key, digest): Writes an artifact atomically.
+- ensure_artifact(fid_path, parameters, build, directory): Returns the path of an artifact, building it once.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import h5py
+import numpy as np
+
+FORMAT = "hp-mri-reconstruction"
+# Version 1 stored float32 cubes; the version is part of the key, so they are rebuilt
+FORMAT_VERSION = 2
+ARTIFACT_DIR = os.environ.get(
+    "HP_MRI_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "artifacts"),
+)
+# Voxels per chunk along rows and columns, and spectral points per chunk
+VOXEL_CHUNK = 4
+SPECTRAL_CHUNK = 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# path -> ((mtime_ns, size), hex digest)
+FID_DIGESTS = {}
+FID_DIGESTS_LOCK = threading.Lock()
+# Artifacts being built in this process, so concurrent callers build each once
+BUILD_LOCKS = {}
+BUILD_LOCKS_LOCK = threading.Lock()
+
+
+def fid_digest(path):
+    """
+    Returns the SHA-256 of a raw FID file, hashing it only once per file version.
+
+    Args:
+        path (str): Path of the fid file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with FID_DIGESTS_LOCK:
+        cached = FID_DIGESTS.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as fid:
+        for block in iter(lambda: fid.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    digest = digest.hexdigest()
+    with FID_DIGESTS_LOCK:
+        FID_DIGESTS[path] = (version, digest)
+    return digest
+
+
+def artifact_key(fid_path, parameters):
+    """
+    Returns the key of the artifact reconstructed from a FID with given parameters.
+
+    Args:
+        fid_path (str): Path of the raw fid file.
+        parameters (dict): JSON-serializable reconstruction parameters.
+
+    Returns:
+        str: Hex key; the same FID content and parameters give the same key.
+    """
+    payload = json.dumps(
+        [FORMAT, FORMAT_VERSION, fid_digest(fid_path), parameters], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def artifact_path(key, directory=None):
+    return os.path.join(directory or ARTIFACT_DIR, key[:2], f"{key}.h5")
+
+
+def chunk_shape(shape):
+    """
+    Chunks of VOXEL_CHUNK x VOXEL_CHUNK voxels by SPECTRAL_CHUNK points, one
+    picture each, so a voxel spectrum or a spectral window reads few chunks.
+    """
+    rows, columns, points = shape[:3]
+    return (
+        min(rows, VOXEL_CHUNK),
+        min(columns, VOXEL_CHUNK),
+        min(points, SPECTRAL_CHUNK),
+    ) + (1,) * (len(shape) - 3)
+
+
+def write_artifact(path, spectral_data, geometry, parameters, key, digest):
+    """
+    Writes an artifact atomically: to a temporary file renamed into place.
+
+    Args:
+        path (str): Destination path.
+        spectral_data (ndarray): Cube (rows, columns, points[, pictures]).
+        geometry (dict): Scalar geometry fields stored as attributes.
+        parameters (dict): Reconstruction parameters stored as JSON.
+        key (str): Artifact key.
+        digest (str): SHA-256 of the raw FID.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with h5py.File(temporary, "w") as artifact:
+            artifact.create_dataset(
+                "spectral_data",
+                data=np.asarray(spectral_data, dtype=np.float64),
+                chunks=chunk_shape(spectral_data.shape),
+            )
+            artifact.attrs["format"] = FORMAT
+            artifact.attrs["format_version"] = FORMAT_VERSION
+            artifact.attrs["key"] = key
+            artifact.attrs["fid_sha256"] = digest
+            artifact.attrs["created"] = time.time()
+            artifact.attrs["parameters"] = json.dumps(parameters, sort_keys=True)
+            for name, value in geometry.items():
+                artifact.attrs[name] = value
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def ensure_artifact(fid_path, parameters, build, directory=None):
+    """
+    Returns the path of the artifact of a FID and parameters, building it if missing.
+
+    Args:
+        fid_path (str): Path of the raw fid file.
+        parameters (dict): JSON-serializable reconstruction parameters.
+        build (callable): Called without arguments when the artifact is missing;
+            returns (spectral_data, geometry dict).
+        directory (str, optional): Artifact directory; ARTIFACT_DIR when None.
+
+    Returns:
+        str: Path of the artifact.
+    """
+    key = artifact_key(fid_path, parameters)
+    path = artifact_path(key, directory)
+    if os.path.exists(path):
+        return path
+    with BUILD_LOCKS_LOCK:
+        lock = BUILD_LOCKS.setdefault(path, threading.Lock())
+    with lock:
+        if not os.path.exists(path):
+            spectral_data, geometry = build()
+            write_artifact(
+                path, spectral_data, geometry, parameters, key, fid_digest(fid_path)
+            )
+    with BUILD_LOCKS_LOCK:
+        BUILD_LOCKS.pop(path, None)
+    return path
+
+
+class Artifact:
+    """
+    Read-only, lazily opened artifact; only the chunks that are indexed are read.
+
+    Attributes:
+        path (str): Path of the artifact.
+        spectral_data (h5py.Dataset): The cube, indexable like an array.
+        parameters (dict): Reconstruction parameters.
+        geometry (dict): Every attribute that is not part of the format header.
+    """
+
+    HEADER = ("format", "format_version", "key", "fid_sha256", "created", "parameters")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = h5py.File(path, "r")
+        attributes = dict(self._file.attrs)
+        if attributes.get("format") != FORMAT:
+            self._file.close()
+            raise ValueError(f"{path} is not an {FORMAT} artifact")
+        if int(attributes["format_version"]) > FORMAT_VERSION:
+            self._file.close()
+            raise ValueError(
+                f"{path} uses format version {attributes['format_version']}, "
+                f"newer than {FORMAT_VERSION}"
+            )
+        self.spectral_data = self._file["spectral_data"]
+        self.parameters = json.loads(attributes["parameters"])
+        self.geometry = {
+            name: value.item() if hasattr(value, "item") else value
+            for name, value in attributes.items()
+            if name not in self.HEADER
+        }
+
+    def read(self):
+        """
+        Reads the whole cube.
+        """
+        return self.spectral_data[()]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
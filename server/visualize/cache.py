@@ -0,0 +1,150 @@
+"""
+Module: cache.py
+
+Description:
+This module provides the in-process caches shared by the visualization endpoints. Entries are
+evicted least-recently-used first once the total size of the cached values exceeds a byte budget.
+
+Classes:
+- ByteLRUCache: Thread-safe LRU cache bounded by the byte size of its values.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def size_of(value):
+    """
+    Estimates the memory held by a cached value.
+
+    Args:
+        value: A NumPy array, bytes-like object, or tuple/list of those.
+
+    Returns:
+        int: Size in bytes.
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(size_of(item) for item in value)
+    return 0
+
+
+class ByteLRUCache:
+    """
+    A least-recently-used cache bounded by the total byte size of its values.
+
+    Attributes:
+        max_bytes (int): Byte budget; values larger than this are never stored.
+        hits (int): Number of lookups that found a cached value.
+        misses (int): Number of lookups that did not.
+        evictions (int): Number of entries evicted to stay within budget.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached values in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key and marks it as recently used.
+
+        Args:
+            key: Hashable cache key.
+            default: Value returned on a miss.
+
+        Returns:
+            The cached value, or `default`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting least-recently-used entries to stay within budget.
+
+        Args:
+            key: Hashable cache key.
+            value: Value to cache; its size is measured with `size_of`.
+        """
+        size = size_of(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_create(self, key, create):
+        """
+        Returns the cached value for a key, creating and caching it on a miss.
+
+        Args:
+            key: Hashable cache key.
+            create (callable): Called without arguments to build a missing value.
+
+        Returns:
+            The cached or newly created value.
+        """
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """
+        Removes every entry; the hit and miss counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Reports the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, number of entries and bytes used.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "maxBytes": self.max_bytes,
+            }
@@ -0,0 +1,386 @@
+"""
+Module: composites.py
+
+Description:
+This module renders the /visualize overlay on the server: a contrast-adjusted proton slice with
+the EPSI voxel grid, the stacked spectra trace and an optional metabolite heatmap drawn on top.
+The layout follows the browser's plot (see PlotComponent.tsx): the EPSI grid covers the
+fraction of the proton field of view given by the EPSI fields of view, shifted by plotShift
+voxels. Drawing is whole-array: the grid is one masked blend, the trace one polylines
+call over its unbroken runs and the heatmap one lookup-table gather. Frames of a study
+are rendered in the job worker exporting them, or across a process pool when exported
+outside the job runner, and streamed, in order, into a zip of images or a multi-page TIFF.
+
+Functions:
+- colormap_lut(name): 256-entry RGB lookup table of a heatmap color scale.
+- apply_colormap(values, name): Colors values in [0, 1] with a color scale.
+- overlay_box(metadata, width, height): Pixel box covered by the EPSI grid.
+- composite(proton, metadata, x_values, trace, points, heatmap, ...): Renders one overlay frame.
+- encode_frame(image, image_format): Encodes a frame as PNG or TIFF.
+- render_frames(render, frames, workers, initializer, initargs): Renders frames in order, in
+  this process or across a process pool.
+- export_path(params, version, output_format): Path of the export of a request and data version.
+- write_archive(path, output_format, frames): Streams frames into a zip or multi-page TIFF.
+"""
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from visualize import jobs
+
+EXPORT_DIR = os.environ.get(
+    "HP_MRI_EXPORT_DIR",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "exports"),
+)
+# Processes rendering the frames of one export outside the job runner
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", os.cpu_count() or 1))
+# Consecutive frames rendered by one task of the pool; they share their inputs
+FRAMES_PER_TASK = 8
+# Heatmap color scales of the imaging view (see ImagingPlotComponent.tsx)
+COLOR_SCALES = {
+    "Hot": [
+        (0.0, (0, 0, 0)),
+        (0.11, (105, 0, 0)),
+        (0.22, (210, 0, 0)),
+        (0.33, (255, 40, 0)),
+        (0.44, (255, 150, 0)),
+        (0.55, (255, 210, 0)),
+        (0.66, (255, 255, 50)),
+        (0.77, (255, 255, 150)),
+        (0.88, (255, 255, 210)),
+        (1.0, (255, 255, 255)),
+    ],
+    "Jet": [
+        (0.0, (0, 0, 131)),
+        (0.125, (0, 60, 170)),
+        (0.25, (5, 255, 255)),
+        (0.375, (110, 255, 142)),
+        (0.5, (255, 255, 0)),
+        (0.625, (255, 145, 0)),
+        (0.75, (255, 0, 0)),
+        (0.875, (180, 0, 0)),
+        (1.0, (128, 0, 0)),
+    ],
+    "B&W": [(0.0, (0, 0, 0)), (1.0, (255, 255, 255))],
+}
+SPECTRA_COLOR = (52, 199, 89)
+GRID_ALPHA = 0.5
+# Dash length of the grid lines, in pixels
+GRID_DASH = 4
+OUTPUT_FORMATS = {"zip": "application/zip", "tiff": "image/tiff"}
+IMAGE_FORMATS = {"png": "PNG", "tiff": "TIFF"}
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(name):
+    """
+    Returns the 256-entry lookup table of a color scale.
+
+    Args:
+        name (str): Key of COLOR_SCALES.
+
+    Returns:
+        ndarray: uint8 array shaped [256, 3], RGB.
+
+    Raises:
+        ValueError: If the color scale is unknown.
+    """
+    if name not in COLOR_SCALES:
+        raise ValueError(f"Unknown color scale '{name}'")
+    stops = np.array([stop for stop, _ in COLOR_SCALES[name]])
+    colors = np.array([color for _, color in COLOR_SCALES[name]], dtype=float)
+    levels = np.linspace(0.0, 1.0, 256)
+    lut = np.stack(
+        [np.interp(levels, stops, colors[:, channel]) for channel in range(3)], axis=1
+    )
+    lut = np.round(lut).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_colormap(values, name):
+    """
+    Colors values in [0, 1] with a color scale; NaN and out-of-range values
+    are clipped like the imaging view does.
+
+    Returns:
+        ndarray: uint8 RGB array shaped values.shape + (3,).
+    """
+    levels = np.nan_to_num(np.clip(values, 0.0, 1.0), nan=0.0)
+    return colormap_lut(name)[np.round(levels * 255).astype(np.intp)]
+
+
+def overlay_box(metadata, width, height):
+    """
+    Returns the pixel box covered by the EPSI grid on a proton image, as
+    calculateDomain in PlotComponent.tsx does (with paper y measured upwards).
+
+    Args:
+        metadata (dict): /get_hp_mri_data display parameters.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+
+    Returns:
+        tuple: (left, top, right, bottom) in pixels, as floats.
+    """
+    shift_x, shift_y = metadata["plotShift"]
+    x0 = (
+        (metadata["longitudinalScale"] - metadata["longitudinalMeasurement"]) / 2
+        + shift_x * metadata["longitudinalMeasurement"] / metadata["columns"]
+    ) / metadata["longitudinalScale"]
+    x1 = x0 + metadata["longitudinalMeasurement"] / metadata["longitudinalScale"]
+    y0 = (
+        (metadata["perpendicularScale"] - metadata["perpendicularMeasurement"]) / 2
+        + shift_y * metadata["perpendicularMeasurement"] / metadata["rows"]
+    ) / metadata["perpendicularScale"]
+    y1 = y0 + metadata["perpendicularMeasurement"] / metadata["perpendicularScale"]
+    return x0 * width, (1 - y1) * height, x1 * width, (1 - y0) * height
+
+
+def clipped_box(box, shape):
+    """
+    Returns the integer bounds of a box clipped to an image, or None when
+    the box lies outside it.
+    """
+    left, top, right, bottom = (int(round(value)) for value in box)
+    clipped = (max(left, 0), max(top, 0), min(right, shape[1]), min(bottom, shape[0]))
+    if clipped[0] >= clipped[2] or clipped[1] >= clipped[3]:
+        return None
+    return (left, top, right, bottom), clipped
+
+
+def draw_heatmap(image, values, box, color_scale, alpha):
+    """
+    Blends a [rows, columns] heatmap into the box, one block per voxel.
+    """
+    bounds = clipped_box(box, image.shape)
+    if bounds is None:
+        return
+    (left, top, right, bottom), (x0, y0, x1, y1) = bounds
+    colors = cv2.resize(
+        apply_colormap(values, color_scale),
+        (right - left, bottom - top),
+        interpolation=cv2.INTER_NEAREST,
+    )[y0 - top : y1 - top, x0 - left : x1 - left]
+    region = image[y0:y1, x0:x1]
+    region[...] = cv2.addWeighted(region, 1 - alpha, colors, alpha, 0)
+
+
+def draw_grid(image, box, rows, columns):
+    """
+    Blends the dashed voxel grid into the box with one masked operation.
+    """
+    left, top, right, bottom = box
+    height, width = image.shape[:2]
+    xs = np.round(np.linspace(left, right, columns + 1)).astype(int)
+    ys = np.round(np.linspace(top, bottom, rows + 1)).astype(int)
+    xs = xs[(xs >= 0) & (xs < width)]
+    ys = ys[(ys >= 0) & (ys < height)]
+    y_span = np.arange(max(int(round(top)), 0), min(int(round(bottom)) + 1, height))
+    x_span = np.arange(max(int(round(left)), 0), min(int(round(right)) + 1, width))
+
+    mask = np.zeros((height, width), dtype=bool)
+    dashes = y_span[(y_span // GRID_DASH) % 2 == 0]
+    mask[np.ix_(dashes, xs)] = True
+    dashes = x_span[(x_span // GRID_DASH) % 2 == 0]
+    mask[np.ix_(ys, dashes)] = True
+    image[mask] = (image[mask] * (1 - GRID_ALPHA) + 255 * GRID_ALPHA).astype(np.uint8)
+
+
+def draw_spectra(image, box, x_values, trace, rows, columns, points):
+    """
+    Draws the stacked spectra trace: x spans columns * points samples across
+    the box and y spans rows from its bottom. Points that are NaN break the
+    line, so masked voxels and row ends are not joined; the remaining runs are
+    drawn with a single polylines call.
+    """
+    left, top, right, bottom = box
+    x = left + np.asarray(x_values, dtype=float) / (columns * points) * (right - left)
+    y = bottom - np.asarray(trace, dtype=float) / rows * (bottom - top)
+    valid = np.isfinite(y)
+    # Runs of consecutive finite points become one polyline each
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], valid, [False]])))
+    # Fixed-point coordinates (4 fractional bits) keep the anti-aliased line smooth
+    coordinates = np.round(np.stack([x, np.where(valid, y, 0)], axis=1) * 16)
+    coordinates = coordinates.astype(np.int32)
+    lines = [
+        coordinates[start:end]
+        for start, end in zip(edges[::2], edges[1::2])
+        if end - start > 1
+    ]
+    if lines:
+        cv2.polylines(image, lines, False, SPECTRA_COLOR, 1, cv2.LINE_AA, 4)
+
+
+def composite(
+    proton,
+    metadata,
+    x_values=None,
+    trace=None,
+    points=None,
+    heatmap=None,
+    color_scale="Hot",
+    alpha=0.5,
+    grid=True,
+):
+    """
+    Renders one overlay frame.
+
+    Args:
+        proton (ndarray): Contrast-adjusted uint8 proton image [height, width].
+        metadata (dict): /get_hp_mri_data display parameters of the dataset.
+        x_values (ndarray, optional): X values of the stacked spectra trace.
+        trace (ndarray, optional): Stacked spectra trace, NaN where hidden;
+            not drawn when None.
+        points (int, optional): Spectral points per voxel.
+        heatmap (ndarray, optional): [rows, columns] values in [0, 1].
+        color_scale (str): Heatmap color scale.
+        alpha (float): Heatmap opacity.
+        grid (bool): Draw the voxel grid.
+
+    Returns:
+        ndarray: uint8 RGB image [height, width, 3].
+    """
+    image = np.repeat(proton[:, :, np.newaxis], 3, axis=2)
+    box = overlay_box(metadata, image.shape[1], image.shape[0])
+    if heatmap is not None:
+        draw_heatmap(image, heatmap, box, color_scale, alpha)
+    if grid:
+        draw_grid(image, box, metadata["rows"], metadata["columns"])
+    if trace is not None:
+        draw_spectra(
+            image,
+            box,
+            x_values,
+            trace,
+            metadata["rows"],
+            metadata["columns"],
+            points,
+        )
+    return image
+
+
+def encode_frame(image, image_format="png"):
+    """
+    Encodes a frame.
+
+    Args:
+        image (ndarray): uint8 RGB or grayscale image.
+        image_format (str): "png" or "tiff".
+
+    Returns:
+        bytes: The encoded image.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=IMAGE_FORMATS[image_format])
+    return buffer.getvalue()
+
+
+def render_frames(render, frames, workers=None, initializer=None, initargs=()):
+    """
+    Renders frames, yielding the results in frame order.
+
+    In a job worker, frames are rendered in that process: the job pool already
+    spreads jobs over the CPUs, and a pool per job would oversubscribe them.
+    Elsewhere, runs of consecutive frames are rendered across a process pool, at
+    most two runs per process in flight, so a long export holds a bounded number
+    of frames rather than the whole study.
+
+    Args:
+        render (callable): Module-level function called with one frame.
+        frames (list): Picklable frame descriptions.
+        workers (int, optional): Number of processes; EXPORT_WORKERS when None.
+            With one worker, frames are rendered in this process.
+        initializer (callable, optional): Called with initargs in every worker.
+
+    Yields:
+        The result of render for each frame.
+    """
+    workers = 1 if jobs.IN_WORKER else min(workers or EXPORT_WORKERS, len(frames))
+    if workers <= 1:
+        yield from map(render, frames)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        pending = deque()
+        try:
+            for start in range(0, len(frames), FRAMES_PER_TASK):
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+                run = frames[start : start + FRAMES_PER_TASK]
+                pending.append(pool.submit(render_run, render, run))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # The consumer stopped early: drop the runs not started yet
+            for future in pending:
+                future.cancel()
+
+
+def render_run(render, frames):
+    return [render(frame) for frame in frames]
+
+
+def export_path(params, version, output_format, directory=None):
+    """
+    Returns the path of the export of a request and data version.
+    """
+    payload = json.dumps([params, version], sort_keys=True, default=str)
+    key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return os.path.join(directory or EXPORT_DIR, f"{key}.{output_format}")
+
+
+def write_archive(path, output_format, frames):
+    """
+    Streams frames into an archive, written atomically.
+
+    Args:
+        path (str): Destination path.
+        output_format (str): "zip" stores each frame's encoded bytes under its
+            name; "tiff" appends each frame array as a page.
+        frames (iterable): (name, payload) pairs; payloads are encoded bytes
+            with their extension in the name for "zip", arrays for "tiff".
+
+    Returns:
+        int: Number of frames written.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    count = 0
+    try:
+        if output_format == "zip":
+            # Frames are already compressed images
+            with zipfile.ZipFile(temporary, "w", zipfile.ZIP_STORED) as archive:
+                for name, payload in frames:
+                    archive.writestr(name, payload)
+                    count += 1
+        elif output_format == "tiff":
+            with TiffImagePlugin.AppendingTiffWriter(temporary, True) as tiff:
+                for _, payload in frames:
+                    Image.fromarray(payload).save(tiff, format="TIFF")
+                    tiff.newFrame()
+                    count += 1
+        else:
+            raise ValueError(f"Unknown output format '{output_format}'")
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return count
@@ -0,0 +1,173 @@
+"""
+Module: contrast.py
+
+Description:
+This module applies the proton viewer's contrast adjustment to DICOM slices for every magnet
+backend. A slice is cleared below 5 counts, stretched to 8 bits with values under 5% of its
+range cleared, equalized with CLAHE, cleared again below 5% of full scale and optionally
+resized. The stretch is done in integer arithmetic on the slice's own dtype (uint8/uint16/
+int16 in, uint8 out), matching the original float64 computation exactly, and whole
+stacks of slices are processed per call in preallocated buffers. CLAHE instances are
+pooled per (clip limit, tile grid) instead of being created per request.
+
+Functions:
+- pooled_clahe(clip_limit, tile): Context manager lending a pooled cv2.CLAHE instance.
+- stretch_slices(stack, out): Clears and stretches a stack of slices to uint8.
+- contrast_slices(stack, contrast, size, tile): Contrast-adjusts a stack of slices.
+- contrast_slice(pixels, contrast, size, tile): Contrast-adjusts one slice.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+CLAHE_TILE = (8, 8)
+# Raw values below this count are cleared before stretching
+NOISE_FLOOR = 5
+# Values under 1 / CUTOFF_DIVISOR (5%) of a slice's range are cleared after stretching
+CUTOFF_DIVISOR = 20
+# 8-bit levels cleared after equalization: level / 255 < 0.05 for levels up to 12
+OUTPUT_FLOOR = 12
+# Slices stretched together; bounds the integer work buffers of a batch
+BATCH_SLICES = 16
+# Settings whose idle CLAHE instances are kept, least recently used evicted first
+CLAHE_POOL_SETTINGS = 32
+
+# (clip limit, tile grid) -> idle cv2.CLAHE instances
+CLAHE_POOL = OrderedDict()
+CLAHE_POOL_LOCK = threading.Lock()
+
+
+@contextmanager
+def pooled_clahe(clip_limit, tile=CLAHE_TILE):
+    """
+    Lends a CLAHE instance for the given settings, creating one only when every
+    pooled instance is in use. An instance is used by one thread at a time.
+
+    Args:
+        clip_limit (float): CLAHE clip limit.
+        tile (tuple): Tile grid size.
+
+    Yields:
+        cv2.CLAHE: The instance, returned to the pool on exit.
+    """
+    key = (round(float(clip_limit), 3), tuple(tile))
+    with CLAHE_POOL_LOCK:
+        idle = CLAHE_POOL.get(key)
+        clahe = idle.pop() if idle else None
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=key[0], tileGridSize=key[1])
+    try:
+        yield clahe
+    finally:
+        with CLAHE_POOL_LOCK:
+            CLAHE_POOL.setdefault(key, []).append(clahe)
+            CLAHE_POOL.move_to_end(key)
+            while len(CLAHE_POOL) > CLAHE_POOL_SETTINGS:
+                CLAHE_POOL.popitem(last=False)
+
+
+def stretch_slices(stack, out):
+    """
+    Clears values below NOISE_FLOOR, stretches each slice from its minimum to
+    its maximum onto 0-255 and clears values under 5% of the slice's range.
+
+    This is the integer form of (x - min) / (max - min) thresholded at 0.05
+    and truncated to uint8: the cutoff is compared as (x - min) * 20 < range
+    and the level is the floor of (x - min) * 255 / range.
+
+    Args:
+        stack (ndarray): Integer slices [n, rows, columns].
+        out (ndarray): uint8 output [n, rows, columns].
+
+    Returns:
+        ndarray: out.
+    """
+    if stack.dtype.kind not in "iu":
+        raise TypeError(f"Proton slices must have an integer dtype, not {stack.dtype}")
+    # (x - min) * 255 fits in int32 for every 16-bit input
+    work_dtype = np.int32 if stack.dtype.itemsize <= 2 else np.int64
+    count = len(stack)
+    pixels = stack.reshape(count, -1)
+    batch = min(count, BATCH_SLICES)
+    work = np.empty((batch, pixels.shape[1]), dtype=work_dtype)
+    cleared = np.empty((batch, pixels.shape[1]), dtype=bool)
+    noise = np.empty((batch, pixels.shape[1]), dtype=bool)
+
+    for start in range(0, count, batch):
+        chunk = pixels[start : start + batch]
+        size = len(chunk)
+        np.less(chunk, NOISE_FLOOR, out=noise[:size])
+        maximum = chunk.max(axis=1).astype(np.int64)
+        maximum[maximum < NOISE_FLOOR] = 0
+        # Cleared values become 0, which is then the minimum
+        minimum = np.where(noise[:size].any(axis=1), 0, chunk.min(axis=1))
+        span = maximum - minimum
+
+        np.subtract(chunk, minimum[:, np.newaxis], out=work[:size], casting="unsafe")
+        # x - min < ceil(range / 20) is (x - min) * 20 < range
+        np.less(
+            work[:size], -(-span // CUTOFF_DIVISOR)[:, np.newaxis], out=cleared[:size]
+        )
+        np.logical_or(cleared[:size], noise[:size], out=cleared[:size])
+        np.multiply(work[:size], 255, out=work[:size])
+        np.floor_divide(
+            work[:size], np.maximum(span, 1)[:, np.newaxis], out=work[:size]
+        )
+        work[:size][cleared[:size]] = 0
+        out.reshape(count, -1)[start : start + size] = work[:size]
+    return out
+
+
+def contrast_slices(stack, contrast, size=None, tile=CLAHE_TILE):
+    """
+    Applies the proton viewer's contrast adjustment to a stack of slices.
+
+    Args:
+        stack (ndarray): Integer slices [n, rows, columns]; not modified.
+        contrast (float): CLAHE clip limit.
+        size (tuple, optional): Output (width, height); the native size when None.
+        tile (tuple): CLAHE tile grid size.
+
+    Returns:
+        ndarray: uint8 images [n, height, width].
+    """
+    stretched = stretch_slices(stack, np.empty(stack.shape, dtype=np.uint8))
+    if size is None:
+        output = stretched
+    else:
+        output = np.empty((len(stack), size[1], size[0]), dtype=np.uint8)
+    equalized = np.empty(stack.shape[1:], dtype=np.uint8)
+
+    with pooled_clahe(contrast, tile) as clahe:
+        for index in range(len(stack)):
+            clahe.apply(stretched[index], equalized)
+            if size is None:
+                cv2.threshold(
+                    equalized, OUTPUT_FLOOR, 255, cv2.THRESH_TOZERO, output[index]
+                )
+            else:
+                cv2.threshold(
+                    equalized, OUTPUT_FLOOR, 255, cv2.THRESH_TOZERO, equalized
+                )
+                cv2.resize(equalized, size, output[index], interpolation=cv2.INTER_AREA)
+    return output
+
+
+def contrast_slice(pixels, contrast, size=None, tile=CLAHE_TILE):
+    """
+    Applies the proton viewer's contrast adjustment to one slice.
+
+    Args:
+        pixels (ndarray): Integer slice [rows, columns]; not modified.
+        contrast (float): CLAHE clip limit.
+        size (tuple, optional): Output (width, height); the native size when None.
+        tile (tuple): CLAHE tile grid size.
+
+    Returns:
+        ndarray: uint8 image [height, width].
+    """
+    return contrast_slices(pixels[np.newaxis], contrast, size, tile)[0]
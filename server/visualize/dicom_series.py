@@ -0,0 +1,347 @@
+"""
+Module: dicom_series.py
+
+Description:
+This module loads a folder of single-slice DICOM files as one series. The folder is scanned
+once: headers are read with stop_before_pixels and the slices are sorted along the slice
+normal (ImagePositionPatient), then by InstanceNumber and file name. Pixel data is decoded
+into one contiguous, read-only [slices, rows, columns] array with per-slice statistics, and
+the loaded series is shared through a byte-bounded cache until a slice is added, removed,
+renamed or rewritten. Counting slices, fetching a slice and reading its window statistics
+are then array lookups. A series too large for the cache keeps only its sorted file names
+and decodes the requested slice on each request.
+
+Classes:
+- DicomSeries: The sorted slices of one folder as a 3D array.
+- StreamedDicomSeries: The sorted slices of one folder, read one file per request.
+
+Functions:
+- list_slices(folder): The .dcm files of a folder and their version.
+- series_version(folder): Version of the .dcm files of a folder.
+- count_slices(folder): Number of slices of a folder, without decoding them.
+- scan_headers(folder): Headers of every .dcm file of a folder, in slice order.
+- load_series(folder): Cached DicomSeries of a folder.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pydicom
+
+from visualize.cache import ByteLRUCache
+
+# Loaded series keyed by (folder, series version)
+SERIES_CACHE = ByteLRUCache(max_bytes=512 * 1024 * 1024)
+# Folders being loaded, so concurrent requests decode each series once
+LOAD_LOCKS = {}
+LOAD_LOCKS_LOCK = threading.Lock()
+# Folder -> (time.monotonic(), slice files, series version) of its last listing, reused
+# for LISTING_TTL seconds so a burst of slider requests stats the files once
+LISTINGS = {}
+LISTINGS_LOCK = threading.Lock()
+LISTING_TTL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def list_slices(folder):
+    """
+    Lists the .dcm files of a folder with their version; a listing less than
+    LISTING_TTL seconds old is reused.
+
+    The version hashes the name, mtime and size of every file, so a slice
+    overwritten in place, which leaves the folder's own mtime unchanged, also
+    gives a new version.
+
+    Returns:
+        tuple: (sorted (file name, mtime_ns, size) tuples, hex version).
+    """
+    now = time.monotonic()
+    with LISTINGS_LOCK:
+        listing = LISTINGS.get(folder)
+    if listing is not None and now - listing[0] < LISTING_TTL:
+        return listing[1:]
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(".dcm") and entry.is_file():
+                stat = entry.stat()
+                files.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    files.sort()
+    version = hashlib.sha1(repr(files).encode("utf-8")).hexdigest()
+    with LISTINGS_LOCK:
+        LISTINGS[folder] = (now, files, version)
+    return files, version
+
+
+def series_version(folder):
+    """
+    Returns the version of the slices of a folder (see list_slices).
+    """
+    return list_slices(folder)[1]
+
+
+def count_slices(folder):
+    """
+    Returns the number of slices of a folder, counting its .dcm files without
+    reading them.
+    """
+    return len(list_slices(folder)[0])
+
+
+def slice_order(header, name):
+    """
+    Sort key of a slice: its position along the slice normal, then its
+    InstanceNumber, then its file name; missing fields sort last.
+    """
+    position = getattr(header, "ImagePositionPatient", None)
+    orientation = getattr(header, "ImageOrientationPatient", None)
+    location = None
+    if position is not None and orientation is not None and len(orientation) == 6:
+        normal = np.cross(
+            np.asarray(orientation[:3], float), np.asarray(orientation[3:], float)
+        )
+        location = float(np.dot(normal, np.asarray(position, float)))
+    elif position is not None:
+        location = float(position[2])
+    instance = getattr(header, "InstanceNumber", None)
+    return (
+        location is None,
+        location or 0.0,
+        instance is None,
+        int(instance or 0),
+        name,
+    )
+
+
+def scan_headers(folder):
+    """
+    Reads the headers of every .dcm file of a folder, without pixel data.
+
+    Args:
+        folder (str): Folder holding the slices of one series.
+
+    Returns:
+        list: (file name, header) pairs in slice order.
+    """
+    headers = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(".dcm") and entry.is_file():
+                headers.append(
+                    (entry.name, pydicom.dcmread(entry.path, stop_before_pixels=True))
+                )
+    headers.sort(key=lambda item: slice_order(item[1], item[0]))
+    return headers
+
+
+class DicomSeries:
+    """
+    The sorted slices of one folder as a single 3D array.
+
+    Attributes:
+        folder (str): Folder of the series.
+        version (str): series_version of the folder when it was scanned.
+        names (list of str): File name of each slice, in slice order.
+        volume (ndarray): Read-only [slices, rows, columns] pixel data.
+        minimum, maximum, mean, std (ndarray): Statistics of each slice.
+    """
+
+    def __init__(self, folder, version, names, volume):
+        self.folder = folder
+        self.version = version
+        self.names = names
+        self.volume = volume
+        self.volume.flags.writeable = False
+        self._index = {name: index for index, name in enumerate(names)}
+        pixels = volume.reshape(len(names), -1)
+        self.minimum = pixels.min(axis=1)
+        self.maximum = pixels.max(axis=1)
+        self.mean = pixels.mean(axis=1)
+        self.std = pixels.std(axis=1)
+
+    @property
+    def nbytes(self):
+        # Lets the byte-bounded cache account for the series
+        return self.volume.nbytes
+
+    @property
+    def shape(self):
+        """
+        (slices, rows, columns) of the series.
+        """
+        return self.volume.shape
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, name):
+        """
+        Returns the slice index of a file name, or None if the series has no such file.
+        """
+        return self._index.get(name)
+
+    def slice(self, index):
+        """
+        Returns one read-only [rows, columns] slice.
+        """
+        return self.volume[index]
+
+    def window_stats(self, index):
+        """
+        Returns the statistics of one slice, for window/level defaults.
+
+        Returns:
+            dict: min, max, mean and std of the slice's pixel values.
+        """
+        return {
+            "min": self.minimum[index].item(),
+            "max": self.maximum[index].item(),
+            "mean": float(self.mean[index]),
+            "std": float(self.std[index]),
+        }
+
+    @classmethod
+    def read(cls, folder, version=None, headers=None):
+        """
+        Scans a folder and decodes every slice into one contiguous array.
+
+        Args:
+            folder (str): Folder holding the slices of one series.
+            version (str, optional): series_version of the folder; computed when None.
+            headers (list, optional): scan_headers(folder), when already scanned.
+
+        Raises:
+            FileNotFoundError: If the folder holds no .dcm file.
+            ValueError: If the slices do not share one shape.
+        """
+        if version is None:
+            version = series_version(folder)
+        if headers is None:
+            headers = scan_headers(folder)
+        if not headers:
+            raise FileNotFoundError(f"No DICOM file found in directory: {folder}")
+        volume = None
+        for index, (name, _) in enumerate(headers):
+            pixels = pydicom.dcmread(os.path.join(folder, name)).pixel_array
+            if volume is None:
+                volume = np.empty((len(headers),) + pixels.shape, dtype=pixels.dtype)
+            elif pixels.shape != volume.shape[1:]:
+                raise ValueError(
+                    f"{name}: slice shape {pixels.shape} differs from "
+                    f"{volume.shape[1:]}"
+                )
+            volume[index] = pixels
+        return cls(folder, version, [name for name, _ in headers], volume)
+
+
+class StreamedDicomSeries:
+    """
+    The sorted slices of one folder, for a series too large to hold in memory:
+    each slice is decoded from its file when it is requested.
+
+    Attributes:
+        folder (str): Folder of the series.
+        version (str): series_version of the folder when it was scanned.
+        names (list of str): File name of each slice, in slice order.
+        shape (tuple): (slices, rows, columns) of the series.
+        volume (None): No volume is held, so nothing is pre-rendered.
+    """
+
+    volume = None
+    nbytes = 0
+
+    def __init__(self, folder, version, names, rows, columns):
+        self.folder = folder
+        self.version = version
+        self.names = names
+        self.shape = (len(names), rows, columns)
+        self._index = {name: index for index, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, name):
+        return self._index.get(name)
+
+    def slice(self, index):
+        pixels = pydicom.dcmread(os.path.join(self.folder, self.names[index]))
+        pixels = pixels.pixel_array
+        pixels.flags.writeable = False
+        return pixels
+
+    def window_stats(self, index):
+        pixels = self.slice(index)
+        return {
+            "min": pixels.min().item(),
+            "max": pixels.max().item(),
+            "mean": float(pixels.mean()),
+            "std": float(pixels.std()),
+        }
+
+
+def volume_nbytes(headers):
+    """
+    Estimates the size of the decoded volume of a series from its first header.
+    """
+    header = headers[0][1]
+    sample_bytes = (int(getattr(header, "BitsAllocated", 16)) + 7) // 8
+    samples = int(getattr(header, "SamplesPerPixel", 1))
+    return (
+        len(headers) * int(header.Rows) * int(header.Columns) * sample_bytes * samples
+    )
+
+
+def load_series(folder):
+    """
+    Returns the series of a folder, loading it only once per series version.
+
+    Adding, removing, renaming or rewriting a slice changes the version and
+    reloads the series. A series whose volume would not fit in SERIES_CACHE is
+    returned as a StreamedDicomSeries, which reads one slice per request,
+    rather than being decoded whole on every request.
+
+    Args:
+        folder (str): Folder holding the slices of one series.
+
+    Returns:
+        DicomSeries or StreamedDicomSeries: The shared, read-only series.
+    """
+    version = series_version(folder)
+    key = (folder, version)
+    series = SERIES_CACHE.get(key)
+    if series is not None:
+        return series
+    with LOAD_LOCKS_LOCK:
+        lock = LOAD_LOCKS.setdefault(folder, threading.Lock())
+    with lock:
+        series = SERIES_CACHE.get(key)
+        if series is None:
+            headers = scan_headers(folder)
+            if not headers:
+                raise FileNotFoundError(f"No DICOM file found in directory: {folder}")
+            nbytes = volume_nbytes(headers)
+            if nbytes > SERIES_CACHE.max_bytes:
+                logger.warning(
+                    "%s: series of %d MB exceeds the %d MB series cache; "
+                    "slices are read from their files on each request",
+                    folder,
+                    nbytes // 2**20,
+                    SERIES_CACHE.max_bytes // 2**20,
+                )
+                header = headers[0][1]
+                series = StreamedDicomSeries(
+                    folder,
+                    version,
+                    [name for name, _ in headers],
+                    int(header.Rows),
+                    int(header.Columns),
+                )
+            else:
+                series = DicomSeries.read(folder, version, headers)
+            SERIES_CACHE.put(key, series)
+    return series
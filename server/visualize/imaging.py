@@ -0,0 +1,351 @@
+"""
+Module: imaging.py
+
+Description:
+This module provides slice-addressable access to the 4D imaging-mode matrix
+([rows, columns, metabolites, images]) stored as a .npy file. The file is memory-mapped, so
+serving one image, one voxel time series or a strided preview only reads the bytes it needs.
+
+Functions:
+- open_imaging_matrix(path): Memory-maps the imaging matrix, reusing the mapping until the file changes.
+- read_npy_header(path): Shape, memory order and dtype of a .npy file, from its header only.
+- compute_imaging_stats(data): Per-metabolite min, max and mean in one pass over the matrix.
+- write_imaging_stats(path): Job task persisting the summary stats of a matrix.
+- read_imaging_metadata(path): Shape, dtype and the persisted summary stats, in constant time.
+- imaging_etag(path, *parts): Entity tag for a chunk of an imaging file.
+- read_image(data, metabolite, image): One [rows, columns] image.
+- read_voxel(data, row, column, metabolite): Time series of one voxel.
+- read_downsampled(data, step, metabolite, image): Strided preview of the matrix.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+
+IMAGING_DATA_PATH = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project5 HP-MRI/untitled folder/mock_mri_heatmap_data/mock_mri_heatmap_varied_trend.npy"
+
+# path -> ((mtime_ns, size), memmap)
+IMAGING_MATRICES = {}
+IMAGING_MATRICES_LOCK = threading.Lock()
+# path -> ((mtime_ns, size), metadata dict)
+IMAGING_METADATA = {}
+IMAGING_METADATA_LOCK = threading.Lock()
+# Summary stats are also persisted next to the data file under this suffix
+METADATA_SIDECAR_SUFFIX = ".meta.json"
+
+
+def file_version(path):
+    """
+    Returns the (mtime_ns, size) pair used to detect changes to a file.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        tuple: Modification time in nanoseconds and size in bytes.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def open_imaging_matrix(path=None):
+    """
+    Memory-maps a 4D imaging matrix read-only, reusing the mapping until the file changes.
+
+    Args:
+        path (str, optional): Path of the .npy file; IMAGING_DATA_PATH when None.
+
+    Returns:
+        np.memmap: Array shaped [rows, columns, metabolites, images].
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        ValueError: If the array is not 4-dimensional.
+    """
+    path = IMAGING_DATA_PATH if path is None else path
+    version = file_version(path)
+    with IMAGING_MATRICES_LOCK:
+        cached = IMAGING_MATRICES.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    data = np.load(path, mmap_mode="r")
+    if data.ndim != 4:
+        raise ValueError("Imaging data must be 4-dimensional")
+    with IMAGING_MATRICES_LOCK:
+        IMAGING_MATRICES[path] = (version, data)
+    return data
+
+
+def read_npy_header(path):
+    """
+    Reads the shape, memory order and dtype of a .npy file without loading its data.
+
+    Args:
+        path (str): Path of the .npy file.
+
+    Returns:
+        tuple: (shape, fortran_order, dtype).
+    """
+    with open(path, "rb") as npy:
+        version = np.lib.format.read_magic(npy)
+        if version == (1, 0):
+            return np.lib.format.read_array_header_1_0(npy)
+        # 3.0 only differs from 2.0 by allowing UTF-8 in structured field names,
+        # which numeric imaging matrices do not have
+        if version in ((2, 0), (3, 0)):
+            return np.lib.format.read_array_header_2_0(npy)
+        raise ValueError(f"Unsupported .npy format version {version}")
+
+
+def compute_imaging_stats(data):
+    """
+    Computes per-metabolite minimum, maximum and mean in one pass over the matrix.
+
+    The matrix is visited one row at a time, so only one row is resident at once.
+
+    Args:
+        data (np.ndarray): Imaging matrix [rows, columns, metabolites, images].
+
+    Returns:
+        list of dict: One {"min", "max", "mean"} entry per metabolite (NaN ignored).
+    """
+    metabolites = data.shape[2]
+    minimum = np.full(metabolites, np.inf)
+    maximum = np.full(metabolites, -np.inf)
+    total = np.zeros(metabolites)
+    count = np.zeros(metabolites)
+    for row in range(data.shape[0]):
+        block = np.asarray(data[row], dtype=float)  # [columns, metabolites, images]
+        valid = ~np.isnan(block)
+        minimum = np.fmin(minimum, np.nanmin(block, axis=(0, 2), initial=np.inf))
+        maximum = np.fmax(maximum, np.nanmax(block, axis=(0, 2), initial=-np.inf))
+        total += np.where(valid, block, 0).sum(axis=(0, 2))
+        count += valid.sum(axis=(0, 2))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    return [
+        {
+            "min": float(low) if count[m] else None,
+            "max": float(high) if count[m] else None,
+            "mean": float(mean[m]) if count[m] else None,
+        }
+        for m, (low, high) in enumerate(zip(minimum, maximum))
+    ]
+
+
+def read_stats_sidecar(path, version):
+    """
+    Returns the metadata persisted next to an imaging file for a file version,
+    or None when there is none or it is stale.
+    """
+    try:
+        with open(path + METADATA_SIDECAR_SUFFIX) as sidecar:
+            stored = json.load(sidecar)
+        if tuple(stored.get("version", ())) == version:
+            return stored["metadata"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def header_metadata(path):
+    """
+    Returns the metadata of an imaging file known from its .npy header, with
+    the summary stats left empty.
+
+    Raises:
+        ValueError: If the array is not 4-dimensional.
+    """
+    shape, _, dtype = read_npy_header(path)
+    if len(shape) != 4:
+        raise ValueError("Imaging data must be 4-dimensional")
+    rows, cols, num_metabolites, num_images = shape
+    return {
+        "rows": rows,
+        "columns": cols,
+        "numMetabolites": num_metabolites,
+        "numImages": num_images,
+        "dtype": dtype.str,
+        "metaboliteStats": None,
+        "min": None,
+        "max": None,
+    }
+
+
+def write_imaging_stats(path=None):
+    """
+    Imaging stats task of the background job queue: computes the summary stats
+    of a matrix in one pass and persists them, with its header metadata, in a
+    sidecar JSON file next to the data. The sidecar is replaced atomically, so
+    readers never see a partial file.
+
+    Args:
+        path (str, optional): Path of the .npy file; IMAGING_DATA_PATH when None.
+
+    Returns:
+        tuple: {"sidecar": path} and no arrays.
+    """
+    path = IMAGING_DATA_PATH if path is None else path
+    version = file_version(path)
+    sidecar_path = path + METADATA_SIDECAR_SUFFIX
+    if read_stats_sidecar(path, version) is not None:
+        return {"sidecar": sidecar_path}, {}
+
+    metadata = header_metadata(path)
+    stats = compute_imaging_stats(open_imaging_matrix(path))
+    known = [entry for entry in stats if entry["min"] is not None]
+    metadata.update(
+        {
+            "metaboliteStats": stats,
+            "min": min((entry["min"] for entry in known), default=None),
+            "max": max((entry["max"] for entry in known), default=None),
+        }
+    )
+    temporary = f"{sidecar_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporary, "w") as sidecar:
+            json.dump({"version": list(version), "metadata": metadata}, sidecar)
+        os.replace(temporary, sidecar_path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return {"sidecar": sidecar_path}, {}
+
+
+def imaging_stats_version(path=None):
+    return list(file_version(IMAGING_DATA_PATH if path is None else path))
+
+
+def read_imaging_metadata(path=None):
+    """
+    Returns the shape, dtype and per-metabolite summary stats of an imaging matrix
+    in constant time.
+
+    The shape and dtype come from the .npy header alone. The summary stats need
+    a pass over the data, which the "imaging_stats" job (write_imaging_stats)
+    makes off the request path; until it has written the sidecar for the
+    current file version they are None and "statsPending" is true.
+
+    Args:
+        path (str, optional): Path of the .npy file; IMAGING_DATA_PATH when None.
+
+    Returns:
+        dict: rows, columns, numMetabolites, numImages, dtype, metaboliteStats,
+        min, max and statsPending.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        ValueError: If the array is not 4-dimensional.
+    """
+    path = IMAGING_DATA_PATH if path is None else path
+    version = file_version(path)
+    with IMAGING_METADATA_LOCK:
+        cached = IMAGING_METADATA.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    metadata = read_stats_sidecar(path, version)
+    if metadata is None:
+        return dict(header_metadata(path), statsPending=True)
+    metadata = dict(metadata, statsPending=False)
+    with IMAGING_METADATA_LOCK:
+        IMAGING_METADATA[path] = (version, metadata)
+    return metadata
+
+
+def imaging_etag(path, *parts):
+    """
+    Builds an entity tag that changes whenever the file or the requested chunk changes.
+
+    Args:
+        path (str): Path of the imaging file.
+        *parts: Values identifying the chunk (endpoint name, indices, ...).
+
+    Returns:
+        str: Hex digest usable as a strong ETag.
+    """
+    mtime_ns, size = file_version(path)
+    key = "\0".join(str(part) for part in (path, mtime_ns, size) + parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def check_index(name, index, size):
+    """
+    Validates an index along one axis of the imaging matrix.
+
+    Raises:
+        IndexError: If the index is outside [0, size).
+    """
+    if not 0 <= index < size:
+        raise IndexError(f"{name} index {index} out of range [0, {size})")
+
+
+def read_image(data, metabolite, image):
+    """
+    Reads one image of one metabolite.
+
+    Args:
+        data (np.ndarray): Imaging matrix [rows, columns, metabolites, images].
+        metabolite (int): Metabolite index.
+        image (int): Image (time point) index.
+
+    Returns:
+        np.ndarray: Array shaped [rows, columns].
+    """
+    check_index("metabolite", metabolite, data.shape[2])
+    check_index("image", image, data.shape[3])
+    return np.asarray(data[:, :, metabolite, image])
+
+
+def read_voxel(data, row, column, metabolite=None):
+    """
+    Reads the time series of one voxel.
+
+    Args:
+        data (np.ndarray): Imaging matrix [rows, columns, metabolites, images].
+        row (int): Row index.
+        column (int): Column index.
+        metabolite (int, optional): Metabolite index; all metabolites when None.
+
+    Returns:
+        np.ndarray: Array shaped [metabolites, images], or [images] for one metabolite.
+    """
+    check_index("row", row, data.shape[0])
+    check_index("column", column, data.shape[1])
+    if metabolite is None:
+        return np.asarray(data[row, column])
+    check_index("metabolite", metabolite, data.shape[2])
+    return np.asarray(data[row, column, metabolite])
+
+
+def read_downsampled(data, step, metabolite=None, image=None):
+    """
+    Reads a strided preview of the imaging matrix.
+
+    Args:
+        data (np.ndarray): Imaging matrix [rows, columns, metabolites, images].
+        step (int): Stride applied to the row, column and image axes.
+        metabolite (int, optional): Keep only this metabolite.
+        image (int, optional): Keep only this image instead of striding the image axis.
+
+    Returns:
+        np.ndarray: The strided array; selected axes are kept with length 1.
+    """
+    if step < 1:
+        raise ValueError("step must be a positive integer")
+    metabolites = slice(None)
+    if metabolite is not None:
+        check_index("metabolite", metabolite, data.shape[2])
+        metabolites = slice(metabolite, metabolite + 1)
+    images = slice(None, None, step)
+    if image is not None:
+        check_index("image", image, data.shape[3])
+        images = slice(image, image + 1)
+    return np.asarray(data[::step, ::step, metabolites, images])
@@ -0,0 +1,536 @@
+"""
+Module: jobs.py
+
+Description:
+This module runs reconstructions as background jobs so request threads never wait on the
+FFT work. A request submits a job and gets its id back at once; the job runs on a process
+pool and its result is written to a cache directory as an .npz archive, from which
+/jobs/<id>/result serves it. Results are keyed by the task, its parameters and the
+version of its input data, so a resubmitted job whose result is cached completes at once,
+and a job already queued or running with the same key is shared.
+
+Job records live in a pluggable queue: MemoryJobQueue keeps them in the process and
+SQLiteJobQueue persists them, which the job queue benchmark uses to inspect the state of a
+run.
+
+Classes:
+- Job: Record of one submitted job.
+- JobQueue: Interface of the job record stores.
+- MemoryJobQueue: Job records kept in a dict.
+- SQLiteJobQueue: Job records kept in a SQLite database.
+- JobRunner: Submits jobs to a process pool and tracks them in a queue.
+
+Functions:
+- register_task(kind, target, version): Registers a task that jobs can run.
+- cache_key(kind, params): Cache key of a task run.
+- cached_result(kind, params, cache_dir): Path of a cached result, or None.
+- run_task(target, params, path): Entry point executed in the worker processes.
+- read_result(path): Loads the metadata and arrays of a cached result.
+"""
+
+import abc
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CACHE_DIR = os.environ.get(
+    "JOBS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "job_cache"),
+)
+# Finished jobs beyond this count are forgotten by MemoryJobQueue, oldest first
+MAX_JOBS = 1024
+# Name of the .npz entry holding the JSON metadata of a result
+METADATA_ENTRY = "__metadata__"
+
+# kind -> (target "module:function", version "module:function" or None)
+TASKS = {}
+# True in the job worker processes, so tasks can tell they already run on the job pool
+IN_WORKER = False
+
+
+def register_task(kind, target, version=None):
+    """
+    Registers a task that jobs can run.
+
+    Tasks are named by "module:function" strings and only imported when a job
+    runs (in the worker) or a version is computed, so registering one costs
+    nothing and the workers never need to unpickle a function object.
+
+    Args:
+        kind (str): Task name used in job submissions.
+        target (str): "module:function" called as function(**params); it returns
+            (metadata dict, dict of name -> ndarray).
+        version (str, optional): "module:function" called as function(**params);
+            returns a JSON-serializable version of the input data, so results
+            are recomputed when the data changes.
+    """
+    TASKS[kind] = (target, version)
+
+
+def resolve(target):
+    module, _, function = target.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def cache_key(kind, params):
+    """
+    Returns the cache key of a task run: a hash of the task, its parameters
+    and the version of its input data.
+
+    Raises:
+        ValueError: If the task is not registered.
+    """
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    _, version = TASKS[kind]
+    data_version = resolve(version)(**params) if version else None
+    payload = json.dumps([kind, params, data_version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def result_path(kind, key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, kind, f"{key}.npz")
+
+
+def cached_result(kind, params, cache_dir=None):
+    """
+    Returns the path of the cached result of a task run, or None when the
+    task has not run on the current version of its input data.
+    """
+    path = result_path(kind, cache_key(kind, params), cache_dir)
+    return path if os.path.exists(path) else None
+
+
+def run_task(target, params, path):
+    """
+    Runs a task and writes its result; executed in the worker processes.
+
+    The result is written to a temporary file and renamed into place, so a
+    result file is always complete.
+
+    Returns:
+        str: Path of the result file.
+    """
+    global IN_WORKER
+    IN_WORKER = True
+    metadata, arrays = resolve(target)(**params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    np.savez(
+        temporary,
+        **{METADATA_ENTRY: np.frombuffer(json.dumps(metadata).encode(), np.uint8)},
+        **{name: np.asarray(array) for name, array in arrays.items()},
+    )
+    os.replace(temporary, path)
+    return path
+
+
+def read_result(path):
+    """
+    Loads the metadata and arrays of a cached result.
+
+    Returns:
+        tuple: (metadata dict, dict of name -> ndarray).
+    """
+    with np.load(path) as archive:
+        metadata = json.loads(archive[METADATA_ENTRY].tobytes())
+        arrays = {
+            name: archive[name] for name in archive.files if name != METADATA_ENTRY
+        }
+    return metadata, arrays
+
+
+class Job:
+    """
+    Record of one submitted job.
+
+    Attributes:
+        id (str): Job identifier returned to the client.
+        kind (str): Registered task name.
+        params (dict): Keyword arguments of the task.
+        key (str): Cache key of the result (task, parameters and data version).
+        status (str): "queued", "running", "completed" or "failed".
+        created (float): Submission time as a Unix timestamp.
+        finished (float or None): Completion time as a Unix timestamp.
+        error (str or None): Error message of a failed job.
+        cached (bool): Whether the result was already cached at submission.
+    """
+
+    FIELDS = (
+        "id",
+        "kind",
+        "params",
+        "key",
+        "status",
+        "created",
+        "finished",
+        "error",
+        "cached",
+    )
+
+    def __init__(
+        self,
+        kind,
+        params,
+        key,
+        status="queued",
+        created=None,
+        finished=None,
+        error=None,
+        cached=False,
+        id=None,
+    ):
+        self.id = id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = status
+        self.created = time.time() if created is None else created
+        self.finished = finished
+        self.error = error
+        self.cached = cached
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+            "cached": self.cached,
+        }
+
+
+class JobQueue(abc.ABC):
+    """
+    Interface of the job record stores used by JobRunner.
+
+    Implementations must be safe to call from several threads.
+    """
+
+    @abc.abstractmethod
+    def add(self, job):
+        """
+        Stores a new job.
+        """
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        """
+        Returns the job with the given id, or None.
+        """
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        """
+        Sets fields of a stored job.
+        """
+
+    @abc.abstractmethod
+    def find_active(self, key):
+        """
+        Returns a queued or running job with the given cache key, or None.
+        """
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    Job records kept in a dict; finished jobs beyond max_jobs are forgotten.
+    """
+
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            for job_id in list(self._jobs):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if self._jobs[job_id].done:
+                    del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                for name, value in fields.items():
+                    setattr(job, name, value)
+
+    def find_active(self, key):
+        with self._lock:
+            return next(
+                (job for job in self._jobs.values() if job.key == key and not job.done),
+                None,
+            )
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job records kept in a SQLite database, so they can be inspected outside
+    the process and survive a restart.
+
+    Attributes:
+        path (str): Database path, or ":memory:".
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, "
+                "params TEXT, key TEXT, status TEXT, created REAL, finished REAL, "
+                "error TEXT, cached INTEGER)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_key_status ON jobs (key, status)"
+            )
+
+    def _job(self, row):
+        fields = dict(zip(Job.FIELDS, row))
+        fields["params"] = json.loads(fields["params"])
+        fields["cached"] = bool(fields["cached"])
+        return Job(**fields)
+
+    def add(self, job):
+        values = [getattr(job, name) for name in Job.FIELDS]
+        values[Job.FIELDS.index("params")] = json.dumps(job.params)
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO jobs ({', '.join(Job.FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(Job.FIELDS))})",
+                values,
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(Job.FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row) if row else None
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                list(fields.values()) + [job_id],
+            )
+
+    def find_active(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(Job.FIELDS)} FROM jobs "
+                f"WHERE key = ? AND status IN ('queued', 'running') LIMIT 1",
+                (key,),
+            ).fetchone()
+        return self._job(row) if row else None
+
+
+class JobRunner:
+    """
+    Submits jobs to a process pool and tracks them in a queue.
+
+    The pool is created on the first submission, with the "spawn" start
+    method so workers do not inherit the threads of the web server.
+
+    Attributes:
+        queue (JobQueue): Store of the job records.
+        cache_dir (str): Directory of the result files; CACHE_DIR when None.
+        max_workers (int): Number of worker processes.
+        initializer (callable, optional): Called with initargs in every worker
+            when it starts, e.g. to configure data paths.
+    """
+
+    def __init__(
+        self,
+        queue=None,
+        cache_dir=None,
+        max_workers=None,
+        initializer=None,
+        initargs=(),
+    ):
+        self.queue = MemoryJobQueue() if queue is None else queue
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+            return self._executor
+
+    def cache_key(self, kind, params):
+        return cache_key(kind, params)
+
+    def result_path(self, job):
+        return result_path(job.kind, job.key, self.cache_dir)
+
+    def submit(self, kind, params):
+        """
+        Submits a task run, reusing a cached result or an identical active job.
+
+        Args:
+            kind (str): Registered task name.
+            params (dict): JSON-serializable keyword arguments of the task.
+
+        Returns:
+            Job: The job tracking the run.
+
+        Raises:
+            ValueError: If the task is not registered.
+        """
+        key = self.cache_key(kind, params)
+        job = Job(kind, params, key)
+        if os.path.exists(self.result_path(job)):
+            job.status = "completed"
+            job.finished = job.created
+            job.cached = True
+            self.queue.add(job)
+            return job
+        with self._lock:
+            active = self.queue.find_active(key)
+            if active is not None:
+                return active
+            self.queue.add(job)
+        target, _ = TASKS[kind]
+        try:
+            future = self._pool().submit(
+                run_task, target, params, self.result_path(job)
+            )
+        except Exception as error:
+            # Otherwise the job would stay queued and find_active would share it forever
+            self.queue.update(
+                job.id,
+                status="failed",
+                error=f"{type(error).__name__}: {error}",
+                finished=time.time(),
+            )
+            raise
+        with self._lock:
+            self._futures[job.id] = future
+        future.add_done_callback(lambda future: self._finished(job.id, future))
+        return job
+
+    def _finished(self, job_id, future):
+        error = future.exception()
+        self.queue.update(
+            job_id,
+            status="failed" if error is not None else "completed",
+            error=None if error is None else f"{type(error).__name__}: {error}",
+            finished=time.time(),
+        )
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def get(self, job_id):
+        """
+        Returns the job with the given id, or None. Queued jobs the pool has
+        started are reported as running.
+        """
+        job = self.queue.get(job_id)
+        if job is not None and job.status == "queued":
+            with self._lock:
+                future = self._futures.get(job_id)
+            if future is not None and future.running():
+                job.status = "running"
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """
+        Blocks until a job finishes, or the timeout in seconds expires.
+
+        Returns:
+            Job or None: The job record.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.done:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(0.01)
+
+    def result(self, job):
+        """
+        Loads the result of a completed job.
+
+        Returns:
+            tuple: (metadata dict, dict of name -> ndarray).
+        """
+        return read_result(self.result_path(job))
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+register_task(
+    "hupc_precompute",
+    "visualize.magnets.hupc_processing:precompute_dataset",
+    version="visualize.magnets.hupc_processing:epsi_version",
+)
+register_task(
+    "hupc_epsi",
+    "visualize.magnets.hupc_processing:reconstruct_epsi",
+    version="visualize.magnets.hupc_processing:epsi_version",
+)
+register_task(
+    "hupc_composites",
+    "visualize.magnets.hupc_processing:export_composites",
+    version="visualize.magnets.hupc_processing:composites_version",
+)
+register_task(
+    "imaging_stats",
+    "visualize.imaging:write_imaging_stats",
+    version="visualize.imaging:imaging_stats_version",
+)
+register_task(
+    "imaging_animation",
+    "visualize.animations:export_animation",
+    version="visualize.animations:animation_version",
+)
@@ -1,13 +1,17 @@
 import os
-import struct
+import threading
 import traceback
 import numpy as np
-from flask import jsonify, send_file
-from PIL import Image
-import cv2
-import pydicom
-from scipy.fft import fftn
-import io
+from flask import jsonify
+
+from visualize import artifacts, imaging
+from visualize.cache import ByteLRUCache
+from visualize.dicom_series import count_slices, load_series
+from visualize.transport import binary_response
+
+# SciPy's FFT and the image stack (OpenCV, Pillow) are imported by the functions
+# that use them, so the workers of reconstruction jobs never load OpenCV and the
+# routes counting slices or datasets load neither (see visualize/magnets/registry.py)
 
 # Constants
 DICOM_FOLDER = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project4 HP MRI Web Application/hp-mri-web-application-yoonbenjamin/data/s_2023041103/fsems_rat_liver_03.dmc/"
@@ -17,45 +21,69 @@ FID_FOLDER = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project4 HP MRI W
 EPSI_INFO = {"pictures_to_read_write": 1, "proton": 60, "centric": 1}
 PATH_EPSI = ""
 SCALE = True
-ROWS = 12
-COLUMNS = 16
 MOVING_AVERAGE_WINDOW = 1
+# Normalized spectral data cubes, keyed by dataset and reconstruction parameters
+SPECTRAL_DATA_CACHE = ByteLRUCache(max_bytes=256 * 1024 * 1024)
+PLOT_SHIFT = [-0.3, -0.4]
+# Dataset folders of a study are named f"{EPSI_PREFIX}{index:02d}.fid"
+EPSI_PREFIX = "epsi_16x12_13c_"
+# Seconds between two scans of the study folder by StudyWatcher
+WATCH_INTERVAL = 5.0
+# Width of exported composites when no size is requested
+COMPOSITE_WIDTH = 512
 
 
 def get_num_slider_values():
     """
     Calculate the number of slider values based on available datasets or images.
 
+    The slices are counted without decoding them, from the loaded series when
+    the picture endpoint has already loaded it (see visualize/dicom_series.py).
+
     Returns:
         int: The total number of slider values (datasets or images).
     """
-    dicom_files = [file for file in os.listdir(DICOM_FOLDER) if file.endswith(".dcm")]
-    num_slider_values = len(dicom_files)
-    return num_slider_values
+    return count_slices(DICOM_FOLDER)
 
 
-def count_datasets():
+def dataset_indices():
     """
-    Counts the number of dataset folders within a specified EPSI folder.
+    Lists the EPSI datasets of the study.
     Folder names follow the format: 'epsi_16x12_13c_xx.fid', where 'xx' is the folder number.
 
     Returns:
-    int: Number of dataset folders.
+        list of int: Sorted dataset numbers.
     """
-    # Initialize the count of datasets
-    dataset_count = 0
-
-    # List all entries in the directory given by 'epsi_folder'
+    indices = []
     for entry in os.listdir(DATASET_FOLDER):
-        # Check if the entry is a directory and matches the expected pattern
+        number = entry[len(EPSI_PREFIX) : -len(".fid")]
         if (
-            os.path.isdir(os.path.join(DATASET_FOLDER, entry))
-            and entry.startswith("epsi_16x12_13c_")
+            entry.startswith(EPSI_PREFIX)
             and entry.endswith(".fid")
+            and number.isdigit()
+            and os.path.isdir(os.path.join(DATASET_FOLDER, entry))
         ):
-            dataset_count += 1
+            indices.append(int(number))
+    return sorted(indices)
+
+
+def count_datasets():
+    """
+    Counts the number of dataset folders within a specified EPSI folder.
+    Folder names follow the format: 'epsi_16x12_13c_xx.fid', where 'xx' is the folder number.
+
+    Returns:
+    int: Number of dataset folders.
+    """
+    return len(dataset_indices())
+
 
-    return dataset_count
+def proton_filename(slider_value):
+    return f"slice{slider_value:03d}image001echo001.dcm"
+
+
+def proton_slice(slider_value):
+    return DICOM_FOLDER, proton_filename(slider_value)
 
 
 def process_proton_picture(slider_value: int, data):
@@ -69,211 +97,865 @@ def process_proton_picture(slider_value: int, data):
     Returns:
         Flask Response: Image file as PNG or an error message in JSON format.
     """
-    try:
-        filename = f"slice{slider_value:03d}image001echo001.dcm"
-        dicom_path = os.path.join(DICOM_FOLDER, filename)
+    from visualize.proton_images import proton_png_response
 
-        if not os.path.exists(dicom_path):
-            return jsonify({"error": "DICOM file not found"}), 404
+    return proton_png_response(DICOM_FOLDER, proton_filename(slider_value), data)
 
-        dcm = pydicom.dcmread(dicom_path)
-        slice_image = dcm.pixel_array
-        slice_image[slice_image < 5] = 0
 
-        normalized_image = (slice_image - np.min(slice_image)) / (
-            np.max(slice_image) - np.min(slice_image)
-        )
-        normalized_image[normalized_image < 0.05] = 0.0
+def process_proton_stats(slider_value: int):
+    """
+    Returns the window statistics of the proton slice selected by a slider value.
 
-        contrast = data.get("contrast", 1)
-        clahe = cv2.createCLAHE(clipLimit=contrast, tileGridSize=(8, 8))
-        clahe_image = clahe.apply(np.uint8(normalized_image * 255))
-        clahe_image[clahe_image < 5] = 0
-        rescaled_image = clahe_image / 255.0
-        rescaled_image[rescaled_image < 0.05] = 0.0
+    Args:
+        slider_value (int): The index to determine which image to describe.
 
-        buffer = io.BytesIO()
-        pil_image = Image.fromarray((rescaled_image * 255).astype(np.uint8))
-        pil_image.save(buffer, format="PNG")
-        buffer.seek(0)
+    Returns:
+        Flask Response: JSON with min/max/mean/std of the slice or an error message.
+    """
+    from visualize.proton_images import proton_stats_response
 
-        return send_file(buffer, mimetype="image/png")
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    return proton_stats_response(DICOM_FOLDER, proton_filename(slider_value))
+
+
+class EpsiReconstruction:
+    """
+    The thresholded EPSI display data of one dataset, as returned by read_epsi_plot.
+
+    Attributes:
+        x_epsi (ndarray): X coordinates of the stacked spectra trace.
+        epsi (ndarray): Stacked spectra trace, NaN where masked or between rows.
+        spectral_data (ndarray): Normalized spectral data with masked voxels set to NaN.
+        rows (int): Number of grid rows.
+        columns (int): Number of grid columns.
+        lro_fid (float): Readout field of view of the proton image, in mm.
+        lpe_fid (float): Phase-encode field of view of the proton image, in mm.
+        lro_epsi (float): Readout field of view of the EPSI acquisition, in mm.
+        lpe_epsi (float): Phase-encode field of view of the EPSI acquisition, in mm.
+    """
+
+    def __init__(
+        self,
+        x_epsi,
+        epsi,
+        spectral_data,
+        rows,
+        columns,
+        lro_fid,
+        lpe_fid,
+        lro_epsi,
+        lpe_epsi,
+    ):
+        self.x_epsi = x_epsi
+        self.epsi = epsi
+        self.spectral_data = spectral_data
+        self.rows = rows
+        self.columns = columns
+        self.lro_fid = lro_fid
+        self.lpe_fid = lpe_fid
+        self.lro_epsi = lro_epsi
+        self.lpe_epsi = lpe_epsi
+
+    def metadata(self):
+        """
+        Returns the scalar display parameters of the reconstruction.
 
+        Returns:
+            dict: Grid size, fields of view and plot shift.
+        """
+        return {
+            "columns": self.columns,
+            "rows": self.rows,
+            "longitudinalScale": self.lro_fid,
+            "perpendicularScale": self.lpe_fid,
+            "longitudinalMeasurement": self.lro_epsi,
+            "perpendicularMeasurement": self.lpe_epsi,
+            "plotShift": PLOT_SHIFT,
+        }
+
+    def arrays(self):
+        """
+        Returns the array display data of the reconstruction.
+
+        Returns:
+            dict: xValues, data and spectralData arrays with NaN replaced by -1.
+        """
+        return {
+            "xValues": self.x_epsi,
+            "data": np.nan_to_num(self.epsi, nan=-1),
+            "spectralData": np.nan_to_num(self.spectral_data, nan=-1),
+        }
+
+    def to_dict(self):
+        """
+        Builds the JSON payload of the /get_hp_mri_data endpoint.
 
-def process_hp_mri_data(epsi_value, threshold):
+        Returns:
+            dict: Display parameters and arrays as nested lists.
+        """
+        payload = self.metadata()
+        for name, array in self.arrays().items():
+            payload[name] = array.tolist()
+        return payload
+
+
+def process_hp_mri_data(epsi_value, threshold, binary=False):
     """
     Retrieves and processes EPSI data based on given parameters, returning sanitized data for visualization.
 
     Args:
         epsi_value (int): EPSI slider value to fetch the corresponding data.
         threshold (float): Threshold value for filtering the data.
+        binary (bool): Return the arrays as float32 buffers (see visualize.transport)
+            instead of nested JSON lists.
 
     Returns:
-        json: Sanitized EPSI data or error message in JSON format.
+        Flask Response: Sanitized EPSI data, or error message in JSON format.
     """
     try:
-        global lro_fid, lpe_fid, lro_epsi, lpe_epsi, x_epsi, epsi, spectral_data, plot_shift
-        read_epsi_plot(epsi_value, threshold)
-
-        epsi_sanitized = np.nan_to_num(epsi, nan=-1).tolist()
-        spectral_data_sanitized = np.nan_to_num(spectral_data, nan=-1).tolist()
-        plot_shift = [-0.3, -0.4]
-
-        data_to_send = {
-            "xValues": x_epsi.tolist(),
-            "data": epsi_sanitized,
-            "columns": COLUMNS,
-            "spectralData": spectral_data_sanitized,
-            "rows": ROWS,
-            "longitudinalScale": lro_fid,
-            "perpendicularScale": lpe_fid,
-            "longitudinalMeasurement": lro_epsi,
-            "perpendicularMeasurement": lpe_epsi,
-            "plotShift": plot_shift,
-        }
-        return jsonify(data_to_send)
+        reconstruction = read_epsi_plot(epsi_value, threshold)
+        if binary:
+            return binary_response(reconstruction.metadata(), reconstruction.arrays())
+        return jsonify(reconstruction.to_dict())
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-def read_epsi_plot(epsi_value, threshold):
+def reconstruct_epsi(epsi_value, threshold):
     """
-    Processes EPSI data based on the configuration and value provided, filtering out low-intensity data.
+    Reconstruction task of the background job queue (see visualize/jobs.py).
 
     Args:
-        epsi_value (int): The EPSI value used to determine which data slice to process.
+        epsi_value (int): The EPSI dataset index.
         threshold (float): Intensity threshold for filtering data.
 
-    Modifies:
-        Updates global variables for spectral data and EPSI display parameters.
+    Returns:
+        tuple: Display parameters and arrays of the /get_hp_mri_data payload.
+    """
+    reconstruction = read_epsi_plot(epsi_value, threshold)
+    return reconstruction.metadata(), reconstruction.arrays()
+
+
+def epsi_version(epsi_value, threshold=None):
+    """
+    Returns the version of the files a reconstruction of a dataset reads, so
+    cached job results are recomputed when they change.
     """
-    global lro_fid, lpe_fid, lro_epsi, lpe_epsi, x_epsi, epsi, spectral_data
-    proton_quarter = EPSI_INFO["proton"] / 4
     path_epsi = f"{EPSI_FOLDER}{epsi_value:02d}"
-    spectral_data = read_write_spectral_data(EPSI_INFO, path_epsi, proton_quarter)
-    spectral_data = np.flip(np.flip(spectral_data, 0), 1)
+    files = []
+    for path in (
+        f"{path_epsi}.fid/fid",
+        f"{path_epsi}.fid/procpar",
+        f"{FID_FOLDER}.fid/procpar",
+    ):
+        stat = os.stat(path)
+        files.append([stat.st_mtime_ns, stat.st_size])
+    return [files, EPSI_INFO, SCALE, MOVING_AVERAGE_WINDOW]
 
-    if SCALE:
-        maximum_spectral_data_value = np.max(spectral_data)
-        spectral_data /= maximum_spectral_data_value
-    else:
-        maximum_spectral_data_value = np.max(spectral_data, axis=2)
-        spectral_data /= maximum_spectral_data_value
-
-    epsi = []
-    for i in range(ROWS):
-        row_information = []
-        for j in range(COLUMNS):
-            if np.max(spectral_data[i, j, :]) < threshold:
-                spectral_data[i, j, :] = np.nan
-            row_information = np.concatenate(
-                (
-                    np.squeeze(row_information),
-                    np.squeeze(np.roll(spectral_data[i, j, :], 0)),
-                )
+
+def read_geometry(epsi_value):
+    """
+    Reads the fields of view of the proton image and of an EPSI dataset.
+
+    Args:
+        epsi_value (int): The EPSI dataset index.
+
+    Returns:
+        dict: lroFid, lpeFid, lroEpsi and lpeEpsi in mm.
+    """
+    lro, lpe = read_procpar_values(["lro", "lpe"], FID_FOLDER)
+    lro_epsi, lpe_epsi = read_procpar_values(
+        ["lro", "lpe"], f"{EPSI_FOLDER}{epsi_value:02d}"
+    )
+    return {
+        "lroFid": lro[0] * 10,
+        "lpeFid": lpe[0] * 10,
+        "lroEpsi": lro_epsi[0] * 10,
+        "lpeEpsi": lpe_epsi[0] * 10,
+    }
+
+
+def reconstruction_parameters(epsi_value):
+    """
+    Returns the parameters that determine a dataset's normalized spectral cube
+    and geometry: the reconstruction settings and the content of the EPSI and
+    proton procpar files that the cube and the geometry are read with.
+
+    Raises:
+        FileNotFoundError: If a procpar file is missing.
+    """
+    return {
+        "epsi": EPSI_INFO,
+        "scale": SCALE,
+        "epsi_procpar": artifacts.fid_digest(
+            f"{EPSI_FOLDER}{epsi_value:02d}.fid/procpar"
+        ),
+        "proton_procpar": artifacts.fid_digest(f"{FID_FOLDER}.fid/procpar"),
+    }
+
+
+def ensure_dataset_artifact(epsi_value):
+    """
+    Returns the path of a dataset's reconstruction artifact (see
+    visualize/artifacts.py), reconstructing it if this FID content, these
+    procpar files and these parameters have not been reconstructed before.
+
+    Args:
+        epsi_value (int): The EPSI dataset index.
+
+    Returns:
+        str: Path of the artifact.
+    """
+    return artifacts.ensure_artifact(
+        f"{EPSI_FOLDER}{epsi_value:02d}.fid/fid",
+        reconstruction_parameters(epsi_value),
+        lambda: (load_spectral_data(epsi_value), read_geometry(epsi_value)),
+    )
+
+
+def precompute_dataset(epsi_value):
+    """
+    Precompute task of the background job queue: writes the reconstruction
+    artifact of a dataset.
+
+    Args:
+        epsi_value (int): The EPSI dataset index.
+
+    Returns:
+        tuple: {"artifact": path} and no arrays.
+    """
+    return {"artifact": ensure_dataset_artifact(epsi_value)}, {}
+
+
+def precompute_study(runner):
+    """
+    Reconstructs every EPSI dataset of the study on the job runner's worker
+    processes. Datasets whose artifacts are current complete at once.
+
+    Args:
+        runner (visualize.jobs.JobRunner): Runner executing the jobs.
+
+    Returns:
+        list of visualize.jobs.Job: One job per dataset.
+    """
+    return [
+        runner.submit("hupc_precompute", {"epsi_value": index})
+        for index in dataset_indices()
+    ]
+
+
+def dataset_artifact_path(epsi_value):
+    """
+    Returns the path of a dataset's reconstruction artifact, or None when the
+    current FID and procpar files have not been reconstructed with the current
+    parameters.
+    """
+    try:
+        key = artifacts.artifact_key(
+            f"{EPSI_FOLDER}{epsi_value:02d}.fid/fid",
+            reconstruction_parameters(epsi_value),
+        )
+    except FileNotFoundError:
+        return None
+    path = artifacts.artifact_path(key)
+    return path if os.path.exists(path) else None
+
+
+def load_precomputed(epsi_value):
+    """
+    Returns the precomputed spectral cube and geometry of a dataset, or None
+    when the dataset has no current artifact.
+
+    Returns:
+        tuple or None: Read-only float64 cube and geometry dict.
+    """
+    path = dataset_artifact_path(epsi_value)
+    if path is None:
+        return None
+
+    def load():
+        with artifacts.Artifact(path) as artifact:
+            spectral_data = artifact.read()
+            geometry = artifact.geometry
+        spectral_data.flags.writeable = False
+        return spectral_data, geometry
+
+    return SPECTRAL_DATA_CACHE.get_or_create(("HUPC-artifact", path), load)
+
+
+def read_voxel_spectrum(epsi_value, row, column):
+    """
+    Returns the normalized spectra of one voxel of a dataset.
+
+    With an artifact, only the chunks holding the voxel are read from disk;
+    otherwise the dataset is reconstructed (and cached) first.
+
+    Args:
+        epsi_value (int): The EPSI dataset index.
+        row (int): Grid row.
+        column (int): Grid column.
+
+    Returns:
+        ndarray: Spectra shaped (points, pictures).
+
+    Raises:
+        IndexError: If the voxel is outside the grid.
+    """
+
+    def voxel(spectral_data):
+        rows, columns = spectral_data.shape[:2]
+        if not (0 <= row < rows and 0 <= column < columns):
+            raise IndexError(
+                f"Voxel ({row}, {column}) outside the {rows}x{columns} grid"
             )
-        epsi = np.concatenate(
-            (np.squeeze(epsi), np.squeeze(row_information + ROWS - i))
+        return np.asarray(spectral_data[row, column])
+
+    path = dataset_artifact_path(epsi_value)
+    if path is None:
+        return voxel(load_spectral_data(epsi_value))
+    with artifacts.Artifact(path) as artifact:
+        return voxel(artifact.spectral_data)
+
+
+class StudyWatcher(threading.Thread):
+    """
+    Precomputes the EPSI datasets of the study as they appear.
+
+    The study folder is scanned every `interval` seconds. A dataset is
+    submitted once its files are unchanged between two scans, so folders
+    still being copied are not reconstructed half-written.
+    """
+
+    def __init__(self, runner, interval=WATCH_INTERVAL):
+        super().__init__(name="hupc-study-watcher", daemon=True)
+        self.runner = runner
+        self.interval = interval
+        self.stopped = threading.Event()
+        self._seen = {}
+        self._submitted = {}
+
+    def scan(self):
+        """
+        Submits the datasets that are new or changed and stable since the last scan.
+
+        Returns:
+            list of visualize.jobs.Job: The jobs submitted by this scan.
+        """
+        submitted = []
+        for index in dataset_indices():
+            try:
+                version = epsi_version(index)
+            except FileNotFoundError:
+                continue
+            stable = self._seen.get(index) == version
+            self._seen[index] = version
+            if stable and self._submitted.get(index) != version:
+                submitted.append(
+                    self.runner.submit("hupc_precompute", {"epsi_value": index})
+                )
+                self._submitted[index] = version
+        return submitted
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.scan()
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def data_paths():
+    """
+    Returns the study paths of this process, for configure_data_paths.
+    """
+    return {
+        "DICOM_FOLDER": DICOM_FOLDER,
+        "EPSI_FOLDER": EPSI_FOLDER,
+        "DATASET_FOLDER": DATASET_FOLDER,
+        "FID_FOLDER": FID_FOLDER,
+    }
+
+
+def configure_data_paths(paths):
+    """
+    Points the module at a study; initializer of the composite render workers,
+    so they read the study of the process that started them.
+    """
+    globals().update(paths)
+
+
+def composite_frames(slices=None, datasets=None):
+    """
+    Resolves the (slice, dataset) pairs of an export, every slice and dataset
+    of the study by default. Frames are ordered dataset-major, so consecutive
+    frames share one reconstruction.
+
+    Returns:
+        list of tuple: (slider value, EPSI dataset index, position of the dataset).
+    """
+    if slices is None:
+        slices = range(1, len(load_series(DICOM_FOLDER)) + 1)
+    if datasets is None:
+        datasets = dataset_indices()
+    return [
+        (slider_value, epsi_value, position)
+        for position, epsi_value in enumerate(datasets)
+        for slider_value in slices
+    ]
+
+
+def composites_version(slices=None, datasets=None, heatmap=None, **options):
+    """
+    Returns the version of the data an export reads, so exports are rebuilt
+    when the proton series, a dataset or the imaging matrix changes.
+    """
+    series = load_series(DICOM_FOLDER)
+    if datasets is None:
+        datasets = dataset_indices()
+    version = [series.version, [epsi_version(index) for index in datasets]]
+    if heatmap is not None:
+        version.append(imaging.file_version(imaging.IMAGING_DATA_PATH))
+    return version
+
+
+def render_composite_frame(frame):
+    """
+    Renders one frame of an export: the proton slice with the grid, the
+    spectra trace and the heatmap of one dataset (see visualize/composites.py).
+
+    Args:
+        frame (tuple): (slider value, EPSI dataset index, position of the
+            dataset in the export, options dict).
+
+    Returns:
+        tuple: (frame name, encoded bytes for zip exports or RGB array for
+        multi-page TIFF exports).
+    """
+    from visualize import composites
+    from visualize.contrast import contrast_slice
+
+    slider_value, epsi_value, position, options = frame
+    series = load_series(DICOM_FOLDER)
+    index = series.index_of(proton_filename(slider_value))
+    if index is None:
+        raise FileNotFoundError(f"Proton slice {slider_value} not found")
+    size = options["size"]
+    if size is None:
+        rows, columns = series.shape[1:]
+        size = (COMPOSITE_WIDTH, round(COMPOSITE_WIDTH * rows / columns))
+    proton = contrast_slice(series.slice(index), options["contrast"], size)
+
+    reconstruction = read_epsi_plot(epsi_value, options["threshold"])
+    heatmap = options["heatmap"]
+    values = None
+    if heatmap is not None:
+        values = imaging.read_image(
+            imaging.open_imaging_matrix(heatmap["path"]),
+            heatmap["metabolite"],
+            position,
         )
+    image = composites.composite(
+        proton,
+        reconstruction.metadata(),
+        reconstruction.x_epsi,
+        reconstruction.epsi if options["spectra"] else None,
+        reconstruction.spectral_data.shape[2],
+        heatmap=values,
+        color_scale=heatmap["color_scale"] if heatmap else "Hot",
+        alpha=heatmap["alpha"] if heatmap else 0.5,
+        grid=options["grid"],
+    )
+    name = f"slice{slider_value:03d}_dataset{epsi_value:02d}"
+    if options["output_format"] == "tiff":
+        return name, image
+    image_format = options["image_format"]
+    return f"{name}.{image_format}", composites.encode_frame(image, image_format)
+
+
+def export_composites(
+    slices=None,
+    datasets=None,
+    contrast=1.0,
+    threshold=0.2,
+    size=None,
+    output_format="zip",
+    image_format="png",
+    heatmap=None,
+    grid=True,
+    spectra=True,
+):
+    """
+    Composite export task of the background job queue: renders every
+    (slice, dataset) frame across a process pool into one archive.
+
+    Args:
+        slices (list of int, optional): Proton slider values; all by default.
+        datasets (list of int, optional): EPSI dataset indices; all by default.
+        contrast (float): CLAHE clip limit of the proton slices.
+        threshold (float): EPSI display threshold.
+        size (list, optional): Frame [width, height]; COMPOSITE_WIDTH wide by default.
+        output_format (str): "zip" of images or multi-page "tiff".
+        image_format (str): Image format inside a zip, "png" or "tiff".
+        heatmap (dict, optional): "metabolite", "color_scale" and "alpha" of an
+            imaging-matrix heatmap; the dataset's position in the export picks
+            the image (time point).
+        grid (bool): Draw the voxel grid.
+        spectra (bool): Draw the spectra trace.
+
+    Returns:
+        tuple: {"path", "filename", "mimetype", "frames"} and no arrays.
+    """
+    from visualize import composites
+
+    params = {
+        "slices": slices,
+        "datasets": datasets,
+        "contrast": contrast,
+        "threshold": threshold,
+        "size": size,
+        "output_format": output_format,
+        "image_format": image_format,
+        "heatmap": heatmap,
+        "grid": grid,
+        "spectra": spectra,
+    }
+    if output_format not in composites.OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'")
+    if image_format not in composites.IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}'")
+    path = composites.export_path(params, composites_version(**params), output_format)
+    frames = composite_frames(slices, datasets)
+    if os.path.exists(path):
+        return export_metadata(path, output_format, len(frames)), {}
+
+    options = dict(params, size=None if size is None else tuple(size))
+    if heatmap is not None:
+        composites.colormap_lut(heatmap["color_scale"])
+        options["heatmap"] = dict(heatmap, path=imaging.IMAGING_DATA_PATH)
+    rendered = composites.render_frames(
+        render_composite_frame,
+        [frame + (options,) for frame in frames],
+        initializer=configure_data_paths,
+        initargs=(data_paths(),),
+    )
+    count = composites.write_archive(path, output_format, rendered)
+    return export_metadata(path, output_format, count), {}
+
+
+def export_metadata(path, output_format, frames):
+    from visualize import composites
+
+    return {
+        "path": path,
+        "filename": f"hupc_composites.{output_format}",
+        "mimetype": composites.OUTPUT_FORMATS[output_format],
+        "frames": frames,
+    }
+
+
+def read_epsi_plot(epsi_value, threshold):
+    """
+    Processes EPSI data based on the configuration and value provided, filtering out low-intensity data.
+
+    The function has no side effects besides the shared, thread-safe caches,
+    so concurrent requests can call it from multiple threads.
+
+    Args:
+        epsi_value (int): The EPSI value used to determine which data slice to process.
+        threshold (float): Intensity threshold for filtering data.
+
+    Returns:
+        EpsiReconstruction: Spectral data and EPSI display parameters.
+    """
+    # Datasets precomputed on ingest are served from their artifacts
+    precomputed = load_precomputed(epsi_value)
+    if precomputed is not None:
+        spectral_data, geometry = precomputed
+    else:
+        spectral_data = load_spectral_data(epsi_value)
+        geometry = read_geometry(epsi_value)
+    # Thresholding writes NaNs, so work on a copy of the cached cube
+    spectral_data = spectral_data.copy()
+    rows, columns = spectral_data.shape[:2]
+    x_epsi, epsi = stack_epsi_traces(spectral_data, threshold)
+
+    return EpsiReconstruction(
+        x_epsi,
+        epsi,
+        spectral_data,
+        rows,
+        columns,
+        geometry["lroFid"],
+        geometry["lpeFid"],
+        geometry["lroEpsi"],
+        geometry["lpeEpsi"],
+    )
+
+
+def stack_epsi_traces(spectral_data, threshold):
+    """
+    Builds the stacked-spectra display trace of an EPSI grid.
+
+    Voxels whose maximum is below the threshold are set to NaN in place. The
+    spectra of each grid row are laid end to end and offset so that row i sits
+    at height rows - i, the first point of every row but the last is set to NaN
+    so the plot breaks between rows, and the trace is smoothed with a moving
+    average. All steps are whole-array operations, so the cost is linear in
+    the size of the grid.
+
+    Args:
+        spectral_data (ndarray): Spectral data (rows, columns, points, ...);
+            modified in place.
+        threshold (float): Intensity threshold for filtering data.
+
+    Returns:
+        tuple: x values and display trace, each of length rows * columns * points.
+    """
+    rows, columns = spectral_data.shape[:2]
+    below_threshold = spectral_data.reshape(rows, columns, -1).max(axis=2) < threshold
+    spectral_data[below_threshold] = np.nan
+    voxels = spectral_data.reshape(rows, columns, -1)
 
-    x_epsi = np.tile(np.arange(0, spectral_data.shape[2] * COLUMNS), ROWS)
-    for nan_rows in range(0, ROWS - 1):
-        epsi[nan_rows * spectral_data.shape[2] * COLUMNS] = np.nan
+    row_length = voxels.shape[1] * voxels.shape[2]
+    x_epsi = np.tile(np.arange(0, row_length), rows)
+    epsi = (voxels + np.arange(rows, 0, -1)[:, np.newaxis, np.newaxis]).ravel()
+    epsi[: (rows - 1) * row_length : row_length] = np.nan
     epsi = (
         np.convolve(epsi, np.ones(MOVING_AVERAGE_WINDOW), mode="same")
         / MOVING_AVERAGE_WINDOW
     )
     epsi[~np.isnan(epsi)] -= 1
+    return x_epsi, epsi
+
+
+def centric_echoes(nv):
+    """
+    Returns the centric phase-encode order of an nv-view acquisition.
+
+    Views are acquired from the center of k-space outwards, alternating
+    below and above it: for 12 views, rows 7, 6, 8, 5, 9, ..., 1.
+
+    Args:
+        nv (int): Number of phase-encode views.
+
+    Returns:
+        ndarray: 1-based row of each acquired view.
+    """
+    views = np.arange(nv)
+    return (views + 1) // 2 * np.where(views % 2, -1, 1) + nv // 2 + 1
+
+
+def load_spectral_data(epsi_value):
+    """
+    Returns the reconstructed, flipped and normalized spectral data of a dataset.
+
+    Reconstructions are cached per dataset, reconstruction parameters and fid
+    and procpar file versions, so requests that only change the threshold
+    reuse them.
 
-    # Update subplot positioning
-    lro_fid = read_write_procpar("lro", FID_FOLDER)[0] * 10
-    lpe_fid = read_write_procpar("lpe 1", FID_FOLDER)[0] * 10
-    lro_epsi = read_write_procpar("lro", path_epsi)[0] * 10
-    lpe_epsi = read_write_procpar("lpe 1", path_epsi)[0] * 10
+    Args:
+        epsi_value (int): The EPSI dataset index.
+
+    Returns:
+        ndarray: Read-only normalized spectral data cube.
+    """
+    path_epsi = f"{EPSI_FOLDER}{epsi_value:02d}"
+    fid_stat = os.stat(f"{path_epsi}.fid/fid")
+    # ne, np, nv and te2 of the procpar shape the reconstruction
+    procpar_stat = os.stat(f"{path_epsi}.fid/procpar")
+    key = (
+        "HUPC",
+        epsi_value,
+        EPSI_INFO["pictures_to_read_write"],
+        EPSI_INFO["proton"],
+        EPSI_INFO["centric"],
+        SCALE,
+        fid_stat.st_mtime_ns,
+        fid_stat.st_size,
+        procpar_stat.st_mtime_ns,
+        procpar_stat.st_size,
+    )
+    spectral_data = SPECTRAL_DATA_CACHE.get(key)
+    if spectral_data is not None:
+        return spectral_data
+
+    proton_quarter = EPSI_INFO["proton"] / 4
+    spectral_data = read_write_spectral_data(EPSI_INFO, path_epsi, proton_quarter)
+    spectral_data = np.ascontiguousarray(np.flip(np.flip(spectral_data, 0), 1))
+
+    if SCALE:
+        maximum_spectral_data_value = np.max(spectral_data)
+    else:
+        maximum_spectral_data_value = np.max(spectral_data, axis=2, keepdims=True)
+    spectral_data /= maximum_spectral_data_value
+
+    spectral_data.flags.writeable = False
+    SPECTRAL_DATA_CACHE.put(key, spectral_data)
+    return spectral_data
 
 
 def read_write_spectral_data(epsi_tmp, file_path, proton_quarter):
     """
     Reads and processes spectral data from the specified file.
 
+    Echo reordering, T2* weighting, zero filling, the FFT and the spectral
+    flip run as whole-array operations on a single k-space buffer, and all
+    pictures are transformed in one batched FFT. Picture i is read from
+    traces [i * nv * ne, (i + 1) * nv * ne) of the fid file; before the
+    batching, every picture re-read the first nv * ne traces.
+
     :param epsi: A dictionary containing configuration parameters for data processing.
     :param file_path: The path to the directory containing the spectral data files.
     :param proton_quarter: The proton quarter value used in data processing.
-    :return: Processed spectral data as a complex numpy array.
+    :return: Magnitude spectra shaped (nv, number_of_points, 2 * ne, pictures).
     :rtype: ndarray
 
     Author: Benjamin Yoon
     Date: 2023-11-03
-    Version: 1.0.0
-    """
-    global lro_fid, lpe_fid, lro_epsi, lpe_epsi, x_epsi, epsi, spectral_data
-    ne = read_write_procpar("ne", file_path)
-    ne = ne[0]
-    number_of_points = read_write_procpar("np", file_path)
-    number_of_points = number_of_points[0] // 2
-    nv = read_write_procpar("nv 1", file_path)
-    nv = nv[0]
-    te = read_write_procpar("te2", file_path)
+    Version: 1.1.0
+    """
+    from scipy.fft import fft, fftn
+
+    ne, number_of_points, nv, te = read_procpar_values(
+        ["ne", "np", "nv", "te2"], file_path
+    )
+    ne = int(ne[0])
+    number_of_points = int(number_of_points[0]) // 2
+    nv = int(nv[0])
     et = 1 / te[0]
+    pictures = int(epsi_tmp["pictures_to_read_write"])
 
     # Arrange echoes
     if epsi_tmp["centric"]:
-        echoes = np.array([0, -1, 1, -2, 2, -3, 3, -4, 4, -5, 5, -6]) + 7
+        echoes = centric_echoes(nv)
     else:
         echoes = np.arange(1, nv + 1)
-    tmp_spectral_data_array = np.zeros(
-        (int(nv), int(number_of_points), int(ne), epsi_tmp["pictures_to_read_write"]),
-        dtype=complex,
+
+    real_information, imaginary_information, _, _, _, _ = read_write_fid(file_path)
+    traces = nv * ne * pictures
+    if real_information.shape[1] < traces:
+        raise ValueError(
+            f"{file_path}: {pictures} picture(s) of {nv}x{ne} traces requested, "
+            f"fid holds {real_information.shape[1]} traces"
+        )
+
+    # Traces are ordered (picture, view, echo); scatter them into a
+    # (view, point, echo, picture) buffer in the echo order of the acquisition
+    trace_shape = (pictures, nv, ne, number_of_points)
+    k_space = np.zeros((nv, number_of_points, ne, pictures), dtype=complex)
+    k_space.real[echoes - 1] = (
+        real_information.T[:traces].reshape(trace_shape).transpose(1, 3, 2, 0)
     )
-    tmp_spectral_data_array_1 = tmp_spectral_data_array.copy()
-    tmp_spectral_data_array_2 = tmp_spectral_data_array.copy()
-    tmp_spectral_data_array_3 = np.zeros(
-        (
-            int(nv),
-            int(number_of_points),
-            int(2 * ne),
-            epsi_tmp["pictures_to_read_write"],
-        ),
-        dtype=complex,
+    k_space.imag[echoes - 1] = (
+        imaginary_information.T[:traces].reshape(trace_shape).transpose(1, 3, 2, 0)
     )
-    spectral_data = tmp_spectral_data_array_3.copy()
-    tmp_spectral_data = spectral_data.copy()
-    for i in range(epsi_tmp["pictures_to_read_write"]):
-        real_information, imaginary_information, _, _, _, _ = read_write_fid(file_path)
-        for j in range(int(ne)):
-            ix = np.arange(j, int(nv * ne), int(ne))
-            tmp_spectral_data_array[:, :, j, i] = (
-                real_information[:, ix] - 1j * imaginary_information[:, ix]
-            ).T
-        for j in range(int(nv)):
-            tmp_spectral_data_array_1[echoes[j] - 1, :, :, :] = tmp_spectral_data_array[
-                j, :, :, :
-            ]
-        for j in range(int(nv)):
-            for k in range(int(number_of_points)):
-                line = np.squeeze(tmp_spectral_data_array_1[j, k, :, i])
-                tmp_spectral_data_array_2[j, k, :, i] = line * np.exp(
-                    -np.arange(0, int(ne)).T * proton_quarter / et
-                )
-        tmp_spectral_data_array_3[:, :, 0 : int(ne), i] = tmp_spectral_data_array_2[
-            :, :, 0 : int(ne), i
-        ]
-        tmp_spectral_data_1 = np.fft.fftshift(
-            fftn(np.squeeze(tmp_spectral_data_array_3[:, :, :, i]))
-        )
-        tmp_spectral_data_2 = tmp_spectral_data_1.copy()
-        for j in range(0, int(nv)):
-            for k in range(0, int(number_of_points)):
-                tmp_spectral_data[j, k, :, i] = tmp_spectral_data_2[
-                    j, int(number_of_points - k - 1), ::-1
-                ]
-    spectral_data = np.abs(tmp_spectral_data)
-    epsi = epsi_tmp
-    return spectral_data
+    np.negative(k_space.imag, out=k_space.imag)
+
+    # T2* weighting along the echo axis
+    decay = np.exp(-np.arange(0, ne) * proton_quarter / et)
+    k_space *= decay[:, np.newaxis]
+
+    # The transform is separable: transform views and points on the acquired
+    # echoes only, then zero-fill the echo axis to 2 * ne in its own FFT
+    spectra = fftn(k_space, axes=(0, 1), overwrite_x=True)
+    spectra = fft(spectra, n=2 * ne, axis=2, overwrite_x=True)
+    spectral_data = np.fft.fftshift(np.abs(spectra), axes=(0, 1, 2))
+    return spectral_data[:, ::-1, ::-1, :]
+
+
+def parse_procpar(text):
+    """
+    Parses the text of a Varian 'procpar' file into a dictionary of parameters.
+
+    Each parameter is stored as a header line (name, subtype, basictype, ...),
+    a value line starting with the number of values (string values continue
+    on one line each), and an enumeration line.
+
+    Args:
+        text (str): Contents of the 'procpar' file.
+
+    Returns:
+        dict: Parameter name -> read-only float64 array for real parameters
+        (basictype 1), or tuple of str for string parameters (basictype 2).
+    """
+    parameters = {}
+    lines = text.splitlines()
+    i = 0
+    while i + 1 < len(lines):
+        header = lines[i].split()
+        if len(header) < 3:
+            i += 1
+            continue
+        name, basictype = header[0], header[2]
+        count, _, values = lines[i + 1].strip().partition(" ")
+        count = int(count)
+        i += 2
+        if basictype == "2":
+            strings = [values]
+            strings.extend(lines[i : i + count - 1])
+            i += max(count - 1, 0)
+            parameters[name] = tuple(value.strip().strip('"') for value in strings)
+        else:
+            array = np.array(values.split(), dtype=float)
+            array.flags.writeable = False
+            parameters[name] = array
+        # Skip the enumeration line
+        i += 1
+    return parameters
+
+
+# Parsed procpar files keyed by path, invalidated on mtime or size change
+PROCPAR_CACHE = {}
+PROCPAR_CACHE_LOCK = threading.Lock()
+
+
+def read_procpar(file_path):
+    """
+    Returns all parameters of a dataset's 'procpar' file, parsing it only once.
+
+    Args:
+        file_path (str): Path of the dataset without the '.fid' suffix.
+
+    Returns:
+        dict: Parsed parameters, see parse_procpar. Shared between callers and
+        must not be modified.
+    """
+    path = os.path.join(file_path + ".fid", "procpar")
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with PROCPAR_CACHE_LOCK:
+        cached = PROCPAR_CACHE.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(path) as procpar:
+        parameters = parse_procpar(procpar.read())
+    with PROCPAR_CACHE_LOCK:
+        PROCPAR_CACHE[path] = (version, parameters)
+    return parameters
+
+
+def read_procpar_values(names, file_path):
+    """
+    Looks up several 'procpar' parameters with a single (cached) parse.
+
+    Args:
+        names (list of str): Parameter names. Only the first token of each name
+            is used, so legacy keys such as "nv 1" are accepted.
+        file_path (str): Path of the dataset without the '.fid' suffix.
+
+    Returns:
+        list: The values of each parameter as a list, or None when missing.
+    """
+    parameters = read_procpar(file_path)
+    values = []
+    for name in names:
+        value = parameters.get(name.split()[0])
+        values.append(None if value is None else list(value))
+    return values
 
 
 # Method to read specific lines from a 'procpar' file
@@ -288,17 +970,63 @@ def read_write_procpar(read_line, file_path):
 
     Author: Benjamin Yoon
     Date: 2023-11-03
-    Version: 1.0.0
+    Version: 1.1.0
+    """
+    return read_procpar_values([read_line], file_path)[0]
+
+
+# Varian/Agilent 'fid' file layout: one 32-byte file header followed by
+# `blocks` blocks, each made of a 28-byte block header and `traces` traces of
+# `points` big-endian samples (int16, int32 or float32 depending on status).
+FID_FILE_HEADER = np.dtype(
+    [
+        ("blocks", ">i4"),
+        ("traces", ">i4"),
+        ("points", ">i4"),
+        ("eb", ">i4"),
+        ("tb", ">i4"),
+        ("bb", ">i4"),
+        ("vi", ">i2"),
+        ("s", ">i2"),
+        ("number_of_headers", ">i4"),
+    ]
+)
+FID_BLOCK_HEADER = np.dtype(
+    [
+        ("scale", ">i2"),
+        ("bs", ">i2"),
+        ("index", ">i2"),
+        ("m", ">i2"),
+        ("cc", ">i4"),
+        ("lv", ">f4"),
+        ("rv", ">f4"),
+        ("lvl", ">f4"),
+        ("tl", ">f4"),
+    ]
+)
+
+
+def fid_block_dtype(traces, points, s):
+    """
+    Builds the structured dtype of one 'fid' data block.
+
+    Args:
+        traces (int): Number of traces per block.
+        points (int): Number of points (real + imaginary) per trace.
+        s (int): Status word from the file header, selecting the sample type.
+
+    Returns:
+        tuple: The block dtype (block header followed by a (traces, points)
+        sample array) and the dtype the samples are returned as.
     """
-    global lro_fid, lpe_fid, lro_epsi, lpe_epsi, x_epsi, epsi, spectral_data
-    file_path = file_path + ".fid"
-    file_path = os.path.join(file_path, "procpar")
-    with open(file_path) as g:
-        read_lines = g.readlines()
-        for i, line in enumerate(read_lines):
-            if line.strip().startswith(read_line):
-                line_read = read_lines[i + 1].strip()
-                return [float(val) for val in line_read.split()[1:]]
+    if s & 8:
+        sample, output = ">f4", np.float64
+    elif s & 4:
+        sample, output = ">i4", np.int64
+    else:
+        sample, output = ">i2", np.int64
+    block = np.dtype([("header", FID_BLOCK_HEADER), ("data", sample, (traces, points))])
+    return block, output
 
 
 # Method to read data from a 'fid' file
@@ -306,101 +1034,59 @@ def read_write_fid(file_path):
     """
     Reads and processes data from the 'fid' file.
 
+    The file header, every block header and every trace are decoded in a
+    single pass through structured NumPy dtypes instead of one struct.unpack
+    per field.
+
     :param file_path: The path to the 'fid' file.
     :return: A tuple containing various data elements.
     :rtype: tuple
 
     Author: Benjamin Yoon
     Date: 2023-11-03
-    Version: 1.0.0
+    Version: 1.1.0
     """
-    global lro_fid, lpe_fid, lro_epsi, lpe_epsi, x_epsi, epsi, spectral_data
     path = f"{file_path}.fid/fid"
     with open(path, "rb") as fid:
-        blocks = struct.unpack(">i", fid.read(4))[0]
-        traces = struct.unpack(">i", fid.read(4))[0]
-        points = struct.unpack(">i", fid.read(4))[0]
-        eb = struct.unpack(">i", fid.read(4))[0]
-        tb = struct.unpack(">i", fid.read(4))[0]
-        bb = struct.unpack(">i", fid.read(4))[0]
-        vi = struct.unpack(">h", fid.read(2))[0]
-        s = struct.unpack(">h", fid.read(2))[0]
-        number_of_headers = struct.unpack(">i", fid.read(4))[0]
-        s32 = int(bool(s & 4))
-        sf = int(bool(s & 8))
-        real_information = []
-        imaginary_information = []
-        b = list(range(1, blocks + 1))
-        ob = len(b)
-        t = list(range(1, traces + 1))
-        ot = len(t)
-        i = 1
-        j = 1
-        for k in range(1, blocks + 1):
-            # Read a block header
-            scale = struct.unpack(">h", fid.read(2))[0]
-            bs = struct.unpack(">h", fid.read(2))[0]
-            index = struct.unpack(">h", fid.read(2))[0]
-            m = struct.unpack(">h", fid.read(2))[0]
-            cc = struct.unpack(">i", fid.read(4))[0]
-            lv = struct.unpack(">f", fid.read(4))[0]
-            rv = struct.unpack(">f", fid.read(4))[0]
-            lvl = struct.unpack(">f", fid.read(4))[0]
-            tl = struct.unpack(">f", fid.read(4))[0]
-            a = 1
-            kk = 0
-            for c in range(1, traces + 1):
-                # Read data for each trace
-                if sf == 1:
-                    d = struct.unpack(f">{points}f", fid.read(points * 4))
-                elif s32 == 1:
-                    d = struct.unpack(f">{points}i", fid.read(points * 4))
-                else:
-                    d = struct.unpack(f">{points}h", fid.read(points * 2))
-
-                # Keep the data if it matches the desired blocks and traces
-                if b[j - 1] == k:
-                    if a <= ot:
-                        if t[a - 1] == c:
-                            real_information.append(list(d[::2]))
-                            imaginary_information.append(list(d[1::2]))
-                            i += 1
-                            a += 1
-                            kk = 1
-            if kk:
-                j += 1
-            if j > ob:
-                break
-        real_information = np.array(real_information).T
-        imaginary_information = np.array(imaginary_information).T
-        number_of_points = points // 2
-        number_of_blocks = blocks
-        number_of_traces = traces
-        header_information = [
-            blocks,
-            traces,
-            points,
-            eb,
-            tb,
-            bb,
-            vi,
-            s,
-            number_of_headers,
-            scale,
-            bs,
-            index,
-            m,
-            cc,
-            lv,
-            rv,
-            lvl,
-            tl,
-        ]
-        return (
-            real_information,
-            imaginary_information,
-            number_of_points,
-            number_of_blocks,
-            number_of_traces,
-            header_information,
+        file_header = np.fromfile(fid, dtype=FID_FILE_HEADER, count=1)
+        if file_header.size != 1:
+            raise ValueError(f"Truncated fid header: {path}")
+        file_header = file_header[0]
+        blocks = int(file_header["blocks"])
+        traces = int(file_header["traces"])
+        points = int(file_header["points"])
+        block_dtype, output_dtype = fid_block_dtype(
+            traces, points, int(file_header["s"])
         )
+        block_data = np.fromfile(fid, dtype=block_dtype, count=blocks)
+    if block_data.size != blocks:
+        raise ValueError(
+            f"Truncated fid data: expected {blocks} blocks, found {block_data.size}"
+        )
+
+    # Traces are stored block-major; columns of the outputs are traces
+    samples = block_data["data"].reshape(blocks * traces, points)
+    real_information = samples[:, ::2].astype(output_dtype).T
+    imaginary_information = samples[:, 1::2].astype(output_dtype).T
+
+    # Like the original reader, report the header of the last block read
+    last_block = block_data["header"][-1]
+    header_information = [
+        blocks,
+        traces,
+        points,
+        int(file_header["eb"]),
+        int(file_header["tb"]),
+        int(file_header["bb"]),
+        int(file_header["vi"]),
+        int(file_header["s"]),
+        int(file_header["number_of_headers"]),
+    ] + [last_block[field].item() for field in FID_BLOCK_HEADER.names]
+    return (
+        real_information,
+        imaginary_information,
+        points // 2,
+        blocks,
+        traces,
+        header_information,
+    )
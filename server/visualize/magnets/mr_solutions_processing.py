@@ -6,10 +6,13 @@ This module contains functions for processing HP MRI data from MR Solutions magn
 
 Functions:
 - get_num_slider_values(): Calculate the number of slider values based on the available DICOM images.
+- dataset_folders(): Lists the dataset folders of the EPSI folder.
 - count_datasets(): Counts the number of dataset folders within a specified EPSI folder.
+- proton_slice(slider_value): DICOM folder and file name of a proton image.
 - process_proton_picture(slider_value, data): Retrieves and processes proton images based on slider inputs.
+- process_proton_stats(slider_value): Returns the window statistics of a proton image.
 - process_hpmri_data(epsi_value, threshold): Processes and filters HP MRI data using a dynamic threshold.
-- read_mrd_file(epsi_value): Reads MRD file data specific to MR Solutions format.
+- read_mrd_file(epsi_value): Memory-maps MRD file data specific to MR Solutions format.
 
 Author:
 Benjamin Yoon
@@ -23,25 +26,108 @@ Version:
 
 # Import statements
 import numpy as np
-from flask import jsonify, send_file
+from flask import jsonify
 import os
 import traceback
-from PIL import Image
-import cv2
-import pydicom
-import io
 from pathlib import Path
 
+from visualize.dicom_series import count_slices
+
 # Constants
 DICOM_FOLDER = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project4 HP MRI Web Application/hp-mri-web-application-yoonbenjamin/data/data MRS/proton/1/"
 DATASET_FOLDER = Path(
     "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project4 HP MRI Web Application/hp-mri-web-application-yoonbenjamin/data/data MRS/epsi/"
 )
-DATASET = [
-    folder
-    for folder in os.listdir(DATASET_FOLDER)
-    if os.path.isdir(DATASET_FOLDER / folder)
-]
+
+
+# The first 512 bytes of an .MRD file hold the acquisition dimensions and the
+# data type code; only the fields used here are named.
+MRD_HEADER_SIZE = 512
+MRD_HEADER = np.dtype(
+    {
+        "names": [
+            "samples",
+            "views",
+            "slice_views",
+            "slices",
+            "type",
+            "echoes",
+            "nex",
+        ],
+        "formats": ["<i4", "<i4", "<i4", "<i4", "<i2", "<i4", "<i4"],
+        "offsets": [0, 4, 8, 12, 18, 152, 156],
+        "itemsize": MRD_HEADER_SIZE,
+    }
+)
+
+
+def complex_pair(dtype):
+    """
+    Builds a structured dtype for one interleaved (real, imaginary) sample.
+
+    Args:
+        dtype (str): Dtype of each component.
+
+    Returns:
+        np.dtype: Structured dtype with "real" and "imag" fields.
+    """
+    return np.dtype([("real", dtype), ("imag", dtype)])
+
+
+# Data type code -> on-disk dtype of one point. Floating point complex data
+# maps directly onto NumPy complex types; integer pairs stay structured.
+MRD_DATA_TYPES = {
+    3: np.dtype("<i2"),
+    16: complex_pair("u1"),
+    17: complex_pair("i1"),
+    18: complex_pair("<i2"),
+    19: complex_pair("<i2"),
+    20: complex_pair("<i4"),
+    21: np.dtype("<c8"),
+    22: np.dtype("<c16"),
+}
+
+
+class InterleavedComplexArray:
+    """
+    A lazy complex view over a memory-mapped array of (real, imaginary) pairs.
+
+    Indexing converts only the selected points to complex values, so reading a
+    single slice, echo or NEX does not touch the rest of the file.
+
+    Attributes:
+        pairs (np.ndarray): Structured array with "real" and "imag" fields.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    @property
+    def shape(self):
+        return self.pairs.shape
+
+    @property
+    def ndim(self):
+        return self.pairs.ndim
+
+    @property
+    def size(self):
+        return self.pairs.size
+
+    @property
+    def dtype(self):
+        return np.dtype(complex)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, key):
+        pairs = self.pairs[key]
+        return pairs["real"] + 1j * pairs["imag"]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
 
 
 class MRSSolutionsDataProcessor:
@@ -55,6 +141,8 @@ class MRSSolutionsDataProcessor:
         slices (int): Number of slices in the dataset.
         echoes (int): Number of echoes in the dataset.
         nex (int): Number of experiments in the dataset.
+        raw_data (np.memmap or InterleavedComplexArray): Memory-mapped data
+            shaped (samples, views, slice_views, slices, echoes, nex).
     """
 
     def __init__(self):
@@ -67,87 +155,109 @@ class MRSSolutionsDataProcessor:
         self.slices = 0
         self.echoes = 0
         self.nex = 0
+        self.raw_data = None
+        self.parameters = b""
 
     def read_mrd_file(self, epsi_index):
         """
-        Reads an MRD file from a specified dataset index and extracts relevant MRI data.
+        Maps an MRD file from a specified dataset index and extracts relevant MRI data.
+
+        The header and the payload are memory-mapped in place; no sample is
+        read from disk until `raw_data` (or `read_block`) is indexed.
 
         Args:
             epsi_index (int): Index of the dataset folder from which to read the MRD file.
 
         """
-        folder_path = DATASET_FOLDER / DATASET[epsi_index]
+        folder_path = DATASET_FOLDER / dataset_folders()[epsi_index]
         files = [f for f in os.listdir(folder_path) if f.endswith(".MRD")]
         if not files:
             raise FileNotFoundError(f"No MRD file found in directory: {folder_path}")
+        file_path = folder_path / files[0]
+
+        header = np.memmap(file_path, dtype=MRD_HEADER, mode="r", shape=(1,))[0]
+        self.samples = int(header["samples"])
+        self.views = int(header["views"])
+        self.slice_views = int(header["slice_views"])
+        self.slices = int(header["slices"])
+        self.type = int(header["type"])
+        self.echoes = int(header["echoes"])
+        self.nex = int(header["nex"])
+
+        dtype = MRD_DATA_TYPES.get(self.type)
+        if dtype is None:
+            print("Unknown data format")
+            return
+
+        shape = (
+            self.samples,
+            self.views,
+            self.slice_views,
+            self.slices,
+            self.echoes,
+            self.nex,
+        )
+        total_points = int(np.prod(shape))
+        data = np.memmap(
+            file_path,
+            dtype=dtype,
+            mode="r",
+            offset=MRD_HEADER_SIZE,
+            shape=(total_points,),
+        )
+        data = np.reshape(data, shape, order="F")
+        self.raw_data = InterleavedComplexArray(data) if dtype.names else data
+
+        # Parameters are appended at the end of the file as a text description
+        with open(file_path, "rb") as fd:
+            fd.seek(MRD_HEADER_SIZE + total_points * dtype.itemsize)
+            self.parameters = fd.read()
+
+    def read_block(self, slice_index=None, echo_index=None, nex_index=None):
+        """
+        Reads the complex data of a single slice, echo and/or NEX.
 
-        with open(folder_path / files[0], "rb") as fd:
-            fdbytes = fd.read()
-            self.samples = np.frombuffer(fdbytes[0:4], dtype="int32")[0]
-            self.views = np.frombuffer(fdbytes[4:8], dtype="int32")[0]
-            self.slice_views = np.frombuffer(fdbytes[8:12], dtype="int32")[0]
-            self.slices = np.frombuffer(fdbytes[12:16], dtype="int32")[0]
-            self.type = np.frombuffer(fdbytes[18:20], dtype="int16")[0]
-            self.echoes = np.frombuffer(fdbytes[152:156], dtype="int32")[0]
-            self.nex = np.frombuffer(fdbytes[156:160], dtype="int32")[0]
-
-            total_points = (
-                self.samples
-                * self.views
-                * self.slice_views
-                * self.slices
-                * self.echoes
-                * self.nex
-            )
-            data_start = 512
-            data_type_map = {
-                3: ("int16", 2),
-                16: ("uint8", 2),
-                17: ("int8", 2),
-                18: ("int16", 4),
-                19: ("int16", 4),
-                20: ("int32", 8),
-                21: ("float32", 8),
-                22: ("float64", 16),
-            }
-
-            dtype, multiplier = data_type_map.get(self.type, (None, None))
-            if not dtype:
-                print("Unknown data format")
-                return
-
-            data_end = data_start + total_points * multiplier
-            data = np.frombuffer(fdbytes[data_start:data_end], dtype=dtype)
-
-            if self.type in (16, 17, 18, 19, 20, 21, 22):
-                data = data[::2] + 1j * data[1::2]  # Combining real and imaginary parts
-
-            self.raw_data = np.reshape(
-                data,
-                (
-                    self.samples,
-                    self.views,
-                    self.slice_views,
-                    self.slices,
-                    self.echoes,
-                    self.nex,
-                ),
-                order="F",
-            )
-            self.parameters = fdbytes[
-                data_end:
-            ]  # Parameters are appended at the end of the file as a text description
+        Only the pages of the mapped file covering the selection are read.
+
+        Args:
+            slice_index (int, optional): Slice to read, or None for all slices.
+            echo_index (int, optional): Echo to read, or None for all echoes.
+            nex_index (int, optional): NEX to read, or None for all NEX.
+
+        Returns:
+            np.ndarray: The selected data, with the selected axes removed.
+        """
+        key = tuple(
+            slice(None) if index is None else index
+            for index in (slice_index, echo_index, nex_index)
+        )
+        return np.asarray(self.raw_data[(Ellipsis,) + key])
 
 
 def get_num_slider_values():
     """
-    Retrieves the number of available slider values by counting DICOM files in a directory.
+    Retrieves the number of available slider values: the slices of the proton
+    series, counted without decoding their pixels.
 
     Returns:
         int: Total number of slider values available.
     """
-    dicom_files = [file for file in os.listdir(DICOM_FOLDER) if file.endswith(".dcm")]
-    return len(dicom_files)
+    return count_slices(DICOM_FOLDER)
+
+
+def dataset_folders():
+    """
+    Lists the dataset folders of the EPSI dataset directory. The directory is
+    read when a dataset is requested, not when the module is imported.
+
+    Returns:
+        list of str: Folder names, sorted so dataset indices are stable.
+    """
+    return sorted(
+        folder
+        for folder in os.listdir(DATASET_FOLDER)
+        if os.path.isdir(DATASET_FOLDER / folder)
+    )
 
 
 def count_datasets():
@@ -157,12 +267,15 @@ def count_datasets():
     Returns:
         int: Number of dataset folders found.
     """
-    dataset_count = 0
+    return len(dataset_folders())
+
 
-    for entry in os.listdir(DATASET_FOLDER):
-        dataset_count += 1
+def proton_filename(slider_value):
+    return f"5091_{slider_value:05d}.dcm"
 
-    return dataset_count
+
+def proton_slice(slider_value):
+    return DICOM_FOLDER, proton_filename(slider_value)
 
 
 def process_proton_picture(slider_value, data):
@@ -176,37 +289,25 @@ def process_proton_picture(slider_value, data):
     Returns:
         Flask Response: Either the image file as PNG or an error message in JSON format.
     """
-    try:
-        filename = f"5091_{slider_value:05d}.dcm"
-        dicom_path = os.path.join(DICOM_FOLDER, filename)
-        if not os.path.exists(dicom_path):
-            return jsonify({"error": "DICOM file not found"}), 404
-        # Image processing logic
-        dcm = pydicom.dcmread(dicom_path)
-        slice_image = dcm.pixel_array
-        slice_image[slice_image < 5] = 0
-
-        normalized_image = (slice_image - np.min(slice_image)) / (
-            np.max(slice_image) - np.min(slice_image)
-        )
-        normalized_image[normalized_image < 0.05] = 0.0
-
-        contrast = data.get("contrast", 1)
-        clahe = cv2.createCLAHE(clipLimit=contrast, tileGridSize=(8, 8))
-        clahe_image = clahe.apply(np.uint8(normalized_image * 255))
-        clahe_image[clahe_image < 5] = 0
-        rescaled_image = clahe_image / 255.0
-        rescaled_image[rescaled_image < 0.05] = 0.0
-
-        buffer = io.BytesIO()
-        pil_image = Image.fromarray((rescaled_image * 255).astype(np.uint8))
-        pil_image.save(buffer, format="PNG")
-        buffer.seek(0)
-
-        return send_file(buffer, mimetype="image/png")
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    # Imported on first use: the image stack (OpenCV, Pillow) is not needed to count slices
+    from visualize.proton_images import proton_png_response
+
+    return proton_png_response(DICOM_FOLDER, proton_filename(slider_value), data)
+
+
+def process_proton_stats(slider_value):
+    """
+    Returns the window statistics of the proton slice selected by a slider value.
+
+    Args:
+        slider_value (int): The index to determine which image to describe.
+
+    Returns:
+        Flask Response: JSON with min/max/mean/std of the slice or an error message.
+    """
+    from visualize.proton_images import proton_stats_response
+
+    return proton_stats_response(DICOM_FOLDER, proton_filename(slider_value))
 
 
 def process_hpmri_data(epsi_value, threshold):
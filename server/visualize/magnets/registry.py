@@ -0,0 +1,185 @@
+"""
+Module: registry.py
+
+Description:
+This module is the registry of magnet backends, the scanner types the visualization routes
+dispatch on. Each backend registers the capabilities it provides as "module:function"
+targets (as job tasks are registered, see visualize/jobs.py) and the job kinds it runs, so
+the routes look a backend up by the request's magnet type instead of branching on it, and a
+new scanner type plugs in with one register_magnet call. A backend's module and its heavy
+dependencies (pydicom, OpenCV, SciPy, ...) are only imported when one of its capabilities
+is first used, which keeps them out of the server's startup.
+
+Capabilities:
+- slider_values: () -> number of proton slider values.
+- datasets: () -> number of EPSI datasets.
+- proton_picture: (slider_value, data) -> proton PNG response.
+- proton_stats: (slider_value) -> proton window statistics response.
+- proton_slice: (slider_value) -> (DICOM folder, file name) of a proton slice, used as the
+  underlay of imaging animations.
+- hp_mri_data: (dataset, threshold, binary) -> HP MRI data response.
+- voxel_spectrum: (dataset, row, column) -> spectra of one voxel.
+- precompute: (runner) -> jobs reconstructing every dataset of the study.
+
+Classes:
+- MagnetBackend: Capabilities and job kinds of one magnet type.
+
+Functions:
+- register_magnet(magnet_type, functions, jobs): Registers a magnet backend.
+- get_magnet(magnet_type): Returns the backend of a magnet type, or None.
+- check_registry(resolve_targets): Lists baseline capabilities that no longer dispatch.
+
+Run `python -m visualize.magnets.registry` to also import every registered target.
+"""
+
+import sys
+
+from visualize.jobs import resolve
+
+
+class MagnetBackend:
+    """
+    Capabilities and job kinds of one magnet type.
+
+    Attributes:
+        magnet_type (str): Magnet type as sent by the frontend.
+        functions (dict): Capability -> "module:function" target.
+        jobs (dict): Job use ("reconstruction", "composites") -> registered job kind.
+    """
+
+    def __init__(self, magnet_type, functions, jobs=None):
+        self.magnet_type = magnet_type
+        self.functions = dict(functions)
+        self.jobs = dict(jobs or {})
+
+    def supports(self, capability):
+        return capability in self.functions
+
+    def function(self, capability):
+        """
+        Returns the function of a capability, importing its module on first use.
+
+        Raises:
+            KeyError: If the backend does not provide the capability.
+        """
+        return resolve(self.functions[capability])
+
+    def to_dict(self):
+        return {
+            "magnetType": self.magnet_type,
+            "capabilities": sorted(self.functions),
+            "jobs": sorted(self.jobs),
+        }
+
+
+# magnet type -> MagnetBackend, in registration order
+MAGNETS = {}
+
+
+def register_magnet(magnet_type, functions, jobs=None):
+    """
+    Registers a magnet backend. Registering imports nothing.
+
+    Args:
+        magnet_type (str): Magnet type as sent by the frontend.
+        functions (dict): Capability -> "module:function" target.
+        jobs (dict, optional): Job use -> job kind registered in visualize/jobs.py.
+
+    Returns:
+        MagnetBackend: The registered backend.
+    """
+    MAGNETS[magnet_type] = MagnetBackend(magnet_type, functions, jobs)
+    return MAGNETS[magnet_type]
+
+
+def get_magnet(magnet_type):
+    return MAGNETS.get(magnet_type)
+
+
+HUPC = "visualize.magnets.hupc_processing"
+CLINICAL = "visualize.magnets.clinical_processing"
+MR_SOLUTIONS = "visualize.magnets.mr_solutions_processing"
+
+# Capabilities each magnet type dispatched to a processing module before the registry;
+# the routes answering the others with a default (no slider values, no datasets) are not
+# listed
+BASELINE_CAPABILITIES = {
+    "HUPC": (
+        "slider_values",
+        "datasets",
+        "proton_picture",
+        "proton_stats",
+        "hp_mri_data",
+        "voxel_spectrum",
+    ),
+    "Clinical": ("proton_picture",),
+    "MR Solutions": ("slider_values", "datasets", "proton_picture", "proton_stats"),
+}
+
+register_magnet(
+    "HUPC",
+    {
+        "slider_values": f"{HUPC}:get_num_slider_values",
+        "datasets": f"{HUPC}:count_datasets",
+        "proton_picture": f"{HUPC}:process_proton_picture",
+        "proton_stats": f"{HUPC}:process_proton_stats",
+        "proton_slice": f"{HUPC}:proton_slice",
+        "hp_mri_data": f"{HUPC}:process_hp_mri_data",
+        "voxel_spectrum": f"{HUPC}:read_voxel_spectrum",
+        "precompute": f"{HUPC}:precompute_study",
+    },
+    jobs={"reconstruction": "hupc_epsi", "composites": "hupc_composites"},
+)
+# Clinical magnets have no slider values or datasets yet
+register_magnet("Clinical", {"proton_picture": f"{CLINICAL}:process_proton_picture"})
+register_magnet(
+    "MR Solutions",
+    {
+        "slider_values": f"{MR_SOLUTIONS}:get_num_slider_values",
+        "datasets": f"{MR_SOLUTIONS}:count_datasets",
+        "proton_picture": f"{MR_SOLUTIONS}:process_proton_picture",
+        "proton_stats": f"{MR_SOLUTIONS}:process_proton_stats",
+        "proton_slice": f"{MR_SOLUTIONS}:proton_slice",
+    },
+)
+
+
+def check_registry(resolve_targets=False):
+    """
+    Lists the baseline magnet capabilities that no longer dispatch.
+
+    Args:
+        resolve_targets (bool): Also import every registered target, which loads
+            the backend modules.
+
+    Returns:
+        list of str: One "magnet type: capability" entry per problem.
+    """
+    problems = []
+    for magnet_type, capabilities in BASELINE_CAPABILITIES.items():
+        magnet = get_magnet(magnet_type)
+        for capability in capabilities:
+            if magnet is None or not magnet.supports(capability):
+                problems.append(f"{magnet_type}: {capability} is not registered")
+    if resolve_targets:
+        for magnet in MAGNETS.values():
+            for capability in magnet.functions:
+                try:
+                    magnet.function(capability)
+                except (ImportError, AttributeError) as error:
+                    problems.append(f"{magnet.magnet_type}: {capability}: {error}")
+    return problems
+
+
+# Checked on import, which needs no backend module
+_missing = check_registry()
+if _missing:
+    raise RuntimeError(
+        "Magnet registry lost baseline capabilities: " + "; ".join(_missing)
+    )
+
+
+if __name__ == "__main__":
+    problems = check_registry(resolve_targets=True)
+    print("\n".join(problems) or "every magnet capability dispatches")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,202 @@
+"""
+Module: proton_images.py
+
+Description:
+This module renders proton DICOM slices to contrast-adjusted PNGs for every magnet backend and
+caches the encoded bytes, so scrubbing through slices on the /visualize page returns cached
+images instead of re-rendering the slice. Slices are read from the series volume loaded once
+by visualize/dicom_series.py, so no request parses a DICOM file, and contrast-adjusted by
+visualize/contrast.py. When a series is first opened, its slices are pre-rendered in the
+background at the common contrast levels, one batch per level.
+
+Functions:
+- render_proton_slice(pixels, contrast, size): Renders one slice array to PNG bytes.
+- get_proton_png(series, index, contrast, size): Cached variant of render_proton_slice.
+- prewarm_series(series, contrasts): Pre-renders a series in the background.
+- proton_png_response(series_folder, filename, data): Flask response for a proton picture request.
+- proton_stats_response(series_folder, filename): Flask response with the window statistics of a slice.
+"""
+
+import io
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, send_file
+from PIL import Image
+
+from visualize.cache import ByteLRUCache
+from visualize.contrast import contrast_slice, contrast_slices
+from visualize.dicom_series import load_series
+
+# Encoded PNGs keyed by (series folder, series version, slice index, contrast, output size)
+PROTON_PNG_CACHE = ByteLRUCache(max_bytes=64 * 1024 * 1024)
+# Contrast levels rendered ahead of time when a series is first opened
+PREWARM_CONTRASTS = (1.0, 2.0)
+PREWARM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="proton-prewarm"
+)
+# (series folder, series version) of the series already pre-warmed
+PREWARMED_SERIES = set()
+PREWARMED_SERIES_LOCK = threading.Lock()
+
+
+def render_proton_slice(pixels, contrast, size=None):
+    """
+    Renders a DICOM slice with CLAHE contrast adjustment and encodes it as PNG.
+
+    Args:
+        pixels (ndarray): Slice pixel data; not modified.
+        contrast (float): CLAHE clip limit.
+        size (tuple, optional): Output (width, height); the native size when None.
+
+    Returns:
+        bytes: The PNG-encoded image.
+    """
+    return encode_png(contrast_slice(pixels, contrast, size))
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def proton_png_key(series, index, contrast, size=None):
+    """
+    Builds the cache key of a rendered slice.
+
+    Returns:
+        tuple: (folder, series version, index, contrast, size).
+    """
+    return (
+        series.folder,
+        series.version,
+        index,
+        round(float(contrast), 3),
+        None if size is None else tuple(size),
+    )
+
+
+def get_proton_png(series, index, contrast, size=None):
+    """
+    Returns the PNG of a series slice, rendering it only on a cache miss.
+
+    Args:
+        series (DicomSeries): The loaded series.
+        index (int): Slice index in the series.
+        contrast (float): CLAHE clip limit.
+        size (tuple, optional): Output (width, height).
+
+    Returns:
+        bytes: The PNG-encoded image.
+    """
+    key = proton_png_key(series, index, contrast, size)
+    return PROTON_PNG_CACHE.get_or_create(
+        key, lambda: render_proton_slice(series.slice(index), key[3], key[4])
+    )
+
+
+def prewarm_series(series, contrasts=PREWARM_CONTRASTS):
+    """
+    Renders every slice of a series at the given contrast levels in the background.
+
+    Each series version is only pre-warmed once per process, so a series whose slices
+    changed is pre-warmed again; slices already cached are skipped.
+
+    Args:
+        series (DicomSeries): The loaded series.
+        contrasts (tuple of float): Contrast levels to render.
+    """
+    if series.volume is None:
+        # A series streamed from its files is too large to pre-render
+        return
+    key = (series.folder, series.version)
+    with PREWARMED_SERIES_LOCK:
+        if key in PREWARMED_SERIES:
+            return
+        PREWARMED_SERIES.add(key)
+
+    def render_series():
+        try:
+            for contrast in contrasts:
+                keys = [
+                    proton_png_key(series, index, contrast)
+                    for index in range(len(series))
+                ]
+                missing = [
+                    index
+                    for index, key in enumerate(keys)
+                    if key not in PROTON_PNG_CACHE
+                ]
+                if not missing:
+                    continue
+                images = contrast_slices(series.volume[missing], keys[0][3])
+                for index, image in zip(missing, images):
+                    PROTON_PNG_CACHE.put(keys[index], encode_png(image))
+        except Exception:
+            traceback.print_exc()
+
+    PREWARM_EXECUTOR.submit(render_series)
+
+
+def proton_png_response(series_folder, filename, data):
+    """
+    Answers a /get_proton_picture request for one DICOM slice.
+
+    Args:
+        series_folder (str): Folder of the series, pre-warmed in the background
+            the first time it is requested.
+        filename (str): File name of the requested slice.
+        data (dict): Request body; "contrast" and optional "width"/"height".
+
+    Returns:
+        Flask Response: Image file as PNG or an error message in JSON format.
+    """
+    try:
+        series = load_series(series_folder)
+        index = series.index_of(filename)
+        if index is None:
+            return jsonify({"error": "DICOM file not found"}), 404
+
+        contrast = data.get("contrast", 1)
+        size = None
+        if data.get("width") and data.get("height"):
+            size = (int(data["width"]), int(data["height"]))
+
+        png = get_proton_png(series, index, contrast, size)
+        prewarm_series(series)
+        return send_file(io.BytesIO(png), mimetype="image/png")
+    except FileNotFoundError:
+        return jsonify({"error": "DICOM file not found"}), 404
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+def proton_stats_response(series_folder, filename):
+    """
+    Answers a /get_proton_stats request with the window statistics of one slice.
+
+    Args:
+        series_folder (str): Folder of the series.
+        filename (str): File name of the requested slice.
+
+    Returns:
+        Flask Response: JSON with the slice index, shape and min/max/mean/std,
+        or an error message.
+    """
+    try:
+        series = load_series(series_folder)
+        index = series.index_of(filename)
+        if index is None:
+            return jsonify({"error": "DICOM file not found"}), 404
+        stats = series.window_stats(index)
+        stats["index"] = index
+        stats["shape"] = list(series.shape[1:])
+        return jsonify(stats)
+    except FileNotFoundError:
+        return jsonify({"error": "DICOM file not found"}), 404
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
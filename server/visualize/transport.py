@@ -0,0 +1,96 @@
+"""
+Module: transport.py
+
+Description:
+This module encodes numeric visualization payloads as a compact binary response that the frontend
+can wrap in Float32Array views without parsing, as an alternative to nested JSON lists.
+
+Binary layout (all integers little-endian):
+- uint32: length N of the JSON header in bytes (a multiple of 4)
+- N bytes: UTF-8 JSON header with the scalar fields and an "arrays" list of
+  {"name", "shape", "offset"} descriptors, space-padded to a multiple of 4 bytes
+- float32 buffers in descriptor order; each "offset" is relative to byte 4 + N
+
+Functions:
+- wants_binary(req): Whether the client asked for the binary format.
+- encode_float32_arrays(header, arrays): Encodes scalars and arrays in the binary layout.
+- binary_response(header, arrays, etag): Flask response carrying the encoded payload.
+"""
+
+import json
+import struct
+
+import numpy as np
+from flask import Response, request
+
+BINARY_MIMETYPE = "application/octet-stream"
+
+
+def wants_binary(req):
+    """
+    Negotiates the response format from the `format` query flag or the Accept header.
+
+    Args:
+        req (flask.Request): The incoming request.
+
+    Returns:
+        bool: True when the client asked for the binary format.
+    """
+    requested = req.args.get("format")
+    if requested is not None:
+        return requested == "binary"
+    best = req.accept_mimetypes.best_match(["application/json", BINARY_MIMETYPE])
+    return best == BINARY_MIMETYPE
+
+
+def encode_float32_arrays(header, arrays):
+    """
+    Encodes scalar fields and arrays in the binary layout described above.
+
+    Args:
+        header (dict): JSON-serializable scalar fields.
+        arrays (dict): Name -> array; converted to little-endian float32.
+
+    Returns:
+        bytes: The encoded payload.
+    """
+    descriptors = []
+    buffers = []
+    offset = 0
+    for name, array in arrays.items():
+        data = np.ascontiguousarray(array, dtype="<f4")
+        descriptors.append({"name": name, "shape": list(data.shape), "offset": offset})
+        buffers.append(data)
+        offset += data.nbytes
+
+    encoded_header = json.dumps(dict(header, arrays=descriptors)).encode("utf-8")
+    encoded_header += b" " * (-len(encoded_header) % 4)
+    return b"".join(
+        [struct.pack("<I", len(encoded_header)), encoded_header]
+        + [memoryview(data).cast("B") for data in buffers]
+    )
+
+
+def binary_response(header, arrays, etag=None):
+    """
+    Builds a Flask response carrying `encode_float32_arrays(header, arrays)`.
+
+    When an entity tag is given, the response is made conditional on the current
+    request: If-None-Match yields 304 Not Modified and Range requests are honored.
+
+    Args:
+        header (dict): JSON-serializable scalar fields.
+        arrays (dict): Name -> array.
+        etag (str, optional): Strong entity tag identifying the payload.
+
+    Returns:
+        Flask Response: application/octet-stream response.
+    """
+    payload = encode_float32_arrays(header, arrays)
+    response = Response(payload, mimetype=BINARY_MIMETYPE)
+    if etag is not None:
+        response.set_etag(etag)
+        response.make_conditional(
+            request, accept_ranges=True, complete_length=len(payload)
+        )
+    return response
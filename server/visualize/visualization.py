@@ -1,17 +1,12 @@
-from flask import Flask, jsonify, request, Blueprint
+from flask import Flask, jsonify, request, Blueprint, Response, send_file
 from flask_cors import CORS
-import numpy as np
 
-# from magnets import hupc_processing, clinical_processing, mr_solutions_processing
-from visualize.magnets import (
-    hupc_processing,
-    clinical_processing,
-    mr_solutions_processing,
-)
+# Magnet modules are looked up in the registry and imported on first use
+from visualize.magnets.registry import MAGNETS, get_magnet
+from visualize import imaging, jobs, transport
 import os
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import cv2
 
 bp = Blueprint("visualization", __name__)
 # Apply CORS to the blueprint
@@ -23,6 +18,42 @@ from flask import Flask, request, jsonify
 UPLOAD_FOLDER = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project4 HP MRI Web Application/hp-mri-web-application-yoonbenjamin/data"
 app = Flask(__name__)
 CORS(app)
+# Reconstructions submitted to /jobs run on worker processes; set JOBS_DATABASE
+# to keep the job records in SQLite instead of in this process
+JOBS = jobs.JobRunner(
+    jobs.SQLiteJobQueue(os.environ["JOBS_DATABASE"])
+    if "JOBS_DATABASE" in os.environ
+    else None
+)
+# Set PRECOMPUTE_ON_INGEST to reconstruct HUPC datasets as they appear in the study folder
+if os.environ.get("PRECOMPUTE_ON_INGEST"):
+    from visualize.magnets.hupc_processing import StudyWatcher
+
+    STUDY_WATCHER = StudyWatcher(JOBS)
+    STUDY_WATCHER.start()
+
+
+def invalid_magnet():
+    return jsonify({"error": "Invalid magnet type"}), 400
+
+
+def unsupported(magnet, capability):
+    return (
+        jsonify({"error": f"{magnet.magnet_type} magnets do not support {capability}"}),
+        400,
+    )
+
+
+@bp.route("/magnets", methods=["GET"])
+def list_magnets():
+    """
+    API endpoint listing the registered magnet types with their capabilities
+    and job kinds (see visualize/magnets/registry.py).
+
+    Returns:
+        JSON: {"magnets": [{"magnetType", "capabilities", "jobs"}, ...]}.
+    """
+    return jsonify({"magnets": [magnet.to_dict() for magnet in MAGNETS.values()]})
 
 
 @bp.route("/get_num_slider_values/<magnet_type>", methods=["GET"])
@@ -36,14 +67,12 @@ def fetch_num_slider_values(magnet_type):
     Returns:
         JSON: Contains the number of slider values.
     """
-    if magnet_type == "HUPC":
-        num_values = hupc_processing.get_num_slider_values()
-    elif magnet_type == "Clinical":
-        num_values = 0
-    elif magnet_type == "MR Solutions":
-        num_values = mr_solutions_processing.get_num_slider_values()
-    else:
-        return jsonify({"error": "Invalid magnet type"}), 400
+    magnet = get_magnet(magnet_type)
+    if magnet is None:
+        return invalid_magnet()
+    num_values = 0
+    if magnet.supports("slider_values"):
+        num_values = magnet.function("slider_values")()
 
     return jsonify({"numSliderValues": num_values})
 
@@ -59,14 +88,12 @@ def fetch_count_datasets(magnet_type):
     Returns:
         JSON: Contains the number of datasets.
     """
-    if magnet_type == "HUPC":
-        num_values = hupc_processing.count_datasets()
-    elif magnet_type == "Clinical":
-        num_values = 0
-    elif magnet_type == "MR Solutions":
-        num_values = mr_solutions_processing.count_datasets()
-    else:
-        return jsonify({"error": "Invalid magnet type"}), 400
+    magnet = get_magnet(magnet_type)
+    if magnet is None:
+        return invalid_magnet()
+    num_values = 0
+    if magnet.supports("datasets"):
+        num_values = magnet.function("datasets")()
 
     return jsonify({"numDatasets": num_values})
 
@@ -89,16 +116,33 @@ def get_proton_picture(slider_value: int):
     data = request.get_json()
     magnet_type = data.get("magnetType", "HUPC")  # Default to HUPC if not specified
 
-    if magnet_type == "HUPC":
-        result = hupc_processing.process_proton_picture(slider_value, data)
-    elif magnet_type == "Clinical":
-        result = clinical_processing.process_proton_picture(slider_value, data)
-    elif magnet_type == "MR Solutions":
-        result = mr_solutions_processing.process_proton_picture(slider_value, data)
-    else:
-        return jsonify({"error": "Invalid magnet type"}), 400
+    magnet = get_magnet(magnet_type)
+    if magnet is None:
+        return invalid_magnet()
+    if not magnet.supports("proton_picture"):
+        return unsupported(magnet, "proton images")
+
+    return magnet.function("proton_picture")(slider_value, data)
 
-    return result
+
+@bp.route("/get_proton_stats/<int:slider_value>", methods=["GET"])
+def get_proton_stats(slider_value: int):
+    """
+    Return the window statistics (min, max, mean, std) of a proton slice, read from
+    the cached series volume instead of the DICOM file.
+
+    Query Parameters:
+        magnetType (str): The magnet type currently selected; defaults to HUPC.
+
+    Returns:
+        json: The slice statistics or an error message.
+    """
+    magnet_type = request.args.get("magnetType", "HUPC")
+
+    magnet = get_magnet(magnet_type)
+    if magnet is None or not magnet.supports("proton_stats"):
+        return invalid_magnet()
+    return magnet.function("proton_stats")(slider_value)
 
 
 @bp.route("/get_hp_mri_data/<int:hp_mri_dataset>", methods=["POST"])
@@ -106,6 +150,9 @@ def get_hp_mri_data(hp_mri_dataset):
     """
     Retrieve and return HP MRI data for a specified dataset ID with dynamic thresholding for data visualization.
 
+    Send `?format=binary` or `Accept: application/octet-stream` to receive the arrays
+    as float32 buffers (see visualize/transport.py) instead of nested JSON lists.
+
     Parameters:
         hp_mri_dataset (int): The dataset ID for which to fetch HP MRI data.
 
@@ -121,16 +168,48 @@ def get_hp_mri_data(hp_mri_dataset):
         "magnetType", "HUPC"
     )  # Default to HUPC if not specified
 
-    if magnet_type == "HUPC":
-        result = hupc_processing.process_hp_mri_data(hp_mri_dataset, threshold)
-    elif magnet_type == "Clinical":
-        result = 0
-    elif magnet_type == "MR Solutions":
-        result = 0
-    else:
-        return jsonify({"error": "Invalid magnet type"}), 400
+    binary = transport.wants_binary(request)
+
+    magnet = get_magnet(magnet_type)
+    if magnet is None:
+        return invalid_magnet()
+    if not magnet.supports("hp_mri_data"):
+        return unsupported(magnet, "HP MRI data")
+
+    return magnet.function("hp_mri_data")(hp_mri_dataset, threshold, binary=binary)
+
+
+@bp.route(
+    "/get_hp_mri_voxel/<int:hp_mri_dataset>/<int:row>/<int:column>", methods=["GET"]
+)
+def get_hp_mri_voxel(hp_mri_dataset, row, column):
+    """
+    Retrieve the normalized spectra of one voxel of an HP MRI dataset.
+
+    Precomputed datasets are read from their chunked artifact, so only the
+    chunks holding the voxel are read from disk.
+
+    Parameters:
+        hp_mri_dataset (int): The dataset ID.
+        row (int): Grid row.
+        column (int): Grid column.
 
-    return result
+    Returns:
+        json: {"spectrum": [[...], ...]} shaped (points, pictures), or the
+        binary float32 format when requested (see visualize/transport.py).
+    """
+    magnet = get_magnet(request.args.get("magnetType", "HUPC"))
+    if magnet is None or not magnet.supports("voxel_spectrum"):
+        return invalid_magnet()
+    try:
+        spectrum = magnet.function("voxel_spectrum")(hp_mri_dataset, row, column)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except IndexError as e:
+        return jsonify({"error": str(e)}), 400
+    if transport.wants_binary(request):
+        return transport.binary_response({}, {"spectrum": spectrum})
+    return jsonify({"spectrum": spectrum.tolist()})
 
 
 @bp.route("/visualize-upload", methods=["POST"])
@@ -158,38 +237,30 @@ def get_imaging_metadata():
     """
     Retrieve metadata for imaging-mode MRI dataset.
 
+    Only the .npy header and the persisted summary stats are read (see
+    visualize/imaging.py). When the stats of the current file are not computed
+    yet, they are null, "statsPending" is true and the "imaging_stats" job that
+    computes them is submitted; its id is returned as "statsJobId".
+
     Returns:
-        json: JSON containing the number of rows, columns, metabolites, and image slices.
+        json: JSON containing the number of rows, columns, metabolites, and image slices,
+        the dtype, per-metabolite min/max/mean ("metaboliteStats") and the global min/max.
 
     Author: Ben Yoon
     Date: 2025-03-04
-    Version: 2.0.1
+    Version: 2.0.2
     """
     try:
-        data_path = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project5 HP-MRI/untitled folder/mock_mri_heatmap_data/mock_mri_heatmap_varied_trend.npy"
-        data = np.load(
-            data_path
-        )  # Expected shape: [rows, columns, metabolites, images]
-
-        if data.ndim != 4:
-            return jsonify({"error": "Imaging data must be 4-dimensional"}), 400
-
-        rows, cols, num_metabolites, num_images = data.shape
-
-        return (
-            jsonify(
-                {
-                    "rows": rows,
-                    "columns": cols,
-                    "numMetabolites": num_metabolites,
-                    "numImages": num_images,
-                }
-            ),
-            200,
-        )
+        metadata = imaging.read_imaging_metadata()
+        if metadata["statsPending"]:
+            job = JOBS.submit("imaging_stats", {"path": imaging.IMAGING_DATA_PATH})
+            metadata = dict(metadata, statsJobId=job.id)
+        return jsonify(metadata), 200
 
     except FileNotFoundError:
         return jsonify({"error": "Mock imaging data file not found."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -199,19 +270,26 @@ def get_imaging_matrix():
     """
     Retrieve the full 4D mock MRI imaging matrix (rows x cols x metabolites x images).
 
+    Prefer the /get_imaging_image, /get_imaging_voxel and /get_imaging_downsampled
+    endpoints, which only read and send the requested chunk.
+
     Returns:
-        json: JSON containing a nested list representing the 4D matrix.
+        json: JSON containing a nested list representing the 4D matrix, or the
+        binary float32 format when requested (see visualize/transport.py).
 
     Author: Ben Yoon
     Date: 2025-03-04
     Version: 2.0.1
     """
     try:
-        data_path = "/Users/benjaminyoon/Desktop/PIGI folder/Projects/Project5 HP-MRI/untitled folder/mock_mri_heatmap_data/mock_mri_heatmap_varied_trend.npy"
-        data = np.load(data_path)
+        data = imaging.open_imaging_matrix()
 
-        if data.ndim != 4:
-            return jsonify({"error": "Imaging data must be 4-dimensional"}), 400
+        if transport.wants_binary(request):
+            etag = imaging.imaging_etag(imaging.IMAGING_DATA_PATH, "matrix")
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+            return transport.binary_response({}, {"matrix": data}, etag=etag)
 
         # Convert to list (costly for large data, but fine for dev)
         matrix = data.tolist()
@@ -220,5 +298,367 @@ def get_imaging_matrix():
 
     except FileNotFoundError:
         return jsonify({"error": "Mock imaging data file not found."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+def not_modified(etag):
+    """
+    Answers a conditional request whose If-None-Match already holds the chunk.
+
+    Args:
+        etag (str): Entity tag of the requested chunk.
+
+    Returns:
+        Flask Response or None: 304 Not Modified, or None when the chunk must be sent.
+    """
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def imaging_chunk(name, read, *args):
+    """
+    Reads a chunk of the imaging matrix and wraps it in a binary response.
+
+    The matrix is only touched when the client does not already hold the chunk.
+
+    Args:
+        name (str): Chunk kind; the name of the returned array and part of the ETag.
+        read (callable): Reads the chunk from the memory-mapped matrix.
+        *args: Arguments passed to `read` after the matrix; also part of the ETag.
+
+    Returns:
+        Flask Response: Binary chunk, 304, or a JSON error.
+    """
+    try:
+        etag = imaging.imaging_etag(imaging.IMAGING_DATA_PATH, name, *args)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        data = imaging.open_imaging_matrix()
+        chunk = read(data, *args)
+        header = {"matrixShape": list(data.shape)}
+        return transport.binary_response(header, {name: chunk}, etag=etag)
+    except FileNotFoundError:
+        return jsonify({"error": "Mock imaging data file not found."}), 404
+    except (IndexError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/get_imaging_image/<int:metabolite>/<int:image>", methods=["GET"])
+def get_imaging_image(metabolite, image):
+    """
+    Retrieve one [rows, columns] image of one metabolite from the imaging matrix.
+
+    Parameters:
+        metabolite (int): Metabolite index.
+        image (int): Image (time point) index.
+
+    Returns:
+        Flask Response: Binary float32 payload with an "image" array.
+    """
+    return imaging_chunk("image", imaging.read_image, metabolite, image)
+
+
+@bp.route("/get_imaging_voxel/<int:row>/<int:column>", methods=["GET"])
+def get_imaging_voxel(row, column):
+    """
+    Retrieve the time series of one voxel of the imaging matrix.
+
+    Parameters:
+        row (int): Row index.
+        column (int): Column index.
+        metabolite (query, optional): Restrict the series to one metabolite.
+
+    Returns:
+        Flask Response: Binary float32 payload with a "voxel" array shaped
+        [metabolites, images], or [images] for one metabolite.
+    """
+    metabolite = request.args.get("metabolite", default=None, type=int)
+    return imaging_chunk("voxel", imaging.read_voxel, row, column, metabolite)
+
+
+@bp.route("/get_imaging_downsampled/<int:step>", methods=["GET"])
+def get_imaging_downsampled(step):
+    """
+    Retrieve a strided preview of the imaging matrix.
+
+    Parameters:
+        step (int): Stride applied to the row, column and image axes.
+        metabolite (query, optional): Keep only this metabolite.
+        image (query, optional): Keep only this image instead of striding images.
+
+    Returns:
+        Flask Response: Binary float32 payload with a "downsampled" array.
+    """
+    metabolite = request.args.get("metabolite", default=None, type=int)
+    image = request.args.get("image", default=None, type=int)
+    return imaging_chunk(
+        "downsampled", imaging.read_downsampled, step, metabolite, image
+    )
+
+
+@bp.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Queue the reconstruction of an HP MRI dataset on the worker processes.
+
+    Body:
+        magnetType (str): Magnet type of the dataset (default "HUPC").
+        dataset (int): Dataset ID, as in /get_hp_mri_data.
+        threshold (float): Display threshold (default 0.2).
+
+    Returns:
+        json: The job (202), with "jobId" to poll /jobs/<id>; a job whose
+        result is already cached is returned completed.
+    """
+    data = request.get_json(silent=True) or {}
+    magnet = get_magnet(data.get("magnetType", "HUPC"))
+    if magnet is None or "reconstruction" not in magnet.jobs:
+        return invalid_magnet()
+    try:
+        params = {
+            "epsi_value": int(data["dataset"]),
+            "threshold": float(data.get("threshold", 0.2)),
+        }
+        job = JOBS.submit(magnet.jobs["reconstruction"], params)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid job request: {e}"}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route("/precompute/<magnet_type>", methods=["POST"])
+def precompute_study(magnet_type):
+    """
+    Reconstruct every EPSI dataset of the study ahead of time on the worker
+    processes, so /get_hp_mri_data serves the stored artifacts.
+
+    Parameters:
+        magnet_type: The magnet type of the study.
+
+    Returns:
+        json: {"jobs": [...]} (202), one job per dataset; datasets already
+        precomputed are returned completed.
+    """
+    magnet = get_magnet(magnet_type)
+    if magnet is None or not magnet.supports("precompute"):
+        return invalid_magnet()
+    try:
+        submitted = magnet.function("precompute")(JOBS)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"jobs": [job.to_dict() for job in submitted]}), 202
+
+
+def optional_ints(values):
+    return None if values is None else [int(value) for value in values]
+
+
+@bp.route("/exports/composites", methods=["POST"])
+def export_composites():
+    """
+    Render the proton + HP MRI overlay of every slice and dataset of a study
+    on the worker processes, into one zip of images or multi-page TIFF.
+
+    Body:
+        magnetType (str): Magnet type of the study (default "HUPC").
+        slices (list of int, optional): Proton slider values; all by default.
+        datasets (list of int, optional): Dataset IDs; all by default.
+        contrast (float): Proton contrast (default 1).
+        threshold (float): Display threshold (default 0.2).
+        width, height (int, optional): Frame size; 512 pixels wide by default.
+        format (str): "zip" (default) or "tiff".
+        imageFormat (str): "png" (default) or "tiff", for zip exports.
+        heatmap (dict, optional): "metabolite", "colorScale" (Hot, Jet or
+            B&W) and "alpha" of an imaging-matrix heatmap overlay.
+        grid, spectra (bool): Draw the voxel grid and the spectra (default true).
+
+    Returns:
+        json: The job (202); download the archive from /jobs/<id>/download
+        once it completes.
+    """
+    # The image stack (OpenCV, Pillow) is imported by the first export, not at startup
+    from visualize import composites
+
+    data = request.get_json(silent=True) or {}
+    magnet = get_magnet(data.get("magnetType", "HUPC"))
+    if magnet is None or "composites" not in magnet.jobs:
+        return invalid_magnet()
+    try:
+        size = None
+        if data.get("width") and data.get("height"):
+            size = [int(data["width"]), int(data["height"])]
+        heatmap = data.get("heatmap")
+        if heatmap is not None:
+            heatmap = {
+                "metabolite": int(heatmap["metabolite"]),
+                "color_scale": heatmap.get("colorScale", "Hot"),
+                "alpha": float(heatmap.get("alpha", 0.5)),
+            }
+            composites.colormap_lut(heatmap["color_scale"])
+        params = {
+            "slices": optional_ints(data.get("slices")),
+            "datasets": optional_ints(data.get("datasets")),
+            "contrast": float(data.get("contrast", 1)),
+            "threshold": float(data.get("threshold", 0.2)),
+            "size": size,
+            "output_format": data.get("format", "zip"),
+            "image_format": data.get("imageFormat", "png"),
+            "heatmap": heatmap,
+            "grid": bool(data.get("grid", True)),
+            "spectra": bool(data.get("spectra", True)),
+        }
+        if params["output_format"] not in composites.OUTPUT_FORMATS:
+            raise ValueError(f"unknown format '{params['output_format']}'")
+        if params["image_format"] not in composites.IMAGE_FORMATS:
+            raise ValueError(f"unknown image format '{params['image_format']}'")
+        job = JOBS.submit(magnet.jobs["composites"], params)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid export request: {e}"}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route("/exports/animation", methods=["POST"])
+def export_animation():
+    """
+    Render the time series of one metabolite of the imaging matrix as an
+    animated GIF or MP4 on the worker processes.
+
+    Body:
+        metabolite (int): Metabolite index.
+        format (str): "gif" (default) or "mp4".
+        colorScale (str): Hot (default), Jet or B&W.
+        fps (float): Frames per second (default 10).
+        width, height (int, optional): Output size; 512 pixels wide by default.
+        underlay (dict, optional): "slice" (proton slider value), "magnetType"
+            (default "HUPC") and "contrast" of a proton slice under the heatmap.
+        alpha (float): Heatmap opacity over the underlay (default 0.6).
+
+    Returns:
+        json: The job (202); download the animation from /jobs/<id>/download
+        once it completes.
+    """
+    from visualize import animations, composites
+
+    data = request.get_json(silent=True) or {}
+    try:
+        size = None
+        if data.get("width") and data.get("height"):
+            size = [int(data["width"]), int(data["height"])]
+        underlay = data.get("underlay")
+        if underlay is not None:
+            magnet = get_magnet(underlay.get("magnetType", "HUPC"))
+            if magnet is None or not magnet.supports("proton_slice"):
+                return invalid_magnet()
+            folder, filename = magnet.function("proton_slice")(int(underlay["slice"]))
+            underlay = {
+                "folder": folder,
+                "filename": filename,
+                "contrast": float(underlay.get("contrast", 1)),
+            }
+        params = {
+            "metabolite": int(data["metabolite"]),
+            "output_format": data.get("format", "gif"),
+            "color_scale": data.get("colorScale", "Hot"),
+            "alpha": float(data.get("alpha", 0.6)),
+            "fps": float(data.get("fps", 10)),
+            "size": size,
+            "underlay": underlay,
+        }
+        if params["output_format"] not in animations.OUTPUT_FORMATS:
+            raise ValueError(f"unknown format '{params['output_format']}'")
+        if not params["fps"] > 0:
+            raise ValueError("fps must be positive")
+        composites.colormap_lut(params["color_scale"])
+        job = JOBS.submit("imaging_animation", params)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid export request: {e}"}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Report the status of a job: queued, running, completed or failed.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    """
+    Retrieve the result of a completed job in the /get_hp_mri_data format,
+    as JSON or, when requested, binary float32 buffers.
+
+    Returns:
+        Flask Response: The result, 409 while the job is not finished, or
+        500 with the error of a failed job.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error}), 500
+    if job.status != "completed":
+        return jsonify({"error": "Job not finished", "status": job.status}), 409
+    # Results are immutable, so the cache key and the format identify the payload
+    binary = transport.wants_binary(request)
+    etag = f"{job.key}-{'bin' if binary else 'json'}"
+    response = not_modified(etag)
+    if response is None:
+        metadata, arrays = JOBS.result(job)
+        if binary:
+            response = transport.binary_response(metadata, arrays, etag=etag)
+        else:
+            payload = dict(metadata)
+            for name, array in arrays.items():
+                payload[name] = array.tolist()
+            response = jsonify(payload)
+            response.set_etag(etag)
+    response.vary.add("Accept")
+    return response
+
+
+@bp.route("/jobs/<job_id>/download", methods=["GET"])
+def download_job_output(job_id):
+    """
+    Download the file written by a completed export job.
+
+    Returns:
+        Flask Response: The file as an attachment, 409 while the job is not
+        finished, 500 with the error of a failed job, or 404 when the job
+        has no file.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error}), 500
+    if job.status != "completed":
+        return jsonify({"error": "Job not finished", "status": job.status}), 409
+    metadata, _ = JOBS.result(job)
+    if "path" not in metadata or not os.path.exists(metadata["path"]):
+        return jsonify({"error": "Job has no downloadable output"}), 404
+    return send_file(
+        metadata["path"],
+        mimetype=metadata["mimetype"],
+        as_attachment=True,
+        download_name=metadata["filename"],
+        etag=job.key,
+    )